@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Balance Check - Running-balance continuity of imported bank statements
+Every row must take the previous balance to its own: balance[i-1] +/- amount[i]
+== balance[i]. The check runs over the whole statement as NumPy arrays, so a
+million rows take a fraction of a second. Breaks usually mean a parse error
+or a missing page; rows without a direction get one from the balance move.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+BALANCE_TOLERANCE = float(os.getenv("BALANCE_TOLERANCE", "0.01"))
+BALANCE_REPORT_BREAKS = 50
+
+DIRECTIONS = {"credit": 1, "debit": -1}
+
+
+def _signs(transaction_types: Sequence[Optional[str]]) -> np.ndarray:
+    """+1 credit, -1 debit, 0 unknown"""
+    return np.fromiter((DIRECTIONS.get(kind or "", 0) for kind in transaction_types), dtype=np.int8,
+                       count=len(transaction_types))
+
+
+def _fits(amounts: np.ndarray, balances: np.ndarray, tolerance: float):
+    """Per row from the second on: does the balance move fit a credit / a debit, and was it checkable"""
+    moves = np.diff(balances)
+    checkable = ~np.isnan(moves)
+    fits_credit = np.abs(moves - amounts[1:]) <= tolerance
+    fits_debit = np.abs(moves + amounts[1:]) <= tolerance
+    return moves, checkable, fits_credit, fits_debit
+
+
+def verify_running_balance(
+    amounts: Sequence[float],
+    balances: Sequence[Optional[float]],
+    transaction_types: Sequence[Optional[str]],
+    tolerance: float = BALANCE_TOLERANCE
+) -> Dict[str, Any]:
+    """Continuity report for rows in statement order (either date direction)
+
+    Returns the status ("ok", "breaks" or "unchecked"), the counts, the row
+    order the balances follow, the first breaks with the unexplained amount,
+    and ``inferred``: row index -> "debit"/"credit" for rows that had no
+    direction and whose balance move fits exactly one.
+    """
+    amount = np.abs(np.asarray(amounts, dtype=np.float64))
+    balance = np.asarray([np.nan if value is None else value for value in balances], dtype=np.float64)
+    signs = _signs(transaction_types)
+    rows = len(amount)
+    if rows < 2 or np.count_nonzero(~np.isnan(balance)) < 2:
+        return {"status": "unchecked", "rows": rows, "checked": 0, "breaks": 0, "order": None,
+                "direction_mismatches": 0, "inferred": {}, "first_breaks": []}
+
+    # Exports run oldest-first or newest-first; the balances follow whichever fits more rows
+    order = "ascending"
+    moves, checkable, fits_credit, fits_debit = _fits(amount, balance, tolerance)
+    forward = np.count_nonzero(checkable & (fits_credit | fits_debit))
+    r_moves, r_checkable, r_credit, r_debit = _fits(amount[::-1], balance[::-1], tolerance)
+    if np.count_nonzero(r_checkable & (r_credit | r_debit)) > forward:
+        order = "descending"
+        amount, balance, signs = amount[::-1], balance[::-1], signs[::-1]
+        moves, checkable, fits_credit, fits_debit = r_moves, r_checkable, r_credit, r_debit
+
+    sign = signs[1:]
+    fits_stated = np.where(sign > 0, fits_credit, np.where(sign < 0, fits_debit, fits_credit | fits_debit))
+    breaks = checkable & ~fits_stated
+    # The stated direction is wrong but the amount is right: a sign error, not a gap
+    mismatched = breaks & (sign != 0) & (fits_credit | fits_debit)
+    guessable = checkable & (sign == 0) & (fits_credit != fits_debit)
+
+    def original(index: np.ndarray) -> np.ndarray:
+        # Positions in the arrays above are one past the row pair's first row
+        index = index + 1
+        return rows - 1 - index if order == "descending" else index
+
+    inferred_rows = np.flatnonzero(guessable)
+    inferred = {
+        int(row): "credit" if credit else "debit"
+        for row, credit in zip(original(inferred_rows), fits_credit[inferred_rows])
+    }
+    break_rows = np.flatnonzero(breaks)
+    first_breaks: List[Dict[str, Any]] = []
+    for position, row in zip(break_rows[:BALANCE_REPORT_BREAKS], original(break_rows[:BALANCE_REPORT_BREAKS])):
+        expected = int(sign[position]) * amount[position + 1]
+        first_breaks.append({
+            "row": int(row),
+            "previous_balance": float(balance[position]),
+            "balance": float(balance[position + 1]),
+            "amount": float(amount[position + 1]),
+            "unexplained": round(float(moves[position] - expected), 2) if sign[position] else None,
+            "kind": "direction" if mismatched[position] else "gap",
+        })
+    return {
+        "status": "breaks" if break_rows.size else "ok",
+        "rows": rows,
+        "checked": int(np.count_nonzero(checkable)),
+        "breaks": int(break_rows.size),
+        "order": order,
+        "direction_mismatches": int(np.count_nonzero(mismatched)),
+        "inferred": inferred,
+        "first_breaks": first_breaks,
+    }
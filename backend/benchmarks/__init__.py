@@ -0,0 +1,4 @@
+"""
+Benchmarks for the S(ai)m Jr backend
+Run from the backend directory, e.g. ``python -m benchmarks.bench_ai_workflows``
+"""
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+AI Workflow Benchmark - COA generation and bulk categorization against FakeOpenAI
+Reports p50/p95/p99 latency, throughput and token counts at several concurrency levels;
+categorization runs both one call per transaction and batched calls
+
+    python -m benchmarks.bench_ai_workflows --requests 50 --concurrency 1,4,16
+"""
+
+import argparse
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from ai_chart_generator import AI_TOKENS, GENERATION_MODES, TIER_MODELS, AIChartGenerator
+from benchmarks.stats import latency_summary, print_table, write_json
+from fake_openai import FakeOpenAI, LatencyProfile
+from micro_batcher import CATEGORIZE_BATCH_MAX
+
+TEST_PROFILE = {
+    "company_name": "Test Tech Company",
+    "nature_of_business": "Software Development",
+    "industry": "Technology",
+    "location": "India",
+    "company_type": "Private Limited",
+    "reporting_framework": "Ind AS",
+    "statutory_compliances": ["GST", "TDS", "PF", "ESI"],
+}
+
+NARRATIONS = [
+    "Office supplies purchase",
+    "UPI/CR/Salary October/ACME PVT LTD",
+    "NEFT-Rent for premises-Landlord",
+    "Electricity bill payment",
+    "Fuel station card swipe",
+    "Marketing campaign - social media",
+]
+
+
+def run_case(
+    call: Callable[[int], Dict[str, Any]], requests: int, concurrency: int
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Run ``call`` ``requests`` times on ``concurrency`` threads, timing each call"""
+    latencies: List[float] = []
+    results: List[Dict[str, Any]] = []
+
+    def timed(index: int) -> None:
+        started = time.perf_counter()
+        result = call(index)
+        latencies.append(time.perf_counter() - started)
+        results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    return latency_summary(latencies, time.perf_counter() - started), results
+
+
+def step_tokens(step: str) -> Dict[str, float]:
+    """Prompt and completion tokens counted so far for ``step``, across every tier's model"""
+    return {
+        kind: sum(AI_TOKENS.value(step=step, model=model, kind=kind) for model in set(TIER_MODELS.values()))
+        for kind in ("prompt", "completion")
+    }
+
+
+def bench_coa(generator: AIChartGenerator, mode: str, requests: int, concurrency: int) -> Dict:
+    summary, results = run_case(
+        lambda _: generator.generate_ai_chart_of_accounts(**TEST_PROFILE, generation_mode=mode),
+        requests,
+        concurrency,
+    )
+    totals = [result["metadata"].get("token_usage", {}).get("total", {}) for result in results]
+    # Steps fall back on their own and the workflow still reports success, so count them per step
+    step_fallbacks: Counter = Counter()
+    for result in results:
+        step_fallbacks.update(result["metadata"].get("deadline", {}).get("fallback_steps", {}).keys())
+    summary.update({
+        "case": f"coa:{mode}",
+        "concurrency": concurrency,
+        "fallback_rate": round(
+            sum(
+                result["status"] != "success"
+                or bool(result["metadata"].get("deadline", {}).get("fallback_steps"))
+                for result in results
+            ) / len(results), 3
+        ),
+        "step_fallback_rates": {
+            step: round(count / len(results), 3) for step, count in sorted(step_fallbacks.items())
+        },
+        "prompt_tokens": sum(total.get("prompt_tokens", 0) for total in totals) // len(results),
+        "completion_tokens": sum(total.get("completion_tokens", 0) for total in totals)
+        // len(results),
+    })
+    return summary
+
+
+def bench_categorization(generator: AIChartGenerator, requests: int, concurrency: int) -> Dict:
+    before = step_tokens("categorization")
+    summary, results = run_case(
+        lambda index: generator.categorize_transaction_ai(
+            NARRATIONS[index % len(NARRATIONS)], 1000.0 + index, "expense"
+        ),
+        requests,
+        concurrency,
+    )
+    after = step_tokens("categorization")
+    summary.update({
+        "case": "categorize",
+        "concurrency": concurrency,
+        "transactions_per_s": summary["throughput_per_s"],
+        "fallback_rate": round(
+            sum(result["method"] != "ai_categorization" for result in results) / len(results), 3
+        ),
+        # Per transaction, so the per-item and batched cases compare directly
+        "prompt_tokens": int((after["prompt"] - before["prompt"]) / requests),
+        "completion_tokens": int((after["completion"] - before["completion"]) / requests),
+    })
+    return summary
+
+
+def bench_categorization_batched(
+    generator: AIChartGenerator, transactions: int, batch_size: int, concurrency: int
+) -> Dict:
+    calls = max(1, transactions // batch_size)
+    before = step_tokens("categorization_batch")
+    summary, batches = run_case(
+        lambda index: generator.categorize_transactions_ai([
+            (NARRATIONS[(index * batch_size + offset) % len(NARRATIONS)], 1000.0 + offset, "expense")
+            for offset in range(batch_size)
+        ]),
+        calls,
+        concurrency,
+    )
+    after = step_tokens("categorization_batch")
+    results = [result for batch in batches for result in batch]
+    summary.update({
+        "case": f"categorize_batch:{batch_size}",
+        "concurrency": concurrency,
+        "transactions_per_s": round(summary["throughput_per_s"] * batch_size, 2),
+        "fallback_rate": round(
+            sum(result["method"] != "ai_categorization" for result in results) / len(results), 3
+        ),
+        "prompt_tokens": int((after["prompt"] - before["prompt"]) / len(results)),
+        "completion_tokens": int((after["completion"] - before["completion"]) / len(results)),
+    })
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=20, help="calls per case")
+    parser.add_argument("--categorizations", type=int, default=200,
+                        help="transactions categorized per concurrency level")
+    parser.add_argument("--batch-size", type=int, default=CATEGORIZE_BATCH_MAX,
+                        help="transactions per batched categorization call")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated levels")
+    parser.add_argument("--modes", default=",".join(GENERATION_MODES),
+                        help="COA generation modes to run")
+    parser.add_argument("--median-seconds", type=float, default=1.5)
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--time-scale", type=float, default=0.01,
+                        help="multiply every simulated delay (1.0 = real time)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--recordings", help="JSONL recordings to replay")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    client = FakeOpenAI(
+        latency=LatencyProfile(
+            args.median_seconds, args.sigma, args.tokens_per_second, args.time_scale
+        ),
+        rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate,
+        recordings_path=args.recordings,
+        seed=args.seed,
+    )
+    generator = AIChartGenerator(client=client)
+
+    rows = []
+    for concurrency in [int(level) for level in args.concurrency.split(",")]:
+        for mode in args.modes.split(","):
+            rows.append(bench_coa(generator, mode, args.requests, concurrency))
+        rows.append(bench_categorization(generator, args.categorizations, concurrency))
+        rows.append(bench_categorization_batched(generator, args.categorizations, args.batch_size, concurrency))
+
+    print_table(rows, [
+        "case", "concurrency", "count", "p50_ms", "p95_ms", "p99_ms", "throughput_per_s",
+        "transactions_per_s", "fallback_rate", "prompt_tokens", "completion_tokens",
+    ])
+    print("\nCategorization token counts are per transaction")
+    print(f"\nLatencies include simulated delays scaled by {args.time_scale}")
+    if args.json:
+        write_json(args.json, {"args": vars(args), "results": rows})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
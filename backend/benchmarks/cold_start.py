@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Cold Start Benchmark - Import time, time-to-live and time-to-ready of the server
+Each run uses a fresh interpreter, as an autoscaled container would
+
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --runs 5 --server gunicorn --workers 4
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx  # type: ignore[import-untyped]
+
+from benchmarks.stats import latency_summary, print_table, write_json
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import production_fixed; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    """Seconds to import production_fixed in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def server_command(args: argparse.Namespace) -> List[str]:
+    if args.server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "production_fixed:app"]
+    return [sys.executable, "-m", "uvicorn", "production_fixed:app",
+            "--port", str(args.port), "--log-level", "warning"]
+
+
+def measure_first_response(args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, float]:
+    """Seconds from process spawn until /health/live, then /health/ready, answer 200"""
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        server_command(args), cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    timings: Dict[str, float] = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=1.0) as client:
+            while time.perf_counter() - started < args.timeout:
+                probe = "ready" if "live" in timings else "live"
+                try:
+                    if client.get(f"/health/{probe}").status_code == 200:
+                        timings[probe] = time.perf_counter() - started
+                        if probe == "ready":
+                            return timings
+                        continue
+                except httpx.HTTPError:
+                    pass
+                if server.poll() is not None:
+                    raise RuntimeError(f"Server exited with code {server.returncode}")
+                time.sleep(0.02)
+        raise RuntimeError(f"Server did not answer within {args.timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--server", choices=["uvicorn", "gunicorn"], default="uvicorn")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--no-preload", action="store_true", help="gunicorn without preload_app")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            OPENAI_FAKE="true",
+            DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'coldstart.db')}",
+            PORT=str(args.port),
+            WEB_CONCURRENCY=str(args.workers),
+            WEB_PRELOAD="false" if args.no_preload else "true",
+        )
+        imports = [measure_import(env) for _ in range(args.runs)]
+        first_responses = [measure_first_response(args, env) for _ in range(args.runs)]
+
+    rows: List[Dict[str, Any]] = [dict(latency_summary(imports, sum(imports)), phase="import production_fixed")]
+    for probe in ("live", "ready"):
+        samples = [timings[probe] for timings in first_responses]
+        rows.append(dict(
+            latency_summary(samples, sum(samples)), phase=f"spawn -> /health/{probe} ({args.server})"
+        ))
+    print_table(rows, ["phase", "count", "p50_ms", "p95_ms", "max_ms"])
+    if args.json:
+        write_json(args.json, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+HTTP Load Test - Replays realistic user flows against production_fixed:app
+register -> login -> company profile -> COA -> contacts -> transactions -> categorize
+
+    python -m benchmarks.load_test --spawn --users 50 --ramp-seconds 10
+
+With --spawn a local uvicorn is started with the FakeOpenAI stand-in and a
+throwaway SQLite database; otherwise point --base-url at a running server.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx  # type: ignore[import-untyped]
+
+from benchmarks.stats import latency_summary, print_table, write_json
+
+# Upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NARRATIONS = [
+    ("UPI/DR/412345678901/Office Mart/Stationery", 1450.0),
+    ("NEFT-HDFC0001234-Rent for October-Landlord", 45000.0),
+    ("ACH/Electricity Board/Utilities", 3890.5),
+    ("IMPS/P2A/Travel agency/Flight tickets", 12800.0),
+    ("POS Fuel Station 0098", 2500.0),
+    ("Salary payout October", 185000.0),
+]
+
+
+class RouteStats:
+    """Latencies and failures per route template"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route: str, seconds: float, status_code: Optional[int]) -> None:
+        self.latencies[route].append(seconds)
+        self.statuses[route][status_code or 0] += 1
+        if status_code is None or status_code >= 400:
+            self.errors[route] += 1
+
+    def report(self, elapsed_seconds: float) -> List[Dict[str, Any]]:
+        rows = []
+        for route, samples in sorted(self.latencies.items()):
+            row = latency_summary(samples, elapsed_seconds)
+            histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+            for seconds in samples:
+                index = next(
+                    (i for i, bound in enumerate(HISTOGRAM_BUCKETS_MS) if seconds * 1000 <= bound),
+                    len(HISTOGRAM_BUCKETS_MS),
+                )
+                histogram[index] += 1
+            row.update({
+                "route": route,
+                "errors": self.errors[route],
+                "error_rate": round(self.errors[route] / len(samples), 4),
+                "statuses": dict(self.statuses[route]),
+                "histogram": dict(zip(
+                    [f"<={bound}ms" for bound in HISTOGRAM_BUCKETS_MS] + ["+inf"], histogram
+                )),
+            })
+            rows.append(row)
+        return rows
+
+
+class VirtualUser:
+    """One simulated user walking through the accounting workflow"""
+
+    def __init__(self, client: httpx.AsyncClient, stats: RouteStats, args: argparse.Namespace):
+        self.client = client
+        self.stats = stats
+        self.args = args
+        self.name = f"load_{uuid.uuid4().hex[:12]}"
+        self.headers: Dict[str, str] = {}
+
+    async def call(self, route: str, method: str, url: str, **kwargs: Any) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(route, time.perf_counter() - started, None)
+            return None
+        self.stats.record(route, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def run(self) -> None:
+        password = "load-test-password"
+        await self.call("POST /auth/register", "POST", "/auth/register", json={
+            "username": self.name, "email": f"{self.name}@example.com", "password": password
+        })
+        response = await self.call("POST /auth/login", "POST", "/auth/login", data={
+            "username": self.name, "password": password
+        })
+        if response is None or response.status_code != 200:
+            return
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await self.call("POST /api/company-profile", "POST", "/api/company-profile", json={
+            "company_name": f"{self.name} Pvt Ltd",
+            "nature_of_business": "Software Development",
+            "industry": "Technology",
+            "location": "India",
+            "company_type": "Private Limited",
+            "reporting_framework": "Ind AS",
+            "statutory_compliances": ["GST", "TDS"],
+        })
+        if response is None or response.status_code != 200:
+            return
+        company_id = response.json()["id"]
+
+        await self.call(
+            "POST /api/coa/generate/{company_id}", "POST", f"/api/coa/generate/{company_id}",
+            params={"generation_mode": self.args.generation_mode}
+        )
+        for index in range(self.args.contacts):
+            await self.call("POST /api/contacts/{company_id}", "POST", f"/api/contacts/{company_id}", json={
+                "name": f"Vendor {index}", "contact_type": "vendor"
+            })
+        for iteration in range(self.args.iterations):
+            description, amount = NARRATIONS[iteration % len(NARRATIONS)]
+            await self.call("POST /api/transactions", "POST", "/api/transactions", json={
+                "company_id": company_id,
+                "description": description,
+                "amount": amount,
+                "transaction_type": "expense",
+                "category": "Uncategorized",
+            })
+            await self.call("POST /api/categorize-transaction", "POST", "/api/categorize-transaction", json={
+                "description": description, "amount": amount, "transaction_type": "expense"
+            })
+
+
+def sqlite_size(db_file: Optional[str]) -> Optional[int]:
+    """Bytes used by a SQLite database including its WAL file"""
+    if not db_file or not os.path.exists(db_file):
+        return None
+    wal = f"{db_file}-wal"
+    return os.path.getsize(db_file) + (os.path.getsize(wal) if os.path.exists(wal) else 0)
+
+
+async def wait_until_up(base_url: str, timeout_seconds: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout_seconds
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health/ready")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+def spawn_server(args: argparse.Namespace) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        OPENAI_FAKE="true",
+        OPENAI_FAKE_TIME_SCALE=str(args.ai_time_scale),
+        DATABASE_URL=f"sqlite:///{args.db_file}",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "production_fixed:app",
+         "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    stats = RouteStats()
+    db_sizes = [(0.0, sqlite_size(args.db_file))]
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    started = time.perf_counter()
+
+    async def sample_db_size() -> None:
+        while True:
+            await asyncio.sleep(1.0)
+            db_sizes.append((round(time.perf_counter() - started, 1), sqlite_size(args.db_file)))
+
+    async def start_user(index: int, client: httpx.AsyncClient) -> None:
+        await asyncio.sleep(args.ramp_seconds * index / max(1, args.users))
+        await VirtualUser(client, stats, args).run()
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url, timeout=args.request_timeout, limits=limits
+    ) as client:
+        sampler = asyncio.create_task(sample_db_size())
+        await asyncio.gather(*(start_user(index, client) for index in range(args.users)))
+        sampler.cancel()
+    elapsed = time.perf_counter() - started
+    db_sizes.append((round(elapsed, 1), sqlite_size(args.db_file)))
+
+    sizes = [size for _, size in db_sizes if size is not None]
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "users": args.users,
+        "routes": stats.report(elapsed),
+        "db_size_bytes": {
+            "start": sizes[0] if sizes else None,
+            "end": sizes[-1] if sizes else None,
+            "growth": sizes[-1] - sizes[0] if sizes else None,
+            "samples": db_sizes,
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8010")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--ramp-seconds", type=float, default=5.0)
+    parser.add_argument("--iterations", type=int, default=10,
+                        help="transaction + categorize rounds per user")
+    parser.add_argument("--contacts", type=int, default=3)
+    parser.add_argument("--generation-mode", default="five_step")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--db-file", default=os.path.join(BACKEND_DIR, "loadtest.db"),
+                        help="SQLite file to watch for size growth")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start uvicorn with the fake AI client and a fresh database")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--ai-time-scale", type=float, default=0.05,
+                        help="scale of the fake AI latencies when spawning")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        for path in (args.db_file, f"{args.db_file}-wal", f"{args.db_file}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        args.base_url = f"http://127.0.0.1:{args.port}"
+        server = spawn_server(args)
+    try:
+        asyncio.run(wait_until_up(args.base_url))
+        results = asyncio.run(run_load(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print_table(results["routes"], [
+        "route", "count", "errors", "error_rate", "p50_ms", "p95_ms", "p99_ms", "throughput_per_s"
+    ])
+    print()
+    for row in results["routes"]:
+        buckets = ", ".join(f"{bound}: {count}" for bound, count in row["histogram"].items() if count)
+        print(f"{row['route']}: {buckets}")
+    size = results["db_size_bytes"]
+    if size["growth"] is not None:
+        print(f"\nDB size: {size['start']} -> {size['end']} bytes (+{size['growth']})")
+    print(f"Elapsed: {results['elapsed_seconds']}s for {args.users} users")
+    if args.json:
+        write_json(args.json, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
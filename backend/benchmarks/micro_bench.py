@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Micro Benchmarks - ops/sec and allocations for the pure-Python request-path functions
+Compares each run with a stored baseline and exits non-zero on regressions
+
+    python -m benchmarks.micro_bench --narrations 100000
+    python -m benchmarks.micro_bench --update-baseline
+
+Baselines are machine-specific: record one on the machine that runs the checks.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Sequence
+
+# Keep the benchmark's tables off the local disk
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from ai_chart_generator import AIChartGenerator  # noqa: E402
+from balance_check import verify_running_balance  # noqa: E402
+from benchmarks.stats import print_table, write_json  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+from migrate import migrate  # noqa: E402
+from nb_classifier import NaiveBayesModel  # noqa: E402
+import production_fixed  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baseline.json")
+
+VENDORS = [
+    "ACME PVT LTD", "Office Mart", "City Electricity Board", "Shell Fuel", "Landlord Estates",
+    "Indigo Airlines", "Google Ads", "LIC Insurance", "Quick Repairs", "Swiggy", "Amazon",
+]
+KEYWORDS = [
+    "salary", "rent", "office supplies", "travel", "utilities", "marketing", "insurance",
+    "fuel", "maintenance", "consulting", "misc",
+]
+TEMPLATES = [
+    "UPI/DR/{ref}/{vendor}/{keyword}",
+    "NEFT-HDFC{ref}-{keyword} payment-{vendor}",
+    "IMPS/P2A/{ref}/{vendor}",
+    "POS {ref} {vendor} {keyword}",
+    "ACH D- {vendor} {keyword} {ref}",
+]
+MISSPELLED = ["expences", "recievable", "payabel", "depriciation", "assests", "inventry"]
+
+
+def generate_narrations(count: int, seed: int = 11) -> List[str]:
+    """Synthetic bank narrations in the common Indian bank formats"""
+    rng = random.Random(seed)
+    return [
+        rng.choice(TEMPLATES).format(
+            ref=rng.randrange(10 ** 11, 10 ** 12),
+            vendor=rng.choice(VENDORS),
+            keyword=rng.choice(KEYWORDS),
+        )
+        for _ in range(count)
+    ]
+
+
+def generate_inputs(count: int, seed: int = 13) -> List[str]:
+    rng = random.Random(seed)
+    words = KEYWORDS + MISSPELLED + ["accounts", "cash", "bank", "ledger"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(2, 8))) for _ in range(count)]
+
+
+def generate_coa(accounts: int, seed: int = 17) -> Dict[str, List[Dict[str, str]]]:
+    """A synthetic COA in the AI workflow's output shape"""
+    client = FakeOpenAI(seed=seed, accounts=min(accounts, 100))
+    template = json.loads(client._content("gpt-4", "Chart of Accounts"))
+    entries = [(statement, entry) for statement, items in template.items() for entry in items]
+    chart: Dict[str, List[Dict[str, str]]] = {}
+    for index in range(accounts):
+        statement, entry = entries[index % len(entries)]
+        chart.setdefault(statement, []).append(dict(entry, code=str(1000 + index % 9000)))
+    return chart
+
+
+# Best-of-N passes over each corpus, to keep scheduler noise out of the baseline
+REPEATS = 5
+
+
+def measure(
+    name: str,
+    call: Callable[[Any], Any],
+    corpus: Sequence[Any],
+    alloc_sample: int = 1000,
+    repeats: int = REPEATS
+) -> Dict[str, Any]:
+    """Best throughput over the whole corpus, then retained bytes per call on a sample"""
+    elapsed = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for item in corpus:
+            call(item)
+        elapsed = min(elapsed, time.perf_counter() - started)
+
+    sample = corpus[:alloc_sample]
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline_bytes, _ = tracemalloc.get_traced_memory()
+    results = [call(item) for item in sample]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+
+    return {
+        "case": name,
+        "calls": len(corpus),
+        "ops_per_sec": round(len(corpus) / elapsed, 1) if elapsed else float("inf"),
+        "bytes_per_op": round((peak - baseline_bytes) / max(1, len(sample)), 1),
+    }
+
+
+def build_cases(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    def run(name: str, call: Callable[[Any], Any], corpus: Sequence[Any], alloc_sample: int = 1000):
+        return measure(name, call, corpus, alloc_sample, args.repeats)
+
+    logic = production_fixed.SaimJrBusinessLogic
+    generator = AIChartGenerator(client=FakeOpenAI())
+    narrations = generate_narrations(args.narrations)
+    inputs = generate_inputs(min(args.narrations, 100000))
+    coas = {size: generate_coa(size) for size in args.coa_accounts}
+
+    rows = [
+        run("validate_input", lambda text: logic.validate_input(text), inputs),
+        run(
+            "business_logic._fallback_categorization",
+            lambda text: logic._fallback_categorization(text, 1200.0, "expense"),
+            narrations,
+        ),
+        run(
+            "ai_generator._fallback_categorization",
+            lambda text: generator._fallback_categorization(text, 1200.0, "expense"),
+            narrations,
+        ),
+    ]
+    # Whole-corpus batch scoring by a category model trained on a tenth of it
+    model = NaiveBayesModel()
+    model.update(
+        ((text, 1200.0, "expense"), (category["category"], category["account_code"]))
+        for text in narrations[:max(1, len(narrations) // 10)]
+        for category in [logic._fallback_categorization(text, 1200.0, "expense")]
+    )
+    row = run(
+        f"NaiveBayesModel.predict_many[{len(narrations)}]",
+        model.predict_many,
+        [[(text, 1200.0, "expense") for text in narrations]],
+        alloc_sample=1,
+    )
+    row["rows_per_sec"] = round(row["ops_per_sec"] * len(narrations), 1)
+    rows.append(row)
+    # A statement with one row per narration, some of them without a direction
+    rng = random.Random(7)
+    amounts = [round(rng.uniform(1, 50000), 2) for _ in narrations]
+    types = [rng.choice(["debit", "credit", "debit", None]) if index % 10 == 0 else
+             rng.choice(["debit", "credit"]) for index in range(len(narrations))]
+    balances, balance = [], 1e6
+    for amount, kind in zip(amounts, types):
+        balance += amount if kind == "credit" else -amount
+        balances.append(round(balance, 2))
+    row = run(
+        f"verify_running_balance[{len(narrations)}]",
+        lambda statement: verify_running_balance(*statement),
+        [(amounts, balances, types)],
+        alloc_sample=1,
+    )
+    row["rows_per_sec"] = round(row["ops_per_sec"] * len(narrations), 1)
+    rows.append(row)
+    for size, coa in coas.items():
+        rows.append(run(
+            f"_count_accounts[{size}]",
+            generator._count_accounts,
+            [coa] * max(10, 200000 // size),
+            alloc_sample=10,
+        ))
+
+    transaction_payloads = [
+        {"description": text, "amount": 1200.0, "transaction_type": "expense"}
+        for text in narrations[:100000]
+    ]
+    profile_payload = {
+        "company_name": "Bench Co", "nature_of_business": "Retail", "industry": "Retail",
+        "location": "India", "company_type": "Private Limited",
+        "statutory_compliances": ["GST", "TDS"],
+    }
+    rows.append(run(
+        "TransactionRequest", lambda data: production_fixed.TransactionRequest(**data),
+        transaction_payloads,
+    ))
+    rows.append(run(
+        "CompanyProfileCreate", lambda data: production_fixed.CompanyProfileCreate(**data),
+        [profile_payload] * 50000,
+    ))
+    rows.append(run(
+        "UserCreate",
+        lambda index: production_fixed.UserCreate(
+            username=f"user{index}", email=f"user{index}@example.com", password="secret-pass"
+        ),
+        list(range(50000)),
+    ))
+
+    # store_chart_of_accounts against the in-memory database
+    migrate(production_fixed.engine, production_fixed.Base.metadata)
+    owner = production_fixed.User(username="bench", email="bench@example.com", hashed_password="x")
+    db = production_fixed.SessionLocal()
+    db.add(owner)
+    db.commit()
+    company = production_fixed.CompanyProfile(company_name="Bench Co", owner_id=owner.id)
+    db.add(company)
+    db.commit()
+    for size, coa in coas.items():
+        row = run(
+            f"store_chart_of_accounts[{size}]",
+            lambda chart: asyncio.run(production_fixed.store_chart_of_accounts(chart, company.id, db)),
+            [coa] * args.store_repeats,
+            alloc_sample=1,
+        )
+        row["accounts_per_sec"] = round(row["ops_per_sec"] * size, 1)
+        rows.append(row)
+    db.close()
+    return rows
+
+
+def compare(rows: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions beyond ``tolerance`` in throughput or bytes per call"""
+    failures = []
+    for row in rows:
+        reference = baseline.get(row["case"])
+        if not reference:
+            row["vs_baseline"] = "new"
+            continue
+        speed = row["ops_per_sec"] / reference["ops_per_sec"] if reference["ops_per_sec"] else 1.0
+        row["vs_baseline"] = f"{speed:.2f}x"
+        if speed < 1 - tolerance:
+            failures.append(f"{row['case']}: {row['ops_per_sec']} ops/s vs {reference['ops_per_sec']}")
+        if row["bytes_per_op"] > reference["bytes_per_op"] * (1 + tolerance) + 64:
+            failures.append(
+                f"{row['case']}: {row['bytes_per_op']} B/op vs {reference['bytes_per_op']}"
+            )
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--narrations", type=int, default=10000,
+                        help="bank narrations in the categorization corpus (10k-1M)")
+    parser.add_argument("--coa-accounts", default="1000,10000",
+                        help="comma-separated synthetic COA sizes")
+    parser.add_argument("--store-repeats", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=REPEATS,
+                        help="passes per case; the fastest one is reported")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed fractional regression before failing")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    args.coa_accounts = [int(size) for size in args.coa_accounts.split(",")]
+
+    rows = build_cases(args)
+    baseline: Dict[str, Any] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    failures = [] if args.update_baseline else compare(rows, baseline, args.tolerance)
+
+    print_table(rows, ["case", "calls", "ops_per_sec", "bytes_per_op", "vs_baseline"])
+    if args.json:
+        write_json(args.json, rows)
+    if args.update_baseline:
+        write_json(args.baseline, {
+            row["case"]: {"ops_per_sec": row["ops_per_sec"], "bytes_per_op": row["bytes_per_op"]}
+            for row in rows
+        })
+        print(f"\nBaseline written to {args.baseline}")
+    if failures:
+        print("\nREGRESSIONS:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""
+Shared latency statistics and report formatting for the benchmark scripts
+"""
+
+import json
+from typing import Any, Dict, List, Sequence
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of an unsorted sample"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def latency_summary(samples: Sequence[float], elapsed_seconds: float) -> Dict[str, Any]:
+    """p50/p95/p99 latency (ms) and throughput for one benchmark case"""
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+        "throughput_per_s": round(len(samples) / elapsed_seconds, 2) if elapsed_seconds else 0.0,
+    }
+
+
+def print_table(rows: List[Dict[str, Any]], columns: List[str]) -> None:
+    """Print benchmark rows as an aligned plain-text table"""
+    widths = {
+        column: max(len(column), *(len(str(row.get(column, ""))) for row in rows))
+        for column in columns
+    }
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns))
+
+
+def write_json(path: str, payload: Any) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+COA Stream - Incremental parsing and validation of streamed COA completions
+Emits each account object as soon as it closes instead of after the full completion
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Standard 4-digit numbering used by the COA prompt
+ACCOUNT_CODE_RANGES = {
+    "assets": (1000, 1999),
+    "liabilities": (2000, 2999),
+    "equity": (3000, 3999),
+    "revenue": (4000, 4999),
+    "cost_of_goods_sold": (5000, 5999),
+    "operating_expenses": (6000, 8999),
+    "non_operating": (9000, 9999),
+}
+
+# Account kind -> ranges its codes may fall in
+KIND_RANGES = {
+    "asset": ["assets"],
+    "liability": ["liabilities"],
+    "equity": ["equity"],
+    "cost_of_goods_sold": ["cost_of_goods_sold"],
+    "expense": ["cost_of_goods_sold", "operating_expenses", "non_operating"],
+    "income": ["revenue", "non_operating"],
+}
+
+# Checked in order; the first keyword found in the label decides the kind
+KIND_KEYWORDS = [
+    ("asset", ("asset",)),
+    ("liability", ("liabilit",)),
+    ("equity", ("equity",)),
+    ("cost_of_goods_sold", ("cost of goods", "cost of sales", "cost of materials")),
+    ("expense", ("expense", "cost", "loss")),
+    ("income", ("revenue", "income", "sales", "gain")),
+]
+
+
+class AccountStreamParser:
+    """Incremental JSON scanner that yields account objects as they close
+
+    Any object that is an element of an array is captured and parsed once its
+    closing brace arrives; it is emitted with the key of the enclosing array
+    (the statement type) when it looks like an account.
+    """
+
+    def __init__(self):
+        # Frames: ["{", current_key, expecting_key] or ["[", key_of_array]
+        self._stack: List[List[Any]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_chars: List[str] = []
+        self._capture: List[str] = []
+        self._capture_depth = 0
+
+    def feed(self, text: str) -> List[Tuple[str, Dict[str, Any]]]:
+        accounts: List[Tuple[str, Dict[str, Any]]] = []
+        for char in text:
+            if self._capture_depth:
+                self._capture.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._finish_string()
+                else:
+                    self._string_chars.append(char)
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_chars = []
+            elif char == ":":
+                if self._stack and self._stack[-1][0] == "{":
+                    self._stack[-1][2] = False
+            elif char == ",":
+                if self._stack and self._stack[-1][0] == "{":
+                    self._stack[-1][2] = True
+            elif char == "{":
+                parent = self._stack[-1] if self._stack else None
+                self._stack.append(["{", None, True])
+                if parent is not None and parent[0] == "[" and not self._capture_depth:
+                    self._capture = ["{"]
+                    self._capture_depth = len(self._stack)
+            elif char == "[":
+                parent = self._stack[-1] if self._stack else None
+                self._stack.append(["[", parent[1] if parent is not None else None])
+            elif char in "}]" and self._stack:
+                if char == "}" and self._capture_depth == len(self._stack):
+                    account = self._parse_capture()
+                    statement = self._stack[-2][1] if len(self._stack) > 1 else None
+                    if account is not None and statement:
+                        accounts.append((statement, account))
+                self._stack.pop()
+        return accounts
+
+    def _finish_string(self) -> None:
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame[0] == "{" and frame[2]:
+            frame[1] = "".join(self._string_chars)
+
+    def _parse_capture(self) -> Optional[Dict[str, Any]]:
+        text = "".join(self._capture)
+        self._capture = []
+        self._capture_depth = 0
+        try:
+            value = json.loads(text)
+        except ValueError:
+            return None
+        if isinstance(value, dict) and ("account" in value or "code" in value):
+            return value
+        return None
+
+
+def _detect_kind(label: str) -> Optional[str]:
+    label = label.lower()
+    for kind, keywords in KIND_KEYWORDS:
+        if any(keyword in label for keyword in keywords):
+            return kind
+    return None
+
+
+def account_kind(account: Dict[str, Any]) -> Optional[str]:
+    """Kind of an account from its class, refined by classification when mixed"""
+    class_name = str(account.get("class") or "").lower()
+    if class_name and not ("equity" in class_name and "liabilit" in class_name):
+        kind = _detect_kind(class_name)
+        if kind is not None:
+            return kind
+    for field in ("classification", "subclassification"):
+        kind = _detect_kind(str(account.get(field) or ""))
+        if kind is not None:
+            return kind
+    return None
+
+
+class AccountCodeValidator:
+    """Checks each account's code against the numbering rules and earlier codes"""
+
+    def __init__(self):
+        self.seen_codes: Set[str] = set()
+
+    def check(self, account: Dict[str, Any]) -> Optional[str]:
+        """Returns the rejection reason, or None when the account is valid"""
+        code = str(account.get("code", "")).strip()
+        if not account.get("account"):
+            return "missing account name"
+        if len(code) != 4 or not code.isdigit():
+            return f"code '{code}' is not a 4-digit number"
+        if code in self.seen_codes:
+            return f"duplicate code {code}"
+        number = int(code)
+        kind = account_kind(account)
+        ranges = KIND_RANGES[kind] if kind else list(ACCOUNT_CODE_RANGES)
+        if not any(
+            ACCOUNT_CODE_RANGES[name][0] <= number <= ACCOUNT_CODE_RANGES[name][1]
+            for name in ranges
+        ):
+            return f"code {code} is outside the {kind} ranges"
+        self.seen_codes.add(code)
+        return None
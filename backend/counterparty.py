@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Counterparty - Payee/payer names from bank narrations, matched to contacts
+UPI, NEFT, IMPS, RTGS, NACH and card narrations are split on their
+separators and stripped of references, IFSC codes, VPAs and channel words,
+leaving the counterparty name. Names are matched to a company's contacts
+through a trigram inverted index, once per distinct name, so a statement
+costs one pass however many rows repeat the same payee.
+"""
+
+import os
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from reconciliation import trigram_similarity, trigrams
+
+COUNTERPARTY_ON_IMPORT = os.getenv("COUNTERPARTY_ON_IMPORT", "true").lower() == "true"
+CONTACT_MATCH_MIN_SCORE = float(os.getenv("CONTACT_MATCH_MIN_SCORE", "0.6"))
+# Unmatched names seen at least this often are suggested as new contacts
+CONTACT_SUGGEST_MIN_COUNT = int(os.getenv("CONTACT_SUGGEST_MIN_COUNT", "3"))
+CONTACT_SUGGEST_TOP = 20
+
+CHANNELS = {"UPI", "NEFT", "IMPS", "RTGS", "NACH", "ACH", "ECS", "MMT", "POS", "INB", "BIL", "BILLPAY", "CMS"}
+# Segment words that are never the counterparty
+NOISE_WORDS = CHANNELS | {
+    "DR", "CR", "D", "C", "TO", "FROM", "BY", "TRF", "TRANSFER", "PAYMENT", "PAY", "PAID", "SENT", "RECEIVED",
+    "NETBANKING", "NETBANK", "NET", "BANKING", "MOBILE", "ONLINE", "REF", "REFNO", "UTR", "TXN", "FT", "IB",
+    "COLLECT", "REQUEST", "INWARD", "OUTWARD", "OTHERS", "NA", "NULL", "AUTOPAY", "MANDATE", "DEBIT", "CREDIT",
+}
+BANK_WORDS = {
+    "HDFC", "ICICI", "SBI", "SBIN", "AXIS", "UTIB", "KOTAK", "KKBK", "YES", "YESB", "PNB", "PUNB", "BOB", "BARB",
+    "IDFC", "IDFB", "INDUSIND", "INDB", "CANARA", "CNRB", "UNION", "UBIN", "FEDERAL", "FDRL", "PAYTM", "PYTM",
+    "AIRTEL", "AIRP", "BANK", "LTD",
+}
+# Narrations without a counterparty: cash, charges, interest, taxes
+NO_COUNTERPARTY = re.compile(r"\b(ATM|CASH WDL|CASH DEP|CHARGES|CHGS|INTEREST|INT\.?PD|GST|TDS|SMS|MIN BAL)\b")
+DIGITS = re.compile(r"\d+")
+# Legal-form words dropped on both sides before comparing names
+LEGAL_SUFFIXES = re.compile(
+    r"\b(PVT|PRIVATE|LTD|LIMITED|LLP|INC|CORP|CORPORATION|CO|COMPANY|M S|MS|THE|AND|ENTERPRISES?)\b"
+)
+
+
+def _is_name(segment: str) -> bool:
+    words = segment.split()
+    if not words or "@" in segment:
+        return False
+    letters = [word for word in words if word.isalpha()]
+    return bool(letters) and not all(word in NOISE_WORDS or word in BANK_WORDS for word in letters) \
+        and sum(len(word) for word in letters) >= 3
+
+
+def extract_counterparty(narration: str) -> Optional[str]:
+    """The counterparty named in a bank narration, upper-cased, or None"""
+    # Words with digits (references, IFSC codes, masked cards) are never part of the name, so
+    # narrations that differ only in their numbers share one cached answer
+    return _extract(DIGITS.sub("0", " ".join((narration or "").upper().split())))
+
+
+@lru_cache(maxsize=65536)
+def _extract(text: str) -> Optional[str]:
+    if not text or NO_COUNTERPARTY.search(text):
+        return None
+    segments = [segment.strip() for segment in re.split(r"[/\-|:*]+", text)]
+    if len(segments) < 2:
+        # A plain narration ("POS 4111XXXX1111 SHELL FUEL BLR") is one segment of words
+        segments = [text]
+    for segment in segments:
+        words = [word for word in segment.split() if word not in NOISE_WORDS and "0" not in word]
+        candidate = " ".join(word.strip(".,") for word in words)
+        if _is_name(candidate):
+            return candidate
+    return None
+
+
+def name_key(name: str) -> str:
+    """Upper-case name without punctuation or legal-form words, for grouping and comparing"""
+    text = re.sub(r"[^A-Z ]+", " ", name.upper())
+    return " ".join(LEGAL_SUFFIXES.sub(" ", text).split())
+
+
+class ContactIndex:
+    """Trigram inverted index over a company's contact names
+
+    A name is only compared with contacts sharing at least one trigram;
+    the score averages Jaccard similarity with how much of the shorter
+    name is contained in the longer, so "ACME" still finds "Acme Technologies".
+    """
+
+    def __init__(self, contacts: Iterable[Tuple[int, str]]):
+        self._grams: List[FrozenSet[str]] = []
+        self._ids: List[int] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for contact_id, name in contacts:
+            grams = trigrams(name_key(name))
+            if not grams:
+                continue
+            slot = len(self._ids)
+            self._ids.append(contact_id)
+            self._grams.append(grams)
+            for gram in grams:
+                self._postings[gram].append(slot)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def match(self, name: str, min_score: float = CONTACT_MATCH_MIN_SCORE) -> Optional[Tuple[int, float]]:
+        grams = trigrams(name_key(name))
+        if not grams:
+            return None
+        shared: Counter = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        best: Optional[Tuple[int, float]] = None
+        for slot, overlap in shared.most_common(10):
+            contained = overlap / min(len(grams), len(self._grams[slot]))
+            score = round((trigram_similarity(grams, self._grams[slot]) + contained) / 2, 4)
+            if score >= min_score and (best is None or score > best[1]):
+                best = (self._ids[slot], score)
+        return best
+
+    def match_many(self, names: Sequence[str]) -> Dict[str, Optional[Tuple[int, float]]]:
+        """Match per distinct name key"""
+        return {key: self.match(key) for key in {name_key(name) for name in names}}
+
+
+def suggest_contacts(
+    unmatched: Iterable[Tuple[str, float, Optional[str]]],
+    min_count: int = CONTACT_SUGGEST_MIN_COUNT,
+    top: int = CONTACT_SUGGEST_TOP
+) -> List[Dict[str, Any]]:
+    """Frequent unmatched (name, amount, direction) counterparties as new-contact suggestions"""
+    counts: Counter = Counter()
+    totals: Dict[str, float] = defaultdict(float)
+    credits: Counter = Counter()
+    spellings: Dict[str, Counter] = defaultdict(Counter)
+    for name, amount, transaction_type in unmatched:
+        key = name_key(name)
+        if not key:
+            continue
+        counts[key] += 1
+        totals[key] += abs(amount or 0.0)
+        spellings[key][name] += 1
+        if transaction_type == "credit":
+            credits[key] += 1
+    return [
+        {
+            "name": spellings[key].most_common(1)[0][0].title(),
+            "contact_type": "customer" if credits[key] * 2 > count else "vendor",
+            "transactions": count,
+            "total_amount": round(totals[key], 2),
+        }
+        for key, count in counts.most_common(top)
+        if count >= min_count
+    ]
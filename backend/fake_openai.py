@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI - Offline stand-in for the OpenAI chat completions client
+Simulates latency, rate limits and server errors, and replays recorded responses
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from framework_rules import derive_structure
+from prompt_builder import count_tokens
+
+
+class FakeAPIError(Exception):
+    """Injected API failure carrying the HTTP status it simulates"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LatencyProfile:
+    """Log-normal response latency plus a per-token generation rate"""
+
+    def __init__(
+        self,
+        median_seconds: float = 1.5,
+        sigma: float = 0.5,
+        tokens_per_second: float = 60.0,
+        time_scale: float = 1.0
+    ):
+        self.median_seconds = median_seconds
+        self.sigma = sigma
+        self.tokens_per_second = tokens_per_second
+        self.time_scale = time_scale
+
+    def first_token_delay(self, rng: random.Random) -> float:
+        return self.median_seconds * math.exp(self.sigma * rng.gauss(0, 1)) * self.time_scale
+
+    def token_delay(self, tokens: int) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return tokens / self.tokens_per_second * self.time_scale
+
+
+class _Namespace:
+    """Attribute bag shaped like the OpenAI SDK response objects"""
+
+    def __init__(self, **fields: Any):
+        self.__dict__.update(fields)
+
+
+def _prompt_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+
+
+def _synthetic_accounts(count: int) -> Dict[str, List[Dict[str, str]]]:
+    structure = derive_structure("Ind AS")["classifications"]
+    # Code blocks per classification, following the COA numbering rules
+    blocks = {
+        "Non-Current Assets": 1500, "Current Assets": 1000, "Equity": 3000,
+        "Non-Current Liabilities": 2500, "Current Liabilities": 2000,
+        "Revenue from Operations": 4000, "Other Income": 9000,
+        "Cost of Materials Consumed": 5000, "Employee Benefits Expense": 6000,
+        "Finance Costs": 9500, "Depreciation and Amortisation Expense": 7000,
+        "Other Expenses": 8000, "Tax Expense": 9800,
+    }
+    entries = [
+        (statement, entry)
+        for statement, items in structure.items()
+        for entry in items
+        if entry["classification"] in blocks
+    ]
+    chart: Dict[str, List[Dict[str, str]]] = {}
+    for index in range(count):
+        statement, entry = entries[index % len(entries)]
+        code = blocks[entry["classification"]] + 1 + index // len(entries)
+        chart.setdefault(statement, []).append({
+            "class": entry["class"],
+            "classification": entry["classification"],
+            "subclassification": f"{entry['classification']} - General",
+            "account": f"{entry['classification']} Account {index // len(entries) + 1}",
+            "code": str(code),
+            "description": f"Synthetic {entry['classification'].lower()} account",
+        })
+    return chart
+
+
+def synthetic_response(prompt: str, accounts: int = 100) -> Dict[str, Any]:
+    """A schema-valid answer for whichever workflow step the prompt belongs to"""
+    structure = derive_structure("Ind AS")
+    if "Determine the financial statements" in prompt:
+        return structure["statements"]
+    if "define the appropriate high-level classes" in prompt:
+        return structure["classes"]
+    if "add appropriate classifications" in prompt:
+        return structure["classifications"]
+    if "add detailed subclassifications" in prompt:
+        return {
+            statement: [dict(entry, subclassification=f"{entry['classification']} - General")
+                        for entry in entries]
+            for statement, entries in structure["classifications"].items()
+        }
+    if "Chart of Accounts" in prompt:
+        return _synthetic_accounts(accounts)
+    listed = re.findall(r'^\s*\[(\d+)\] Description: ("(?:[^"\\]|\\.)*") \| Amount:', prompt, re.MULTILINE)
+    if listed:
+        return {"transactions": [
+            dict(_synthetic_categorization(json.loads(text)), index=int(index)) for index, text in listed
+        ]}
+    description = re.search(r"Description: (.*)", prompt)
+    return _synthetic_categorization(description.group(1) if description else "")
+
+
+def _synthetic_categorization(description: str) -> Dict[str, Any]:
+    category, code = ("Office Expenses", "6101") if "office" in description.lower() else (
+        "Miscellaneous Expenses", "6999"
+    )
+    return {
+        "category": category,
+        "account_code": code,
+        "confidence": 0.9,
+        "reasoning": "Synthetic categorization",
+        "transaction_type": "debit",
+    }
+
+
+class _Stream:
+    """Iterable of streamed chunks with the SDK's close() method"""
+
+    def __init__(self, chunks: Iterator[Any]):
+        self._chunks = chunks
+
+    def __iter__(self) -> Iterator[Any]:
+        return self._chunks
+
+    def close(self) -> None:
+        self._chunks = iter(())
+
+
+class _Completions:
+    def __init__(self, client: "FakeOpenAI"):
+        self._client = client
+
+    def create(self, **kwargs: Any) -> Any:
+        return self._client._create(**kwargs)
+
+
+class FakeOpenAI:
+    """Drop-in for ``OpenAI()`` covering ``chat.completions.create``
+
+    Responses come from the recordings file when the exact prompt was
+    recorded, otherwise from synthetic_response. Latency follows the given
+    profile, and 429/5xx failures are injected at the configured rates.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyProfile] = None,
+        rate_limit_rate: float = 0.0,
+        server_error_rate: float = 0.0,
+        recordings_path: Optional[str] = None,
+        accounts: int = 100,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency or LatencyProfile()
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.accounts = accounts
+        self.recordings: Dict[str, str] = {}
+        if recordings_path and os.path.exists(recordings_path):
+            with open(recordings_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.recordings[record["key"]] = record["content"]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.chat = _Namespace(completions=_Completions(self))
+
+    @classmethod
+    def from_env(cls) -> "FakeOpenAI":
+        """Configure from OPENAI_FAKE_* variables (used by the server and load tests)"""
+        return cls(
+            latency=LatencyProfile(
+                median_seconds=float(os.getenv("OPENAI_FAKE_MEDIAN_SECONDS", "1.5")),
+                sigma=float(os.getenv("OPENAI_FAKE_SIGMA", "0.5")),
+                tokens_per_second=float(os.getenv("OPENAI_FAKE_TOKENS_PER_SECOND", "60")),
+                time_scale=float(os.getenv("OPENAI_FAKE_TIME_SCALE", "1.0")),
+            ),
+            rate_limit_rate=float(os.getenv("OPENAI_FAKE_429_RATE", "0")),
+            server_error_rate=float(os.getenv("OPENAI_FAKE_5XX_RATE", "0")),
+            recordings_path=os.getenv("OPENAI_FAKE_RECORDINGS"),
+        )
+
+    def _draw(self) -> float:
+        with self._lock:
+            self.calls += 1
+            return self._rng.random()
+
+    def _content(self, model: str, prompt: str) -> str:
+        recorded = self.recordings.get(_prompt_key(model, prompt))
+        if recorded is not None:
+            return recorded
+        return json.dumps(synthetic_response(prompt, self.accounts))
+
+    def _create(self, **kwargs: Any) -> Any:
+        model = kwargs.get("model", "gpt-4")
+        prompt = "\n".join(message["content"] for message in kwargs.get("messages", []))
+        draw = self._draw()
+        with self._lock:
+            first_token = self.latency.first_token_delay(self._rng)
+        time.sleep(first_token)
+        if draw < self.rate_limit_rate:
+            raise FakeAPIError(429, "Rate limit reached (injected)")
+        if draw < self.rate_limit_rate + self.server_error_rate:
+            raise FakeAPIError(500, "Server error (injected)")
+
+        content = self._content(model, prompt)
+        usage = _Namespace(
+            prompt_tokens=count_tokens(prompt, model),
+            completion_tokens=count_tokens(content, model),
+        )
+        if kwargs.get("stream"):
+            return _Stream(self._chunks(content, usage))
+        time.sleep(self.latency.token_delay(usage.completion_tokens))
+        message = _Namespace(role="assistant", content=content)
+        return _Namespace(
+            choices=[_Namespace(index=0, message=message, finish_reason="stop")],
+            usage=usage,
+            model=model,
+        )
+
+    def _chunks(self, content: str, usage: Any, chunk_chars: int = 16) -> Iterator[Any]:
+        delay = self.latency.token_delay(count_tokens(content[:chunk_chars]))
+        owed = 0.0
+        for start in range(0, len(content), chunk_chars):
+            # Sleep in >= 5ms steps so scaled-down runs aren't dominated by timer granularity
+            owed += delay
+            if owed >= 0.005:
+                time.sleep(owed)
+                owed = 0.0
+            delta = _Namespace(content=content[start:start + chunk_chars])
+            yield _Namespace(choices=[_Namespace(index=0, delta=delta)], usage=None)
+        yield _Namespace(choices=[], usage=usage)
+
+
+class RecordingOpenAI:
+    """Wraps a real client and appends each prompt/response pair for later replay"""
+
+    def __init__(self, client: Any, recordings_path: str):
+        self._client = client
+        self._path = recordings_path
+        self._lock = threading.Lock()
+        self.chat = _Namespace(completions=_Completions(self))  # type: ignore[arg-type]
+
+    def _create(self, **kwargs: Any) -> Any:
+        response = self._client.chat.completions.create(**kwargs)
+        prompt = "\n".join(message["content"] for message in kwargs.get("messages", []))
+        key = _prompt_key(kwargs.get("model", ""), prompt)
+        if kwargs.get("stream"):
+            return _RecordingStream(response, lambda content: self._write(key, content))
+        self._write(key, response.choices[0].message.content)
+        return response
+
+    def _write(self, key: str, content: str) -> None:
+        with self._lock, open(self._path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "content": content}) + "\n")
+
+
+class _RecordingStream:
+    """Passes a stream through and records the joined content once it has been read to the end
+
+    A stream closed early (timeout, caller gave up) is not recorded, since
+    replaying a truncated completion would not reproduce the call.
+    """
+
+    def __init__(self, stream: Any, on_complete: Callable[[str], None]):
+        self._stream = stream
+        self._on_complete = on_complete
+
+    def __iter__(self) -> Iterator[Any]:
+        parts: List[str] = []
+        for chunk in self._stream:
+            if chunk.choices:
+                parts.append(chunk.choices[0].delta.content or "")
+            yield chunk
+        self._on_complete("".join(parts))
+
+    def close(self) -> None:
+        self._stream.close()
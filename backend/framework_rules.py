@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Framework Rules - Deterministic COA structure per reporting framework
+Statements, classes and classifications that Ind AS, IFRS and US GAAP prescribe
+"""
+
+import re
+from typing import Any, Dict, List, Tuple
+
+# statement key -> [(class, [classifications])]
+FrameworkLayout = Dict[str, List[Tuple[str, List[str]]]]
+
+FRAMEWORK_LAYOUTS: Dict[str, FrameworkLayout] = {
+    # Schedule III to the Companies Act, 2013 (Division II)
+    "ind_as": {
+        "statementOfFinancialPosition": [
+            ("Assets", ["Non-Current Assets", "Current Assets"]),
+            ("Equity and Liabilities", [
+                "Equity", "Non-Current Liabilities", "Current Liabilities"
+            ]),
+        ],
+        "statementOfProfitAndLoss": [
+            ("Income", ["Revenue from Operations", "Other Income"]),
+            ("Expenses", [
+                "Cost of Materials Consumed",
+                "Employee Benefits Expense",
+                "Finance Costs",
+                "Depreciation and Amortisation Expense",
+                "Other Expenses",
+                "Tax Expense",
+            ]),
+            ("Other Comprehensive Income", [
+                "Items that will not be reclassified to Profit or Loss",
+                "Items that will be reclassified to Profit or Loss",
+            ]),
+        ],
+    },
+    # IAS 1 Presentation of Financial Statements
+    "ifrs": {
+        "statementOfFinancialPosition": [
+            ("Assets", ["Non-Current Assets", "Current Assets"]),
+            ("Equity and Liabilities", [
+                "Equity", "Non-Current Liabilities", "Current Liabilities"
+            ]),
+        ],
+        "statementOfProfitAndLoss": [
+            ("Revenue", ["Revenue", "Other Income"]),
+            ("Expenses", [
+                "Cost of Sales",
+                "Distribution Costs",
+                "Administrative Expenses",
+                "Finance Costs",
+                "Income Tax Expense",
+            ]),
+            ("Other Comprehensive Income", [
+                "Items that will not be reclassified to Profit or Loss",
+                "Items that may be reclassified to Profit or Loss",
+            ]),
+        ],
+    },
+    # ASC 210 / ASC 220
+    "us_gaap": {
+        "statementOfFinancialPosition": [
+            ("Assets", ["Current Assets", "Noncurrent Assets"]),
+            ("Liabilities", ["Current Liabilities", "Long-Term Liabilities"]),
+            ("Stockholders' Equity", [
+                "Contributed Capital", "Retained Earnings",
+                "Accumulated Other Comprehensive Income"
+            ]),
+        ],
+        "statementOfProfitAndLoss": [
+            ("Revenues", ["Operating Revenues", "Other Revenues"]),
+            ("Expenses", [
+                "Cost of Goods Sold",
+                "Operating Expenses",
+                "Interest Expense",
+                "Income Tax Expense",
+            ]),
+            ("Gains and Losses", ["Other Gains", "Other Losses"]),
+        ],
+    },
+}
+
+# Statements every framework presents alongside the two structured ones
+SUPPLEMENTARY_STATEMENTS = ["statementOfCashFlows", "statementOfChangesInEquity"]
+
+# Normalized framework names -> layout key
+FRAMEWORK_ALIASES = {
+    "indas": "ind_as",
+    "ifrs": "ifrs",
+    "ifrsforsmes": "ifrs",
+    "ias": "ifrs",
+    "usgaap": "us_gaap",
+    "gaap": "us_gaap",
+}
+DEFAULT_FRAMEWORK = "ifrs"
+
+
+def resolve_framework(reporting_framework: str) -> Tuple[str, bool]:
+    """Map a free-text framework name to a layout key
+
+    Returns the key and whether it matched; unknown frameworks use IFRS.
+    """
+    normalized = re.sub(r"[^a-z]", "", (reporting_framework or "").lower())
+    if normalized in FRAMEWORK_ALIASES:
+        return FRAMEWORK_ALIASES[normalized], True
+    return DEFAULT_FRAMEWORK, False
+
+
+def derive_structure(reporting_framework: str) -> Dict[str, Any]:
+    """Statements, classes and classifications in the 5-step workflow's shapes"""
+    framework, matched = resolve_framework(reporting_framework)
+    layout = FRAMEWORK_LAYOUTS[framework]
+    statements: Dict[str, Any] = {statement: {} for statement in layout}
+    statements.update({statement: {} for statement in SUPPLEMENTARY_STATEMENTS})
+    classes = {
+        statement: [{"class": class_name} for class_name, _ in entries]
+        for statement, entries in layout.items()
+    }
+    classifications = {
+        statement: [
+            {"class": class_name, "classification": classification}
+            for class_name, names in entries
+            for classification in names
+        ]
+        for statement, entries in layout.items()
+    }
+    return {
+        "framework": framework,
+        "framework_matched": matched,
+        "statements": statements,
+        "classes": classes,
+        "classifications": classifications,
+    }
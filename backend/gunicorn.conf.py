@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Gunicorn Configuration - Multi-worker serving of production_fixed:app
+The app is imported once in the master and forked into the workers:
+
+    gunicorn -c gunicorn.conf.py production_fixed:app
+"""
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+# Import cost is paid once and module memory is shared copy-on-write between workers
+preload_app = os.getenv("WEB_PRELOAD", "true").lower() == "true"
+
+
+def when_ready(server):
+    # Objects created during the preload import never need collecting; freezing them
+    # keeps the workers' GC from touching (and so copying) those pages
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    # Pooled connections opened in the master must not be shared across processes
+    from production_fixed import engine, sqlite_writer
+
+    engine.dispose(close=False)
+    if sqlite_writer is not None:
+        sqlite_writer.engine.dispose(close=False)
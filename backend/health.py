@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Health - Startup warm-up and background-refreshed readiness/liveness status
+Probes read a snapshot that a background task keeps fresh, so they cost
+nothing and never open connections of their own.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import gauge
+
+logger = logging.getLogger(__name__)
+
+HEALTH_REFRESH_SECONDS = float(os.getenv("HEALTH_REFRESH_SECONDS", "5"))
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", "2"))
+# A snapshot older than this many refresh intervals makes the instance unready/not live
+HEALTH_STALE_INTERVALS = 3
+
+
+class HealthMonitor:
+    """Runs registered warm-up steps once and health checks periodically
+
+    A check is a blocking callable that raises on failure and may return a
+    short detail string. Critical checks gate readiness; the others are
+    reported only. A thread cannot be cancelled, so a check that timed out
+    is not started again until its previous run returns; it fails meanwhile.
+    """
+
+    def __init__(
+        self,
+        refresh_seconds: float = HEALTH_REFRESH_SECONDS,
+        check_timeout: float = HEALTH_CHECK_TIMEOUT_SECONDS
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.check_timeout = check_timeout
+        self._checks: Dict[str, Tuple[Callable[[], Any], bool]] = {}
+        self._in_flight: Dict[str, Tuple[asyncio.Future, float]] = {}
+        self._warmups: List[Tuple[str, Callable[[], Any]]] = []
+        self._tasks: List[asyncio.Task] = []
+        self.started_at = time.time()
+        self.warmed = False
+        self.warmup: Dict[str, Any] = {"status": "pending", "steps": {}}
+        self.checks: Dict[str, Dict[str, Any]] = {}
+        self.refreshed_at: Optional[float] = None
+        self._refreshed_monotonic: Optional[float] = None
+
+    def register_check(self, name: str, check: Callable[[], Any], critical: bool = True) -> None:
+        self._checks[name] = (check, critical)
+
+    def register_warmup(self, name: str, step: Callable[[], Any]) -> None:
+        self._warmups.append((name, step))
+
+    def start(self) -> None:
+        """Start the warm-up and the refresh loop without blocking startup"""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._warm_up()), loop.create_task(self._refresh_loop())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _warm_up(self) -> None:
+        self.warmup["status"] = "running"
+        started = time.perf_counter()
+        for name, step in self._warmups:
+            step_started = time.perf_counter()
+            try:
+                detail = await asyncio.to_thread(step)
+                result: Dict[str, Any] = {"ok": True}
+                if detail is not None:
+                    result["detail"] = detail
+            except Exception as e:
+                logger.warning(f"Warm-up step '{name}' failed: {str(e)}")
+                result = {"ok": False, "error": str(e)}
+            result["seconds"] = round(time.perf_counter() - step_started, 3)
+            self.warmup["steps"][name] = result
+        self.warmup["seconds"] = round(time.perf_counter() - started, 3)
+        self.warmup["status"] = "complete"
+        WARMUP_SECONDS.set(self.warmup["seconds"])
+        # Readiness still waits for a passing refresh after this
+        await self.refresh()
+        self.warmed = True
+        logger.info(f"Warm-up complete in {self.warmup['seconds']:.3f}s")
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Health refresh failed: {str(e)}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    async def _run_check(self, name: str, check: Callable[[], Any], critical: bool) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"critical": critical}
+        if name in self._in_flight:
+            stuck = time.perf_counter() - self._in_flight[name][1]
+            result.update(ok=False, error=f"previous run still in flight after {stuck:.1f}s", latency_ms=0.0)
+            return result
+        running = asyncio.ensure_future(asyncio.to_thread(check))
+        self._in_flight[name] = (running, started)
+        running.add_done_callback(lambda future: self._finished(name, future))
+        try:
+            # Shielded: on timeout the thread keeps running and stays recorded as in flight
+            detail = await asyncio.wait_for(asyncio.shield(running), self.check_timeout)
+            result["ok"] = True
+            if detail is not None:
+                result["detail"] = detail
+        except asyncio.TimeoutError:
+            result.update(ok=False, error=f"timed out after {self.check_timeout}s")
+        except Exception as e:
+            result.update(ok=False, error=str(e))
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    def _finished(self, name: str, future: asyncio.Future) -> None:
+        if self._in_flight.get(name, (None,))[0] is future:
+            del self._in_flight[name]
+        if not future.cancelled():
+            # Retrieved here so an abandoned run's error is not reported as never retrieved
+            future.exception()
+
+    async def refresh(self) -> None:
+        names = list(self._checks)
+        results = await asyncio.gather(*(
+            self._run_check(name, *self._checks[name]) for name in names
+        ))
+        self.checks = dict(zip(names, results))
+        self.refreshed_at = time.time()
+        self._refreshed_monotonic = time.monotonic()
+
+    def _snapshot_age(self) -> Optional[float]:
+        if self._refreshed_monotonic is None:
+            return None
+        return time.monotonic() - self._refreshed_monotonic
+
+    def _fresh(self) -> bool:
+        age = self._snapshot_age()
+        return age is not None and age <= self.refresh_seconds * HEALTH_STALE_INTERVALS + self.check_timeout
+
+    def is_live(self) -> bool:
+        # Stale snapshots mean the refresh loop (or the event loop) is stuck
+        return self._snapshot_age() is None or self._fresh()
+
+    def is_ready(self) -> bool:
+        return self.warmed and self._fresh() and all(
+            check["ok"] for check in self.checks.values() if check["critical"]
+        )
+
+    def status(self) -> str:
+        if not self.warmed:
+            return "starting"
+        if not self.is_ready():
+            return "unavailable"
+        return "healthy" if all(check["ok"] for check in self.checks.values()) else "degraded"
+
+    def liveness(self) -> Dict[str, Any]:
+        age = self._snapshot_age()
+        return {
+            "live": self.is_live(),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "snapshot_age_seconds": round(age, 3) if age is not None else None,
+        }
+
+    def readiness(self) -> Dict[str, Any]:
+        age = self._snapshot_age()
+        return {
+            "ready": self.is_ready(),
+            "status": self.status(),
+            "checks": self.checks,
+            "warmup": self.warmup,
+            "refreshed_at": self.refreshed_at,
+            "snapshot_age_seconds": round(age, 3) if age is not None else None,
+        }
+
+
+health_monitor = HealthMonitor()
+
+WARMUP_SECONDS = gauge("saimjr_warmup_seconds", "Duration of the startup warm-up")
+gauge(
+    "saimjr_ready", "1 when the instance is warm and its critical checks pass",
+    collect=lambda: {(): 1.0 if health_monitor.is_ready() else 0.0}
+)
+gauge(
+    "saimjr_health_check_ok", "Result of the last background health check", ["check"],
+    collect=lambda: {(name,): 1.0 if check["ok"] else 0.0 for name, check in health_monitor.checks.items()}
+)
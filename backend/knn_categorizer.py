@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+kNN Categorizer - Per-company nearest-neighbour categorization of narrations
+Past categorized transactions are embedded locally (hashed character n-gram
+TF-IDF) into a NumPy matrix; a new narration takes the similarity-weighted
+vote of its nearest neighbours, and only low-confidence ones go to the LLM.
+"""
+
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics import counter, record_cache
+
+logger = logging.getLogger(__name__)
+
+KNN_ENABLED = os.getenv("KNN_ENABLED", "true").lower() == "true"
+KNN_DIMENSIONS = int(os.getenv("KNN_DIMENSIONS", "1024"))
+KNN_NEIGHBOURS = int(os.getenv("KNN_NEIGHBOURS", "5"))
+KNN_MIN_CONFIDENCE = float(os.getenv("KNN_MIN_CONFIDENCE", "0.8"))
+# Neighbours less similar than this are unrelated narrations and do not vote
+KNN_MIN_SIMILARITY = float(os.getenv("KNN_MIN_SIMILARITY", "0.3"))
+# Most recent examples kept per company, and companies kept in memory
+KNN_MAX_EXAMPLES = int(os.getenv("KNN_MAX_EXAMPLES", "5000"))
+KNN_MAX_COMPANIES = int(os.getenv("KNN_MAX_COMPANIES", "64"))
+NGRAM_SIZES = (3, 4, 5)
+# Categories that mean "not categorized yet" and so teach nothing
+UNCONFIRMED_CATEGORIES = {"", "uncategorized", "unknown", "suspense"}
+
+KNN_PREDICTIONS = counter(
+    "saimjr_knn_predictions_total", "kNN categorizer lookups by outcome (confident/deferred/empty)", ["outcome"]
+)
+
+Example = Tuple[str, str, Optional[str]]  # description, category, account_code
+Label = Tuple[str, Optional[str]]
+# transaction id, (description, amount, transaction_type), category, account_code
+LabelledRow = Tuple[int, Tuple[str, float, str], Optional[str], Optional[str]]
+# correction id, transaction id, (description, amount, transaction_type), old label, new label
+Correction = Tuple[int, int, Tuple[str, float, str], Label, Label]
+
+
+def normalize_narration(description: str) -> str:
+    """Lower-case, collapse digit runs (cheque/UPI references) and punctuation"""
+    text = re.sub(r"\d+", "#", description.lower())
+    return " ".join(re.sub(r"[^a-z#]+", " ", text).split())
+
+
+def is_confirmed(category: Optional[str]) -> bool:
+    return category is not None and category.strip().lower() not in UNCONFIRMED_CATEGORIES
+
+
+@lru_cache(maxsize=65536)
+def _hashed_ngrams(text: str, dimensions: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct hashed n-gram buckets of a normalized narration and their counts"""
+    padded = f" {text} "
+    buckets = [
+        zlib.crc32(padded[start:start + size].encode()) % dimensions
+        for size in NGRAM_SIZES
+        for start in range(max(1, len(padded) - size + 1))
+    ]
+    return np.unique(np.asarray(buckets, dtype=np.int64), return_counts=True)
+
+
+def term_frequencies(descriptions: Sequence[str], dimensions: int = KNN_DIMENSIONS) -> np.ndarray:
+    """Sublinear (1 + log tf) hashed n-gram counts, one row per description"""
+    matrix = np.zeros((len(descriptions), dimensions), dtype=np.float32)
+    for row, description in enumerate(descriptions):
+        buckets, counts = _hashed_ngrams(normalize_narration(description), dimensions)
+        matrix[row, buckets] = 1.0 + np.log(counts)
+    return matrix
+
+
+def _l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class CompanyIndex:
+    """TF-IDF matrix of one company's categorized narrations
+
+    Examples with the same normalized narration and label are stored once,
+    with a count, so a recurring vendor costs one row however often it is
+    booked and still votes with the weight of every booking. IDF weights and
+    the normalized matrix are rebuilt lazily after changes.
+    """
+
+    def __init__(self, dimensions: int = KNN_DIMENSIONS, max_examples: int = KNN_MAX_EXAMPLES):
+        self.dimensions = dimensions
+        self.max_examples = max_examples
+        self._rows: "OrderedDict[Tuple[str, str, Optional[str]], str]" = OrderedDict()
+        self._counts: Dict[Tuple[str, str, Optional[str]], int] = {}
+        self._labels: List[Label] = []
+        self._weights: List[int] = []
+        self._idf: Optional[np.ndarray] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        # High-water marks of the transactions and corrections already applied
+        self.last_transaction_id = 0
+        self.last_correction_id = 0
+        self.sync_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, description: str, category: str, account_code: Optional[str] = None) -> None:
+        key = (normalize_narration(description), category, account_code)
+        if not key[0]:
+            return
+        with self._lock:
+            # Re-adding moves the example to the newest end, so eviction drops the stalest
+            self._rows.pop(key, None)
+            self._rows[key] = description
+            self._counts[key] = self._counts.get(key, 0) + 1
+            while len(self._rows) > self.max_examples:
+                evicted, _ = self._rows.popitem(last=False)
+                self._counts.pop(evicted, None)
+            self._matrix = None
+
+    def remove(self, description: str, category: str, account_code: Optional[str] = None) -> None:
+        """Forget one booking; the example itself goes once no booking is left"""
+        key = (normalize_narration(description), category, account_code)
+        with self._lock:
+            count = self._counts.get(key)
+            if count is None:
+                return
+            if count > 1:
+                self._counts[key] = count - 1
+            else:
+                del self._counts[key]
+                del self._rows[key]
+            self._matrix = None
+
+    def add_many(self, examples: Iterable[Example]) -> None:
+        for description, category, account_code in examples:
+            self.add(description, category, account_code)
+
+    def _build(self) -> None:
+        keys = list(self._rows)
+        self._labels = [(category, account_code) for _, category, account_code in keys]
+        self._weights = [self._counts[key] for key in keys]
+        tf = term_frequencies([self._rows[key] for key in keys], self.dimensions)
+        document_frequency = np.count_nonzero(tf, axis=0)
+        self._idf = (np.log((1.0 + len(keys)) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+        self._matrix = _l2_normalize(tf * self._idf)
+
+    def search(self, descriptions: Sequence[str], k: int = KNN_NEIGHBOURS,
+               min_similarity: float = KNN_MIN_SIMILARITY) -> List[List[Tuple[Label, float, int]]]:
+        """Top-k (label, cosine similarity, bookings) per description, one matrix product for the batch"""
+        with self._lock:
+            if not self._rows:
+                return [[] for _ in descriptions]
+            if self._matrix is None:
+                self._build()
+            matrix, idf, labels, weights = self._matrix, self._idf, self._labels, self._weights
+        queries = _l2_normalize(term_frequencies(descriptions, self.dimensions) * idf)
+        similarities = queries @ matrix.T  # type: ignore[union-attr]
+        k = min(k, similarities.shape[1])
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-similarities[row, candidates])]
+            results.append([
+                (labels[i], float(similarities[row, i]), weights[i])
+                for i in ordered if similarities[row, i] >= min_similarity
+            ])
+        return results
+
+
+def vote(neighbours: List[Tuple[Label, float, int]]) -> Optional[Dict[str, Any]]:
+    """Label vote weighted by similarity x bookings; confidence = top similarity x winning share"""
+    if not neighbours:
+        return None
+    weights: Dict[Label, float] = {}
+    for label, similarity, bookings in neighbours:
+        weights[label] = weights.get(label, 0.0) + similarity * bookings
+    label, weight = max(weights.items(), key=lambda item: item[1])
+    best_similarity = max(similarity for neighbour, similarity, _ in neighbours if neighbour == label)
+    share = weight / sum(weights.values())
+    return {
+        "category": label[0],
+        "account_code": label[1],
+        "confidence": round(best_similarity * share, 4),
+        "similarity": round(best_similarity, 4),
+        "neighbours": sum(bookings for _, _, bookings in neighbours),
+    }
+
+
+class KNNCategorizer:
+    """Per-company indexes, loaded on first use, kept in an LRU and caught up before each lookup
+
+    ``loader(company_id)`` returns the company's most recent transactions as
+    LabelledRow, newest last, and the id of its latest correction; it is only
+    called when the company is not already in memory. ``changes(company_id,
+    transaction_id, correction_id)`` returns the transactions and the
+    corrections past those ids, so each worker sees rows created and
+    corrected by the others.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[int], Tuple[List[LabelledRow], int]],
+        changes: Callable[[int, int, int], Tuple[List[LabelledRow], List[Correction]]],
+        min_confidence: float = KNN_MIN_CONFIDENCE,
+        max_companies: int = KNN_MAX_COMPANIES
+    ):
+        self.loader = loader
+        self.changes = changes
+        self.min_confidence = min_confidence
+        self.max_companies = max_companies
+        self._indexes: "OrderedDict[int, CompanyIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def index(self, company_id: int) -> CompanyIndex:
+        with self._lock:
+            index = self._indexes.get(company_id)
+            if index is not None:
+                self._indexes.move_to_end(company_id)
+        record_cache("knn_index", index is not None)
+        if index is not None:
+            return index
+
+        index = CompanyIndex()
+        rows, index.last_correction_id = self.loader(company_id)
+        self._learn(index, rows)
+        with self._lock:
+            # Another request may have loaded it meanwhile; keep the first
+            index = self._indexes.setdefault(company_id, index)
+            while len(self._indexes) > self.max_companies:
+                self._indexes.popitem(last=False)
+        logger.info(f"Loaded kNN index for company {company_id}: {len(index)} examples")
+        return index
+
+    @staticmethod
+    def _learn(index: CompanyIndex, rows: List[LabelledRow]) -> None:
+        for transaction_id, (description, _, _), category, account_code in rows:
+            if is_confirmed(category):
+                index.add(description, category, account_code)  # type: ignore[arg-type]
+            index.last_transaction_id = max(index.last_transaction_id, transaction_id)
+
+    def sync(self, company_id: int) -> CompanyIndex:
+        """The company's index, after learning new transactions and applying new corrections"""
+        index = self.index(company_id)
+        with index.sync_lock:
+            learned = index.last_transaction_id
+            rows, corrections = self.changes(company_id, index.last_transaction_id, index.last_correction_id)
+            self._learn(index, rows)
+            for correction_id, transaction_id, (description, _, _), old, new in corrections:
+                # A row learned in this same sync already carries its corrected label
+                if transaction_id <= learned:
+                    index.remove(description, *old)
+                    if is_confirmed(new[0]):
+                        index.add(description, *new)  # type: ignore[arg-type]
+                index.last_correction_id = max(index.last_correction_id, correction_id)
+        return index
+
+    def forget(self, company_id: int) -> None:
+        with self._lock:
+            self._indexes.pop(company_id, None)
+
+    def predict_many(self, company_id: int, descriptions: Sequence[str]) -> List[Optional[Dict[str, Any]]]:
+        """Confident predictions per description, None where the LLM should decide"""
+        neighbours = self.sync(company_id).search(descriptions)
+        predictions: List[Optional[Dict[str, Any]]] = []
+        for candidates in neighbours:
+            prediction = vote(candidates)
+            if prediction is None:
+                KNN_PREDICTIONS.inc(outcome="empty")
+            elif prediction["confidence"] < self.min_confidence:
+                KNN_PREDICTIONS.inc(outcome="deferred")
+                prediction = None
+            else:
+                KNN_PREDICTIONS.inc(outcome="confident")
+            predictions.append(prediction)
+        return predictions
+
+    def predict(self, company_id: int, description: str) -> Optional[Dict[str, Any]]:
+        return self.predict_many(company_id, [description])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            indexes = dict(self._indexes)
+        return {
+            "companies": len(indexes),
+            "examples": sum(len(index) for index in indexes.values()),
+            "min_confidence": self.min_confidence,
+            "dimensions": KNN_DIMENSIONS,
+        }
+
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Leader Election - One process at a time runs cluster-wide background work
+Every worker keeps trying to take or renew a named, expiring lease in the
+shared database; the one holding it is the leader. Rule mining and
+re-categorization only run there, so with several gunicorn workers that
+work (and the AI calls it makes) happens once. A leader that dies stops
+renewing and another worker takes over once the lease expires.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "30"))
+
+
+class LeaderElection:
+    """Holds, or waits for, the lease ``name``
+
+    ``hold(name, holder, seconds)`` must atomically take the lease when it is
+    free or expired, or extend it when ``holder`` already has it, and return
+    whether ``holder`` now has it. ``release(name, holder)`` hands it back
+    early. The lease is renewed every third of its length.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        hold: Callable[[str, str, float], bool],
+        release: Optional[Callable[[str, str], None]] = None,
+        seconds: float = LEADER_LEASE_SECONDS
+    ):
+        self.name = name
+        self.hold = hold
+        self.release = release
+        self.seconds = seconds
+        self.holder = ""
+        self._leader_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._leader_until
+
+    def renew(self) -> bool:
+        """Take or extend the lease once; returns whether this process leads"""
+        if not self.holder:
+            # Named after start-up, not at import: preloaded workers are forks of one process
+            self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        started = time.monotonic()
+        try:
+            held = self.hold(self.name, self.holder, self.seconds)
+        except Exception as e:
+            logger.error(f"Could not renew the {self.name} lease: {str(e)}")
+            held = False
+        was_leader = self.is_leader
+        # Counted from before the round trip, so this process never outlives the lease the database holds
+        self._leader_until = started + self.seconds if held else 0.0
+        if held and not was_leader:
+            logger.info(f"{self.holder} is now the {self.name} leader")
+        elif was_leader and not held:
+            logger.warning(f"{self.holder} lost the {self.name} lease")
+        return held
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader and self.release is not None:
+            # Hand over now rather than make the next leader wait for the lease to expire
+            self._leader_until = 0.0
+            try:
+                await asyncio.to_thread(self.release, self.name, self.holder)
+            except Exception as e:
+                logger.error(f"Could not release the {self.name} lease: {str(e)}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.to_thread(self.renew)
+            await asyncio.sleep(self.seconds / 3)
+
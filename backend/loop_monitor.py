@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Loop Monitor - Event-loop lag measurement and blocking-call detection
+A ticker coroutine measures how late the loop wakes up; a watchdog thread
+samples the loop thread's stack while it is stalled and attributes the stall
+to the route and the application call site that blocked it.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import counter, histogram
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.05"))
+LOOP_BLOCK_THRESHOLD_SECONDS = float(os.getenv("LOOP_BLOCK_THRESHOLD_SECONDS", "0.1"))
+# Distinct (route, call site) pairs kept in the report
+LOOP_REPORT_MAX_SITES = 200
+# Frames kept from each sampled stack
+STACK_DEPTH = 30
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOOP_LAG_SECONDS = histogram(
+    "saimjr_event_loop_lag_seconds", "Delay between a scheduled and actual event-loop wake-up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+LOOP_STALLS = counter(
+    "saimjr_event_loop_stalls_total", "Event-loop stalls longer than the blocking threshold", ["route"]
+)
+LOOP_BLOCKED_SECONDS = counter(
+    "saimjr_event_loop_blocked_seconds_total", "Sampled time the event loop spent blocked", ["route"]
+)
+
+
+def _frame_label(frame: traceback.FrameSummary) -> str:
+    filename = frame.filename
+    if filename.startswith(BACKEND_DIR):
+        filename = os.path.relpath(filename, BACKEND_DIR)
+    return f"{filename}:{frame.lineno} {frame.name}"
+
+
+class BlockingSite:
+    """Aggregated stalls for one (route, call site) pair"""
+
+    def __init__(self, route: str, site: str, leaf: str, stack: List[str]):
+        self.route = route
+        self.site = site
+        self.leaf = leaf
+        self.stack = stack
+        self.stalls = 0
+        self.samples = 0
+        self.blocked_seconds = 0.0
+        self.last_seen: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "route": self.route,
+            "call_site": self.site,
+            "leaf": self.leaf,
+            "stalls": self.stalls,
+            "samples": self.samples,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "last_seen": self.last_seen,
+            "stack": self.stack,
+        }
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag and samples the stack of whatever is blocking it"""
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL_SECONDS,
+        threshold: float = LOOP_BLOCK_THRESHOLD_SECONDS
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self._route_codes: Dict[Any, str] = {}
+        self._sites: Dict[Tuple[str, str], BlockingSite] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = time.monotonic()
+        self._stall_started: Optional[float] = None
+        self.max_lag = 0.0
+        self.ticks = 0
+        self.dropped_sites = 0
+
+    def register_routes(self, routes: List[Any]) -> None:
+        """Map each endpoint's code object to its route template for attribution"""
+        for route in routes:
+            endpoint = getattr(route, "endpoint", None)
+            code = getattr(endpoint, "__code__", None)
+            if code is not None:
+                self._route_codes[code] = getattr(route, "path", endpoint.__name__)
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1.0)
+            self._watchdog = None
+
+    async def _tick(self) -> None:
+        while True:
+            scheduled = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - scheduled - self.interval)
+            self._last_tick = now
+            self.ticks += 1
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            stalled_for = time.monotonic() - self._last_tick
+            if stalled_for < self.threshold + self.interval:
+                self._stall_started = None
+                continue
+            new_stall = self._stall_started != self._last_tick
+            self._stall_started = self._last_tick
+            self._sample(new_stall)
+
+    def _sample(self, new_stall: bool) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore[arg-type]
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)[-STACK_DEPTH:]
+        route = "background"
+        walker = frame
+        while walker is not None:
+            if walker.f_code in self._route_codes:
+                route = self._route_codes[walker.f_code]
+                break
+            walker = walker.f_back
+        del frame, walker
+        # Innermost frame of our own code is the call site; the leaf is what actually blocked
+        app_frames = [f for f in stack if f.filename.startswith(BACKEND_DIR) and f.filename != __file__]
+        site = _frame_label(app_frames[-1]) if app_frames else _frame_label(stack[-1])
+        leaf = _frame_label(stack[-1])
+
+        with self._lock:
+            entry = self._sites.get((route, site))
+            if entry is None:
+                if len(self._sites) >= LOOP_REPORT_MAX_SITES:
+                    self.dropped_sites += 1
+                    return
+                entry = self._sites[(route, site)] = BlockingSite(
+                    route, site, leaf, [_frame_label(f) for f in stack]
+                )
+            entry.samples += 1
+            entry.blocked_seconds += self.interval
+            entry.last_seen = time.time()
+            if new_stall:
+                entry.stalls += 1
+        LOOP_BLOCKED_SECONDS.inc(self.interval, route=route)
+        if new_stall:
+            LOOP_STALLS.inc(route=route)
+
+    def report(self, limit: int = 50) -> Dict[str, Any]:
+        with self._lock:
+            sites = sorted(self._sites.values(), key=lambda s: s.blocked_seconds, reverse=True)
+            rows = [site.to_dict() for site in sites[:limit]]
+        return {
+            "running": self._task is not None,
+            "interval_seconds": self.interval,
+            "threshold_seconds": self.threshold,
+            "ticks": self.ticks,
+            "max_lag_seconds": round(self.max_lag, 4),
+            "dropped_sites": self.dropped_sites,
+            "blocking_sites": rows,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._sites.clear()
+            self.max_lag = 0.0
+            self.dropped_sites = 0
+
+
+loop_monitor = LoopLagMonitor()
@@ -19,34 +19,61 @@ try:
     from fastapi.middleware.trustedhost import TrustedHostMiddleware  # type: ignore
     from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials  # type: ignore
     from fastapi.responses import JSONResponse  # type: ignore
-    from slowapi import Limiter, _rate_limit_exceeded_handler  # type: ignore
-    from slowapi.util import get_remote_address  # type: ignore
-    from slowapi.errors import RateLimitExceeded  # type: ignore
-    from sqlalchemy import create_engine  # type: ignore
+    from sqlalchemy import create_engine, text  # type: ignore
     from sqlalchemy.ext.declarative import declarative_base  # type: ignore
     from sqlalchemy.orm import sessionmaker, Session  # type: ignore
-    from dotenv import load_dotenv  # type: ignore
-    import jwt  # type: ignore
     from passlib.context import CryptContext  # type: ignore
-    import redis  # type: ignore
 except ImportError as e:
     print(f"Missing required dependency: {e}")
     print("Please install dependencies with: pip install -r requirements.txt")
     sys.exit(1)
 
+# Optional dependencies: the service starts without them and reports what is missing
+try:
+    from slowapi import Limiter, _rate_limit_exceeded_handler  # type: ignore
+    from slowapi.util import get_remote_address  # type: ignore
+    from slowapi.errors import RateLimitExceeded  # type: ignore
+    RATE_LIMITING_AVAILABLE = True
+except ImportError:
+    RATE_LIMITING_AVAILABLE = False
+
+try:
+    import redis  # type: ignore
+except ImportError:
+    redis = None
+
+try:
+    import jwt  # type: ignore  # PyJWT; requirements.txt ships python-jose
+except ImportError:
+    jwt = None
+
+try:
+    from dotenv import load_dotenv  # type: ignore
+except ImportError:
+    load_dotenv = None
+
+import tracing
+from health import health_monitor
+
 # Load environment variables
-load_dotenv()
+if load_dotenv is not None:
+    load_dotenv()
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    format=tracing.LOG_FORMAT,
     handlers=[
         logging.FileHandler("saimjr_backend.log"),
         logging.StreamHandler()
     ]
 )
+tracing.install_log_filter()
 logger = logging.getLogger(__name__)
+if not RATE_LIMITING_AVAILABLE:
+    logger.warning("slowapi not installed - rate limiting disabled")
+if redis is None:
+    logger.warning("redis not installed - Redis checks disabled")
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./saimjr.db")
@@ -57,8 +84,14 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+class _NoRateLimit:
+    """Stands in for slowapi's Limiter when it is not installed"""
+
+    def limit(self, *args, **kwargs):
+        return lambda endpoint: endpoint
+
 # Rate limiting configuration
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(key_func=get_remote_address) if RATE_LIMITING_AVAILABLE else _NoRateLimit()
 
 # Database setup
 engine = create_engine(DATABASE_URL)
@@ -77,6 +110,25 @@ def get_database() -> Session:
     finally:
         db.close()
 
+# Background health checks; probes read the latest snapshot
+_redis_client = None
+
+def _check_database():
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def _check_redis():
+    # One client for all checks instead of a new connection per probe
+    global _redis_client
+    if redis is None:
+        return "not_installed"
+    if _redis_client is None:
+        _redis_client = redis.from_url(REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+    _redis_client.ping()
+
+health_monitor.register_check("database", _check_database)
+health_monitor.register_check("redis", _check_redis, critical=False)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
@@ -87,15 +139,19 @@ async def lifespan(app: FastAPI):
     logger.info("Database tables created successfully")
     
     # Initialize Redis connection
-    try:
-        redis_client = redis.from_url(REDIS_URL)
-        redis_client.ping()
-        logger.info("Redis connection established")
-    except Exception as e:
-        logger.warning(f"Redis connection failed: {e}")
+    if redis is not None:
+        try:
+            redis_client = redis.from_url(REDIS_URL)
+            redis_client.ping()
+            logger.info("Redis connection established")
+        except Exception as e:
+            logger.warning(f"Redis connection failed: {e}")
+    
+    health_monitor.start()
     
     yield
     
+    await health_monitor.stop()
     logger.info("Shutting down S(ai)m Jr Backend Service...")
 
 # Create FastAPI app instance
@@ -127,23 +183,27 @@ app.add_middleware(
 
 # Add rate limiting
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+if RATE_LIMITING_AVAILABLE:
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Middleware for request tracking
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     """Add request processing time and ID headers"""
     start_time = datetime.utcnow()
-    request_id = f"req_{int(start_time.timestamp() * 1000)}"
-    
-    response = await call_next(request)
+    request_id = tracing.request_trace_id(request.headers.get("X-Request-ID"))
     
-    process_time = (datetime.utcnow() - start_time).total_seconds()
-    response.headers["X-Process-Time"] = str(process_time)
-    response.headers["X-Request-ID"] = request_id
-    
-    # Log request
-    logger.info(f"Request {request_id}: {request.method} {request.url} - {response.status_code} ({process_time:.3f}s)")
+    with tracing.span("http.request", trace_id=request_id, method=request.method, path=request.url.path) as request_span:
+        response = await call_next(request)
+        
+        process_time = (datetime.utcnow() - start_time).total_seconds()
+        response.headers["X-Process-Time"] = str(process_time)
+        response.headers["X-Request-ID"] = request_id
+        if request_span is not None:
+            request_span.set(status_code=response.status_code)
+        
+        # Log request
+        logger.info(f"Request {request_id}: {request.method} {request.url} - {response.status_code} ({process_time:.3f}s)")
     
     return response
 
@@ -190,42 +250,35 @@ async def root(request: Request):
 
 @app.get("/api/health", tags=["health"])
 @limiter.limit("30/minute")
-async def health_check(request: Request, db: Session = Depends(get_database)):
-    """Comprehensive health check"""
+async def health_check(request: Request):
+    """Comprehensive health check, served from the background health snapshot"""
     health_status = {
-        "status": "healthy",
+        "status": health_monitor.status(),
         "timestamp": datetime.utcnow().isoformat(),
         "version": "2.0.0",
         "checks": {}
     }
-    
-    # Database check
-    try:
-        db.execute("SELECT 1")
-        health_status["checks"]["database"] = "connected"
-    except Exception as e:
-        health_status["checks"]["database"] = f"error: {str(e)}"
-        health_status["status"] = "degraded"
-    
-    # Redis check
-    try:
-        redis_client = redis.from_url(REDIS_URL)
-        redis_client.ping()
-        health_status["checks"]["redis"] = "connected"
-    except Exception as e:
-        health_status["checks"]["redis"] = f"error: {str(e)}"
-        health_status["status"] = "degraded"
-    
-    # AI service check
-    try:
-        # Basic check for AI service availability
-        health_status["checks"]["ai_service"] = "available"
-    except Exception as e:
-        health_status["checks"]["ai_service"] = f"error: {str(e)}"
-        health_status["status"] = "degraded"
+    for name, check in health_monitor.checks.items():
+        if check["ok"]:
+            health_status["checks"][name] = check.get("detail", "connected")
+        else:
+            health_status["checks"][name] = f"error: {check['error']}"
+    health_status["checks"]["ai_service"] = "available"
     
     return health_status
 
+@app.get("/api/health/live", tags=["health"])
+async def liveness_probe():
+    """Liveness probe: process and background refresh loop are running"""
+    body = health_monitor.liveness()
+    return JSONResponse(status_code=200 if body["live"] else 503, content=body)
+
+@app.get("/api/health/ready", tags=["health"])
+async def readiness_probe():
+    """Readiness probe: warm-up done and critical checks passing"""
+    body = health_monitor.readiness()
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     reload = os.getenv("ENVIRONMENT", "production") == "development"
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Micro Batcher - Groups concurrent single-item requests into batched calls
+The first waiting item of a key opens a short window; everything submitted
+under that key before it closes (or until the batch is full) goes to the
+handler in one call, and each caller gets back its own result. Items with
+different keys (one company's rows and another's) never share a batch.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, Hashable, List, Sequence, Set, Tuple
+
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+CATEGORIZE_BATCH_ENABLED = os.getenv("CATEGORIZE_BATCH_ENABLED", "true").lower() == "true"
+CATEGORIZE_BATCH_WINDOW_MS = float(os.getenv("CATEGORIZE_BATCH_WINDOW_MS", "25"))
+CATEGORIZE_BATCH_MAX = int(os.getenv("CATEGORIZE_BATCH_MAX", "16"))
+
+BATCH_SIZE = histogram(
+    "saimjr_micro_batch_size", "Items per micro-batched handler call", ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+BATCH_FLUSHES = counter(
+    "saimjr_micro_batch_flushes_total", "Micro-batches sent, by what closed them (window/full/shutdown)",
+    ["batcher", "reason"]
+)
+
+
+class MicroBatcher:
+    """Collects ``submit()`` calls for ``window_seconds`` and runs them as one batch
+
+    ``handler(items)`` is blocking and runs in a worker thread; it must return
+    one result per item, in order. A handler error is raised in every caller
+    of that batch. Callers that went away (cancelled requests) are skipped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[List[Any]], Sequence[Any]],
+        window_seconds: float = CATEGORIZE_BATCH_WINDOW_MS / 1000,
+        max_items: int = CATEGORIZE_BATCH_MAX
+    ):
+        self.name = name
+        self.handler = handler
+        self.window_seconds = window_seconds
+        self.max_items = max(1, max_items)
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._batches: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any, key: Hashable = None) -> Any:
+        """The handler's result for ``item``, batched only with items submitted under the same ``key``"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((item, future))
+        if len(pending) >= self.max_items:
+            self._flush(key, "full")
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window_seconds, self._flush, key, "window")
+        return await future
+
+    def _flush(self, key: Hashable, reason: str) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = [(item, future) for item, future in self._pending.pop(key, []) if not future.done()]
+        if not batch:
+            return
+        BATCH_SIZE.observe(len(batch), batcher=self.name)
+        BATCH_FLUSHES.inc(batcher=self.name, reason=reason)
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        # The loop only keeps weak references to tasks
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await asyncio.to_thread(self.handler, [item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch handler returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            logger.error(f"Micro-batch '{self.name}' of {len(batch)} failed: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def stop(self) -> None:
+        """Send whatever is still waiting and let in-flight batches finish"""
+        for key in list(self._pending):
+            self._flush(key, "shutdown")
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Database Migrations - Creates missing tables and reports schema drift
+Run as a release step before starting the server:
+
+    python migrate.py            # create missing tables
+    python migrate.py --check    # exit 1 when tables or columns are missing
+"""
+
+import argparse
+import logging
+import sys
+from typing import Any, Dict, List
+
+from sqlalchemy import inspect  # type: ignore[import-untyped]
+
+logger = logging.getLogger(__name__)
+
+
+def schema_drift(engine: Any, metadata: Any) -> Dict[str, List[str]]:
+    """Tables and columns the models declare but the database lacks"""
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    drift: Dict[str, List[str]] = {}
+    for table in metadata.sorted_tables:
+        if table.name not in existing:
+            drift[table.name] = ["<table>"]
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column.name for column in table.columns if column.name not in columns]
+        if missing:
+            drift[table.name] = missing
+    return drift
+
+
+def migrate(engine: Any, metadata: Any) -> List[str]:
+    """Create missing tables; returns their names
+
+    New columns on existing tables are only reported, since create_all does
+    not alter tables.
+    """
+    drift = schema_drift(engine, metadata)
+    created = [name for name, columns in drift.items() if columns == ["<table>"]]
+    if created:
+        metadata.create_all(bind=engine)
+        logger.info(f"Created database tables: {', '.join(created)}")
+    for name, columns in drift.items():
+        if columns != ["<table>"]:
+            logger.warning(f"Table {name} is missing columns: {', '.join(columns)}")
+    return created
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--check", action="store_true", help="report drift without changing the database")
+    args = parser.parse_args()
+
+    from production_fixed import Base, engine
+    from search_index import search_index
+
+    if args.check:
+        drift = schema_drift(engine, Base.metadata)
+        for name, columns in drift.items():
+            print(f"{name}: missing {', '.join(columns)}")
+        return 1 if drift else 0
+    created = migrate(engine, Base.metadata)
+    search_index.install(engine)
+    print(f"Created {len(created)} tables" if created else "Schema up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Naive Bayes Classifier - Incremental per-company category model
+A multinomial Naive Bayes over narration tokens and an amount bucket,
+updated in O(new rows) from the transactions table and persisted as a
+snapshot, so categorization can skip the LLM when the model is confident.
+"""
+
+import io
+import json
+import logging
+import math
+import os
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse  # type: ignore[import-untyped]
+
+from knn_categorizer import Correction, LabelledRow, is_confirmed
+from metrics import counter, record_cache
+
+logger = logging.getLogger(__name__)
+
+NB_ENABLED = os.getenv("NB_ENABLED", "true").lower() == "true"
+NB_MIN_CONFIDENCE = float(os.getenv("NB_MIN_CONFIDENCE", "0.9"))
+# The model abstains until it has seen this many categorized transactions
+NB_MIN_EXAMPLES = int(os.getenv("NB_MIN_EXAMPLES", "20"))
+NB_SMOOTHING = float(os.getenv("NB_SMOOTHING", "0.5"))
+# Unsaved updates after which a model snapshot is written back
+NB_PERSIST_EVERY = int(os.getenv("NB_PERSIST_EVERY", "50"))
+NB_MAX_COMPANIES = int(os.getenv("NB_MAX_COMPANIES", "64"))
+
+NB_PREDICTIONS = counter(
+    "saimjr_nb_predictions_total", "Naive Bayes tier lookups by outcome (confident/deferred/untrained)", ["outcome"]
+)
+
+Label = Tuple[str, Optional[str]]  # category, account_code
+Row = Tuple[str, float, str]  # description, amount, transaction_type
+# Narrations are split into words on every ASCII character that is not a lower-case
+# letter (after lower-casing), so reference numbers and punctuation carry no weight.
+# A one-to-one ASCII table keeps str.translate on its fast path.
+WORD_BREAKS = str.maketrans({code: " " for code in range(128) if not chr(code).islower()})
+# In batches rows are joined by a padded SEPARATOR, which survives as a token of its own
+SEPARATOR = "\x00"
+BATCH_BREAKS = str.maketrans({code: " " for code in range(1, 128) if not chr(code).islower()})
+
+
+def amount_bucket(amount: float) -> int:
+    """Order of magnitude of the amount, negative amounts kept apart (odd codes)"""
+    magnitude = int(math.log10(abs(amount))) if amount else 0
+    return magnitude * 2 + (1 if amount < 0 else 0)
+
+
+def amount_buckets(amounts: np.ndarray) -> np.ndarray:
+    """amount_bucket over an array"""
+    magnitudes = np.log10(np.abs(amounts), out=np.zeros(len(amounts)), where=amounts != 0)
+    return np.trunc(magnitudes).astype(np.int64) * 2 + (amounts < 0)
+
+
+def tokenize(description: str, amount: float, transaction_type: str) -> List[str]:
+    """Narration words plus order-of-magnitude amount and type features"""
+    words = [word for word in description.lower().translate(WORD_BREAKS).split() if len(word) > 1]
+    return words + [f"amt:{amount_bucket(amount)}", f"type:{transaction_type.lower()}"]
+
+
+class NaiveBayesModel:
+    """Class and feature counts for one company
+
+    Counts only ever change by the rows being learned or unlearned; the log
+    probability matrix is recomputed from them (O(classes x vocabulary)) on
+    the first prediction after a change.
+    """
+
+    def __init__(self, smoothing: float = NB_SMOOTHING):
+        self.smoothing = smoothing
+        self.labels: List[Label] = []
+        self._label_index: Dict[Label, int] = {}
+        self.vocabulary: Dict[str, int] = {}
+        self.class_counts = np.zeros(0, dtype=np.float64)
+        self.feature_counts = np.zeros((0, 0), dtype=np.float64)
+        self.last_transaction_id = 0
+        self.last_correction_id = 0
+        self.unsaved = 0
+        self._log_prior: Optional[np.ndarray] = None
+        self._log_likelihood: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    @property
+    def examples(self) -> int:
+        return int(self.class_counts.sum())
+
+    def _label_row(self, label: Label) -> int:
+        row = self._label_index.get(label)
+        if row is None:
+            row = self._label_index[label] = len(self.labels)
+            self.labels.append(label)
+            self.class_counts = np.append(self.class_counts, 0.0)
+            self.feature_counts = np.vstack([self.feature_counts, np.zeros((1, self.feature_counts.shape[1]))])
+        return row
+
+    def _feature_columns(self, tokens: Sequence[str]) -> List[int]:
+        columns = []
+        for token in tokens:
+            column = self.vocabulary.get(token)
+            if column is None:
+                column = self.vocabulary[token] = len(self.vocabulary)
+            columns.append(column)
+        width = len(self.vocabulary)
+        if width > self.feature_counts.shape[1]:
+            # Grow geometrically so adding words stays amortized O(1) per row
+            grown = np.zeros((self.feature_counts.shape[0], max(width, 2 * self.feature_counts.shape[1])))
+            grown[:, :self.feature_counts.shape[1]] = self.feature_counts
+            self.feature_counts = grown
+        return columns
+
+    def update(self, rows: Iterable[Tuple[Row, Label]], weight: float = 1.0) -> int:
+        """Add (weight=1) or remove (weight=-1) labelled rows; returns rows applied"""
+        applied = 0
+        with self._lock:
+            for (description, amount, transaction_type), label in rows:
+                row = self._label_row(label)
+                columns = self._feature_columns(tokenize(description, amount, transaction_type))
+                np.add.at(self.feature_counts[row], columns, weight)
+                self.class_counts[row] += weight
+                if weight < 0:
+                    # Unlearning a row the model never saw must not leave negative counts
+                    self.feature_counts[row, columns] = np.maximum(self.feature_counts[row, columns], 0.0)
+                    self.class_counts[row] = max(self.class_counts[row], 0.0)
+                applied += 1
+            if applied:
+                self.unsaved += applied
+                self._log_likelihood = None
+        return applied
+
+    def _log_probabilities(self) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if self._log_likelihood is None:
+                width = len(self.vocabulary)
+                counts = self.feature_counts[:, :width] + self.smoothing
+                self._log_likelihood = np.log(counts) - np.log(counts.sum(axis=1, keepdims=True))
+                self._log_prior = np.log(self.class_counts + 1.0) - np.log(self.class_counts.sum() + len(self.labels))
+            return self._log_prior, self._log_likelihood  # type: ignore[return-value]
+
+    def _token_columns(self, tokens: Sequence[str], vocabulary: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """Vocabulary column per token, -1 for unseen tokens"""
+        return np.fromiter(
+            map((vocabulary or self.vocabulary).get, tokens, itertools.repeat(-1)), dtype=np.int64, count=len(tokens)
+        )
+
+    def _features(self, rows: Sequence[Row]) -> Tuple[np.ndarray, np.ndarray]:
+        """(row, column) index pairs of every known feature in the batch"""
+        joiner = f" {SEPARATOR} "
+        descriptions = joiner.join(description for description, _, _ in rows)
+        if descriptions.count(SEPARATOR) != len(rows) - 1:
+            descriptions = joiner.join(description.replace(SEPARATOR, " ") for description, _, _ in rows)
+        # One translate and split over the whole batch; separators mark where each row starts
+        tokens = descriptions.lower().translate(BATCH_BREAKS).split()
+        columns = self._token_columns(tokens, {**self.vocabulary, SEPARATOR: -2})
+        row_of_token = np.cumsum(columns == -2)
+        known = columns >= 0
+        row_index, column_index = [row_of_token[known]], [columns[known]]
+
+        # Amount and type features take few distinct values: look each one up once
+        amounts = np.fromiter((amount for _, amount, _ in rows), dtype=np.float64, count=len(rows))
+        types = [transaction_type.lower() for _, _, transaction_type in rows]
+        for prefix, values in (("amt", amount_buckets(amounts).tolist()), ("type", types)):
+            distinct = {value: index for index, value in enumerate(dict.fromkeys(values))}
+            distinct_columns = self._token_columns([f"{prefix}:{value}" for value in distinct])
+            feature_columns = distinct_columns[np.fromiter(map(distinct.__getitem__, values), dtype=np.int64)]
+            known_rows = np.flatnonzero(feature_columns >= 0)
+            row_index.append(known_rows)
+            column_index.append(feature_columns[known_rows])
+        return np.concatenate(row_index), np.concatenate(column_index)
+
+    def predict_many(self, rows: Sequence[Row]) -> Tuple[np.ndarray, np.ndarray]:
+        """Best label index and its posterior probability per row, scored as one batch"""
+        if not self.labels or not rows:
+            return np.full(len(rows), -1), np.zeros(len(rows))
+        log_prior, log_likelihood = self._log_probabilities()
+        row_index, column_index = self._features(rows)
+        # Feature counts as a sparse row x vocabulary matrix: one product scores every row against every class
+        counts = sparse.csr_matrix(
+            (np.ones(len(row_index)), (row_index, column_index)), shape=(len(rows), log_likelihood.shape[1])
+        )
+        scores = np.asarray(counts @ log_likelihood.T)
+        scores += log_prior
+        best = scores.argmax(axis=1)
+        # Shifted so the best class scores exp(0) = 1, its posterior is 1 / the row's sum (exp in place)
+        scores -= scores[np.arange(len(rows)), best][:, None]
+        np.exp(scores, out=scores)
+        return best, 1.0 / scores.sum(axis=1)
+
+    def to_bytes(self) -> bytes:
+        width = len(self.vocabulary)
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            class_counts=self.class_counts,
+            feature_counts=self.feature_counts[:, :width],
+            vocabulary=np.array(sorted(self.vocabulary, key=self.vocabulary.__getitem__)),
+            labels=np.array([json.dumps(self.labels)]),
+            last_correction_id=np.array(self.last_correction_id),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, last_transaction_id: int) -> "NaiveBayesModel":
+        model = cls()
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            model.labels = [(category, code) for category, code in json.loads(str(arrays["labels"][0]))]
+            model.class_counts = arrays["class_counts"].astype(np.float64)
+            model.feature_counts = arrays["feature_counts"].astype(np.float64)
+            model.vocabulary = {str(token): column for column, token in enumerate(arrays["vocabulary"])}
+            # Snapshots from before the corrections log have no corrections to skip
+            if "last_correction_id" in arrays.files:
+                model.last_correction_id = int(arrays["last_correction_id"])
+        model._label_index = {label: row for row, label in enumerate(model.labels)}
+        model.last_transaction_id = last_transaction_id
+        return model
+
+
+class ModelStore(Protocol):
+    """Where snapshots live and where new labelled rows and corrections come from"""
+
+    def load(self, company_id: int) -> Optional[Tuple[bytes, int]]: ...
+
+    def save(self, company_id: int, state: bytes, last_transaction_id: int, examples: int) -> None: ...
+
+    def changes(
+        self, company_id: int, transaction_id: int, correction_id: int
+    ) -> Tuple[List[LabelledRow], List[Correction]]: ...
+
+
+class CategoryClassifier:
+    """Per-company models kept in an LRU and caught up with new transactions and corrections
+
+    ``sync`` learns every transaction and replays every correction past the
+    model's two high-water marks, so each worker sees rows created and
+    corrected by the others. A snapshot carries both marks, so whichever
+    worker saves last, a model loaded from it catches up on the rest.
+    """
+
+    def __init__(self, store: ModelStore, min_confidence: float = NB_MIN_CONFIDENCE,
+                 min_examples: int = NB_MIN_EXAMPLES, max_companies: int = NB_MAX_COMPANIES):
+        self.store = store
+        self.min_confidence = min_confidence
+        self.min_examples = min_examples
+        self.max_companies = max_companies
+        self._models: "OrderedDict[int, NaiveBayesModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sync_locks: Dict[int, threading.Lock] = {}
+
+    def _load(self, company_id: int) -> NaiveBayesModel:
+        with self._lock:
+            model = self._models.get(company_id)
+            if model is not None:
+                self._models.move_to_end(company_id)
+        record_cache("nb_model", model is not None)
+        if model is not None:
+            return model
+        snapshot = self.store.load(company_id)
+        model = NaiveBayesModel.from_bytes(*snapshot) if snapshot else NaiveBayesModel()
+        with self._lock:
+            model = self._models.setdefault(company_id, model)
+            while len(self._models) > self.max_companies:
+                evicted_id, evicted = self._models.popitem(last=False)
+                self._persist(evicted_id, evicted)
+        return model
+
+    def sync(self, company_id: int) -> NaiveBayesModel:
+        """The company's model, after learning any transactions it has not seen"""
+        model = self._load(company_id)
+        with self._lock:
+            sync_lock = self._sync_locks.setdefault(company_id, threading.Lock())
+        with sync_lock:
+            learned = model.last_transaction_id
+            rows, corrections = self.store.changes(company_id, model.last_transaction_id, model.last_correction_id)
+            if rows:
+                model.update(
+                    (row, (category, account_code))  # type: ignore[misc]
+                    for _, row, category, account_code in rows if is_confirmed(category)
+                )
+                model.last_transaction_id = max(transaction_id for transaction_id, *_ in rows)
+            if corrections:
+                # A row learned in this same sync already carries its corrected label
+                replayed = [correction for correction in corrections if correction[1] <= learned]
+                model.update(((row, old) for _, _, row, old, _ in replayed if is_confirmed(old[0])), weight=-1.0)
+                model.update((row, new) for _, _, row, _, new in replayed if is_confirmed(new[0]))
+                model.last_correction_id = max(correction_id for correction_id, *_ in corrections)
+            if model.unsaved >= NB_PERSIST_EVERY:
+                self._persist(company_id, model)
+        return model
+
+    def predict_many(self, company_id: int, rows: Sequence[Row]) -> List[Optional[Dict[str, Any]]]:
+        """Confident predictions per row, None where a later tier should decide"""
+        model = self.sync(company_id)
+        if model.examples < self.min_examples:
+            NB_PREDICTIONS.inc(len(rows), outcome="untrained")
+            return [None] * len(rows)
+        best, probabilities = model.predict_many(rows)
+        predictions: List[Optional[Dict[str, Any]]] = []
+        for label_row, probability in zip(best.tolist(), probabilities.tolist()):
+            if probability < self.min_confidence:
+                NB_PREDICTIONS.inc(outcome="deferred")
+                predictions.append(None)
+                continue
+            NB_PREDICTIONS.inc(outcome="confident")
+            category, account_code = model.labels[label_row]
+            predictions.append({
+                "category": category,
+                "account_code": account_code,
+                "confidence": round(probability, 4),
+                "examples": model.examples,
+            })
+        return predictions
+
+    def predict(self, company_id: int, row: Row) -> Optional[Dict[str, Any]]:
+        return self.predict_many(company_id, [row])[0]
+
+    def _persist(self, company_id: int, model: NaiveBayesModel) -> None:
+        if not model.unsaved:
+            return
+        try:
+            self.store.save(company_id, model.to_bytes(), model.last_transaction_id, model.examples)
+            model.unsaved = 0
+        except Exception as e:
+            logger.error(f"Failed to save category model for company {company_id}: {str(e)}")
+
+    def flush(self) -> int:
+        """Save every model with unsaved updates; returns how many were written"""
+        with self._lock:
+            models = list(self._models.items())
+        dirty = [(company_id, model) for company_id, model in models if model.unsaved]
+        for company_id, model in dirty:
+            self._persist(company_id, model)
+        return len(dirty)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = dict(self._models)
+        return {
+            "companies": len(models),
+            "examples": sum(model.examples for model in models.values()),
+            "labels": sum(len(model.labels) for model in models.values()),
+            "min_confidence": self.min_confidence,
+            "min_examples": self.min_examples,
+        }
@@ -3,34 +3,60 @@
 Fixed Production Backend with All Critical Issues Resolved
 """
 
+import time
+
+_import_started = time.perf_counter()
+
 import os
 import logging
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+import uuid
+from typing import Optional, Dict, Any, List, Callable, Set, Tuple
 import asyncio
+from contextlib import asynccontextmanager
 import uvicorn  # type: ignore[import-untyped]
-from fastapi import FastAPI, HTTPException, Depends, status, Form, UploadFile, File  # type: ignore[import-untyped]
+from fastapi import FastAPI, HTTPException, Depends, Request, status, Form, UploadFile, File  # type: ignore[import-untyped]
 from fastapi.middleware.cors import CORSMiddleware  # type: ignore[import-untyped]
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordBearer, OAuth2PasswordRequestForm  # type: ignore[import-untyped]
-from fastapi.responses import JSONResponse  # type: ignore[import-untyped]
+from fastapi.responses import JSONResponse, PlainTextResponse  # type: ignore[import-untyped]
 from pydantic import BaseModel, Field  # type: ignore[import-untyped]
 from jose import jwt  # type: ignore[import-untyped]
 from passlib.context import CryptContext  # type: ignore[import-untyped]
 import httpx  # type: ignore[import-untyped]
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, Float, JSON, ForeignKey  # type: ignore[import-untyped]
+from sqlalchemy import create_engine, text, Column, Integer, String, DateTime, Text, Boolean, Float, JSON, ForeignKey, LargeBinary, UniqueConstraint, case, exists, func, insert, literal, null, or_, select, union_all, update  # type: ignore[import-untyped]
+from sqlalchemy.exc import IntegrityError  # type: ignore[import-untyped]
 from sqlalchemy.ext.declarative import declarative_base  # type: ignore[import-untyped]
 from sqlalchemy.orm import sessionmaker, Session, relationship  # type: ignore[import-untyped]
-from sqlalchemy.pool import StaticPool  # type: ignore[import-untyped]
 import json
 
+import metrics
+import tracing
+from loop_monitor import LOOP_MONITOR_ENABLED, loop_monitor
+from profiler import ProfilerBusy, memory_snapshots, sampling_profiler
+from migrate import migrate
+from health import health_monitor
+from sqlite_mode import SQLITE_WRITE_QUEUE, SQLiteWriteQueue, create_sqlite_engine, is_memory_url
+from knn_categorizer import KNN_ENABLED, KNN_MAX_EXAMPLES, KNNCategorizer
+from nb_classifier import NB_ENABLED, CategoryClassifier
+from rule_mining import RULE_MINING_ENABLED, rule_book
+from micro_batcher import CATEGORIZE_BATCH_ENABLED, CATEGORIZE_BATCH_MAX, MicroBatcher
+from balance_check import verify_running_balance
+from counterparty import COUNTERPARTY_ON_IMPORT, ContactIndex, extract_counterparty, name_key, suggest_contacts
+from search_index import SOURCES as SEARCH_KINDS, search_index
+from recategorization import RECATEGORIZE_ENABLED, Recategorizer, chart_changes
+from leader_election import LeaderElection
+from reconciliation import RECON_SPLIT_MAX_PARTS, RECON_WINDOW_DAYS, RECONCILE_ON_IMPORT, Entry, direction, reconcile
+from statement_import import StatementParseError, chunks, date_range, parse_statement_csv, row_fingerprints
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Import the fixed AI generator
 ai_generator: Optional[Any] = None
 try:
-    from ai_chart_generator import AIChartGenerator  # type: ignore[import-untyped]
-    ai_generator = AIChartGenerator()
+    from ai_chart_generator import GENERATION_MODES, get_ai_generator  # type: ignore[import-untyped]
+    # Shared with the module-level wrappers; the OpenAI client is created on first call
+    ai_generator = get_ai_generator()
     AI_AVAILABLE = True
 except ImportError:
     logger.error("AI Chart Generator not available - using fallback")
@@ -41,24 +67,28 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./saimjr_accounting.db")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+# Create missing tables at startup; defaults on only for local SQLite, elsewhere run migrate.py
+DB_AUTO_MIGRATE = os.getenv(
+    "DB_AUTO_MIGRATE", "true" if DATABASE_URL.startswith("sqlite") else "false"
+).lower() == "true"
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging, with the request's trace ID on every line
+tracing.configure_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Database setup with connection pooling
+sqlite_writer: Optional[SQLiteWriteQueue] = None
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        DATABASE_URL, 
-        connect_args={"check_same_thread": False}, 
-        poolclass=StaticPool,
-        echo=False
-    )
+    # WAL with a pool of read connections; small inserts are grouped by a single writer
+    engine = create_sqlite_engine(DATABASE_URL)
+    if SQLITE_WRITE_QUEUE and not is_memory_url(DATABASE_URL):
+        sqlite_writer = SQLiteWriteQueue(create_sqlite_engine(DATABASE_URL, writer=True))
 else:
     engine = create_engine(
         DATABASE_URL, 
@@ -68,7 +98,33 @@ else:
         max_overflow=20
     )
 
+tracing.instrument_engine(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Request, DB pool and categorization metrics served at /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "saimjr_http_request_seconds", "Request latency per route template", ["method", "route"]
+)
+HTTP_REQUESTS = metrics.counter(
+    "saimjr_http_requests_total", "Requests per route template and status", ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = metrics.gauge("saimjr_http_requests_in_flight", "Requests currently being served")
+DB_CHECKOUT_SECONDS = metrics.histogram(
+    "saimjr_db_pool_checkout_seconds", "Wait for a pooled DB connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0)
+)
+metrics.gauge(
+    "saimjr_db_pool_checked_out", "DB connections currently checked out",
+    collect=lambda: {(): float(engine.pool.checkedout())} if hasattr(engine.pool, "checkedout") else {}
+)
+STARTUP_SECONDS = metrics.gauge(
+    "saimjr_startup_seconds", "Cold-start time per phase (module import, lifespan startup)", ["phase"]
+)
+CATEGORIZATION_RESULTS = metrics.counter(
+    "saimjr_categorization_results_total", "Transaction categorizations by method", ["method"]
+)
 Base = declarative_base()
 
 # Enhanced Database Models with Foreign Keys
@@ -86,6 +142,7 @@ class User(Base):
     
     # Relationships
     companies = relationship("Company", back_populates="owner")
+    company_profiles = relationship("CompanyProfile", back_populates="owner")
 
 class CompanyProfile(Base):
     __tablename__ = "company_profiles"
@@ -106,7 +163,7 @@ class CompanyProfile(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    owner = relationship("User", back_populates="companies")
+    owner = relationship("User", back_populates="company_profiles")
     chart_of_accounts = relationship("ChartOfAccount", back_populates="company")
     contacts = relationship("Contact", back_populates="company")
     bank_statements = relationship("BankStatement", back_populates="company")
@@ -126,7 +183,7 @@ class Company(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    owner = relationship("User")
+    owner = relationship("User", back_populates="companies")
 
 class ChartOfAccount(Base):
     __tablename__ = "chart_of_accounts"
@@ -180,6 +237,7 @@ class BankStatement(Base):
     # Relationships
     company = relationship("CompanyProfile", back_populates="bank_statements")
     raw_transactions = relationship("RawTransaction", back_populates="bank_statement")
+    validation = relationship("StatementValidation", back_populates="bank_statement", uselist=False)
 
 class RawTransaction(Base):
     __tablename__ = "raw_transactions"
@@ -196,11 +254,49 @@ class RawTransaction(Base):
     # Relationships
     bank_statement = relationship("BankStatement", back_populates="raw_transactions")
 
+class StatementValidation(Base):
+    """Latest running-balance check of a bank statement"""
+    __tablename__ = "statement_validations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    bank_statement_id = Column(Integer, ForeignKey("bank_statements.id"), unique=True, nullable=False)
+    status = Column(String(20), nullable=False)  # ok, breaks, unchecked
+    rows_checked = Column(Integer, default=0)
+    breaks = Column(Integer, default=0)
+    inferred_directions = Column(Integer, default=0)
+    report = Column(JSON)
+    checked_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    bank_statement = relationship("BankStatement", back_populates="validation")
+
+class StatementRowHash(Base):
+    """Import dedup index: the fingerprint of every imported statement row"""
+    __tablename__ = "statement_row_hashes"
+    __table_args__ = (UniqueConstraint("company_id", "fingerprint"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("company_profiles.id"), nullable=False)
+    fingerprint = Column(String(32), nullable=False)
+    raw_transaction_id = Column(Integer, ForeignKey("raw_transactions.id"), nullable=False)
+
+class ReconciliationMatch(Base):
+    """Link between an imported bank row and a booked transaction; a split's links share match_group"""
+    __tablename__ = "reconciliation_matches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("company_profiles.id"), nullable=False, index=True)
+    match_group = Column(String(32), nullable=False, index=True)
+    kind = Column(String(20), nullable=False)  # one_to_one, split_book, split_bank
+    raw_transaction_id = Column(Integer, ForeignKey("raw_transactions.id"), nullable=False, index=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False, index=True)
+    score = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Transaction(Base):
     __tablename__ = "transactions"
     
     id = Column(Integer, primary_key=True, index=True)
-    company_id = Column(Integer, ForeignKey("company_profiles.id"), nullable=False)
+    company_id = Column(Integer, ForeignKey("company_profiles.id"), nullable=False, index=True)
     contact_id = Column(Integer, ForeignKey("contacts.id"))
     chart_account_id = Column(Integer, ForeignKey("chart_of_accounts.id"))
     description = Column(String(500), nullable=False)
@@ -211,10 +307,76 @@ class Transaction(Base):
     date = Column(DateTime, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class CategoryCorrection(Base):
+    """A user's change to a transaction's category, in the order the local categorizers replay them"""
+    __tablename__ = "category_corrections"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("company_profiles.id"), nullable=False, index=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False)
+    description = Column(String(500), nullable=False)
+    amount = Column(Float, nullable=False)
+    transaction_type = Column(String(50), nullable=False)
+    old_category = Column(String(100))
+    old_account_code = Column(String(20))
+    new_category = Column(String(100))
+    new_account_code = Column(String(20))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CategoryModel(Base):
+    """Snapshot of a company's Naive Bayes category model"""
+    __tablename__ = "category_models"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("company_profiles.id"), unique=True, nullable=False)
+    state = Column(LargeBinary, nullable=False)
+    # Every transaction up to this id has been learned into the snapshot
+    last_transaction_id = Column(Integer, default=0)
+    examples = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ProcessLease(Base):
+    """Expiring lease naming the worker process that runs a piece of cluster-wide background work"""
+    __tablename__ = "process_leases"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), unique=True, nullable=False)
+    holder = Column(String(100), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class RuleSnapshot(Base):
+    """The latest mined categorization rules, published by the mining process for the other workers"""
+    __tablename__ = "rule_snapshots"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    mined_at = Column(Float, nullable=False)
+    rules = Column(JSON, nullable=False)
+    report = Column(JSON, nullable=False)
+
+class RecategorizationJob(Base):
+    """A queued, running or finished incremental re-categorization"""
+    __tablename__ = "recategorization_jobs"
+    
+    id = Column(String(32), primary_key=True)
+    company_id = Column(Integer, ForeignKey("company_profiles.id"), index=True)  # None: global rules changed
+    reasons = Column(JSON, nullable=False)
+    patterns = Column(JSON, nullable=False)
+    remap = Column(JSON, nullable=False)
+    removed = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, index=True)  # queued, running, complete, failed
+    holder = Column(String(100))
+    total = Column(Integer)
+    done = Column(Integer, default=0)
+    changed = Column(Integer, default=0)
+    error = Column(Text)
+    submitted_at = Column(Float, nullable=False)
+    started_at = Column(Float)
+    finished_at = Column(Float)
+
 # Pydantic Models
 class UserCreate(BaseModel):
     username: str = Field(..., min_length=3, max_length=50)
-    email: str = Field(..., regex=r'^[^@]+@[^@]+\.[^@]+$')
+    email: str = Field(..., pattern=r'^[^@]+@[^@]+\.[^@]+$')
     password: str = Field(..., min_length=6)
 
 class UserResponse(BaseModel):
@@ -293,6 +455,16 @@ class TransactionRequest(BaseModel):
     description: str
     amount: float
     transaction_type: str = "expense"
+    # Lets the company's own categorization history answer before the AI
+    company_id: Optional[int] = None
+
+class TransactionCorrection(BaseModel):
+    category: str
+    account_code: Optional[str] = None
+
+class ChartCodeMapping(BaseModel):
+    # old account code -> code in the current chart
+    mapping: Dict[str, str]
 
 class TransactionCreate(BaseModel):
     company_id: int
@@ -301,6 +473,8 @@ class TransactionCreate(BaseModel):
     transaction_type: str
     category: str
     account_code: Optional[str] = None
+    # Booking date; defaults to now, and is what reconciliation matches statement dates against
+    date: Optional[datetime] = None
 
 class ContactCreate(BaseModel):
     name: str
@@ -322,13 +496,120 @@ class ContactResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Startup warm-up and background health checks
+def _check_database():
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def _check_ai_client():
+    if not AI_AVAILABLE or ai_generator is None:
+        return "fallback_mode"
+    return "available" if ai_generator.client_ready else "not_initialized"  # type: ignore[union-attr]
+
+def _warm_db_pool():
+    """Open the pool's steady-state connections up front"""
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    connections = [engine.connect() for _ in range(size)]
+    for conn in connections:
+        conn.execute(text("SELECT 1"))
+        conn.close()
+    return f"{size} connections"
+
+def _warm_orm_statements():
+    """Compile the hot ORM queries into SQLAlchemy's statement cache"""
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.username == "").first()
+        db.query(CompanyProfile).filter(CompanyProfile.id == 0, CompanyProfile.owner_id == 0).first()
+        db.query(Contact).filter(Contact.company_id == 0).all()
+        db.query(ChartOfAccount).filter(ChartOfAccount.company_id == 0).first()
+    finally:
+        db.close()
+
+def _warm_rule_tables():
+    """Build each framework structure and load the prompt tokenizers"""
+    from framework_rules import FRAMEWORK_LAYOUTS, derive_structure
+    from prompt_builder import count_tokens
+    from ai_chart_generator import TIER_MODELS  # type: ignore[import-untyped]
+    for framework in FRAMEWORK_LAYOUTS:
+        derive_structure(framework)
+    for model in set(TIER_MODELS.values()):
+        count_tokens("warm-up", model)
+    return f"{len(FRAMEWORK_LAYOUTS)} frameworks"
+
+def _warm_password_hashing():
+    # passlib selects and self-tests the bcrypt backend on first use
+    pwd_context.verify("warm-up", pwd_context.hash("warm-up"))
+
+def _warm_rule_mining():
+    """Load the published categorization rules so the first requests already skip the AI
+    
+    Mining is left to rule_book's background task, which the leader starts
+    right away when there is nothing to load; readiness never waits for it.
+    """
+    if not rule_book.restore() and rule_book.report.get("status") != "complete":
+        return "mining in the background" if background_leader.is_leader else "waiting for the leader's rules"
+    report = rule_book.report
+    return f"{report['company_rules']} company rules, {len(report['global_rules'])} global rules"
+
+def _warm_ai_client():
+    if AI_AVAILABLE and ai_generator is not None:
+        ai_generator.openai_client  # type: ignore[union-attr]
+
+health_monitor.register_check("database", _check_database)
+health_monitor.register_check("ai_client", _check_ai_client, critical=False)
+health_monitor.register_warmup("db_pool", _warm_db_pool)
+health_monitor.register_warmup("orm_statements", _warm_orm_statements)
+health_monitor.register_warmup("rule_tables", _warm_rule_tables)
+health_monitor.register_warmup("password_hashing", _warm_password_hashing)
+health_monitor.register_warmup("ai_client", _warm_ai_client)
+if RULE_MINING_ENABLED:
+    health_monitor.register_warmup("rule_mining", _warm_rule_mining)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan manager"""
+    started = time.perf_counter()
+    if DB_AUTO_MIGRATE:
+        await asyncio.to_thread(migrate, engine, Base.metadata)
+        await asyncio.to_thread(search_index.install, engine)
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.register_routes(app.routes)
+        loop_monitor.start()
+    # Settled before rule_book starts, which only mines rules in the leader
+    await asyncio.to_thread(background_leader.renew)
+    background_leader.start()
+    # Warm-up runs in the background; /health/ready reports 503 until it is done
+    health_monitor.start()
+    if RULE_MINING_ENABLED:
+        rule_book.start()
+    if recategorizer is not None:
+        recategorizer.start()
+    startup_seconds = time.perf_counter() - started
+    STARTUP_SECONDS.set(startup_seconds, phase="lifespan")
+    logger.info(f"Startup complete: import {IMPORT_SECONDS:.3f}s, lifespan {startup_seconds:.3f}s")
+    yield
+    await health_monitor.stop()
+    await loop_monitor.stop()
+    await rule_book.stop()
+    if recategorizer is not None:
+        await recategorizer.stop()
+    await background_leader.stop()
+    if categorize_batcher is not None:
+        await categorize_batcher.stop()
+    if category_classifier is not None:
+        await asyncio.to_thread(category_classifier.flush)
+    if sqlite_writer is not None:
+        await asyncio.to_thread(sqlite_writer.close)
+
 # FastAPI app
 app = FastAPI(
     title="Saim Jr Accounting MCP Server",
     description="Production-ready backend with 5-stage AI workflow",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Enhanced CORS middleware
@@ -336,19 +617,98 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"] if "*" in CORS_ORIGINS else CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
     expose_headers=["*"]
 )
 
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """Request span, X-Request-ID propagation and route metrics"""
+    trace_id = tracing.request_trace_id(request.headers.get("X-Request-ID"))
+    if METRICS_ENABLED:
+        HTTP_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status_code = 500
+    with tracing.span("http.request", trace_id=trace_id, method=request.method,
+                      path=request.url.path) as request_span:
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            response.headers["X-Request-ID"] = trace_id
+            return response
+        finally:
+            # Label by route template so path parameters don't explode the series count
+            route = request.scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            if request_span is not None:
+                request_span.set(route=route_path, status_code=status_code)
+                if status_code >= 500:
+                    request_span.status = "error"
+            if METRICS_ENABLED:
+                HTTP_IN_FLIGHT.dec()
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, method=request.method, route=route_path
+                )
+                HTTP_REQUESTS.inc(method=request.method, route=route_path, status=str(status_code))
+
 # Database dependency
 def get_db():
     db = SessionLocal()
     try:
+        if METRICS_ENABLED:
+            # Check the connection out up front so the pool wait is measured on its own
+            started = time.perf_counter()
+            db.connection()
+            DB_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
         yield db
     finally:
         db.close()
 
+async def insert_row(db: Session, row: Any) -> Any:
+    """Insert a new row and return it loaded; on SQLite this goes through the writer queue"""
+    if sqlite_writer is not None:
+        # Hand the read connection back first: requests parked here must not starve
+        # the pool for work (possibly on the event loop) that completes their future
+        db.close()
+        return await asyncio.wrap_future(sqlite_writer.add(row))
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    return row
+
+async def run_write(db: Session, apply: Callable[[Session], Any]) -> Any:
+    """Run ``apply(session)`` in one committed transaction; on SQLite through the writer queue"""
+    if sqlite_writer is not None:
+        db.close()
+        return await asyncio.wrap_future(sqlite_writer.submit(apply))
+    try:
+        result = apply(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+def run_write_sync(apply: Callable[[Session], Any]) -> Any:
+    """Blocking run_write for worker threads and stores; never call it from inside a write job
+    
+    ``apply`` must return plain values, not ORM objects, which are detached
+    once the session closes.
+    """
+    if sqlite_writer is not None:
+        return sqlite_writer.submit(apply).result()
+    db = SessionLocal()
+    try:
+        result = apply(db)
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 # Enhanced Authentication utilities
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -376,6 +736,194 @@ def get_current_user(db: Session = Depends(get_db), username: str = Depends(veri
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+def get_current_admin(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+def _load_knn_examples(company_id: int):
+    """A company's most recent transactions, oldest first, and its latest category correction id"""
+    db = SessionLocal()
+    try:
+        # The correction mark is read first: a correction committed in between is replayed, which is harmless
+        last_correction_id = db.query(func.max(CategoryCorrection.id)).filter(
+            CategoryCorrection.company_id == company_id
+        ).scalar() or 0
+        rows = db.query(
+            Transaction.id, Transaction.description, Transaction.amount, Transaction.transaction_type,
+            Transaction.category, Transaction.account_code
+        ).filter(
+            Transaction.company_id == company_id
+        ).order_by(Transaction.id.desc()).limit(KNN_MAX_EXAMPLES).all()
+    finally:
+        db.close()
+    return [
+        (row.id, (row.description, row.amount, row.transaction_type), row.category, row.account_code)
+        for row in reversed(rows)
+    ], last_correction_id
+
+def _load_label_changes(company_id: int, transaction_id: int, correction_id: int):
+    """A company's transactions after ``transaction_id`` and category corrections after ``correction_id``
+
+    Both come from one statement, so every correction committed before a
+    transaction was read is already part of that transaction's label.
+    """
+    new_rows = select(
+        literal("transaction").label("kind"), Transaction.id, Transaction.id.label("transaction_id"),
+        Transaction.description, Transaction.amount, Transaction.transaction_type,
+        null().label("old_category"), null().label("old_account_code"),
+        Transaction.category, Transaction.account_code
+    ).where(Transaction.company_id == company_id, Transaction.id > transaction_id)
+    corrections = select(
+        literal("correction"), CategoryCorrection.id, CategoryCorrection.transaction_id,
+        CategoryCorrection.description, CategoryCorrection.amount, CategoryCorrection.transaction_type,
+        CategoryCorrection.old_category, CategoryCorrection.old_account_code,
+        CategoryCorrection.new_category, CategoryCorrection.new_account_code
+    ).where(CategoryCorrection.company_id == company_id, CategoryCorrection.id > correction_id)
+    db = SessionLocal()
+    try:
+        result = db.execute(union_all(new_rows, corrections).order_by("id")).all()
+    finally:
+        db.close()
+    rows, changes = [], []
+    for row in result:
+        values = (row.description, row.amount, row.transaction_type)
+        if row.kind == "transaction":
+            rows.append((row.id, values, row.category, row.account_code))
+        else:
+            changes.append((
+                row.id, row.transaction_id, values,
+                (row.old_category, row.old_account_code), (row.category, row.account_code)
+            ))
+    return rows, changes
+
+# Local nearest-neighbour tier in front of AI categorization
+knn_categorizer: Optional[KNNCategorizer] = KNNCategorizer(
+    _load_knn_examples, _load_label_changes
+) if KNN_ENABLED else None
+metrics.gauge(
+    "saimjr_knn_indexed_examples", "Distinct categorized narrations held in kNN indexes",
+    collect=lambda: {(): float(knn_categorizer.stats()["examples"])} if knn_categorizer is not None else {}
+)
+
+class CategoryModelStore:
+    """Category model snapshots, labelled transactions and corrections for the Naive Bayes tier"""
+    
+    @staticmethod
+    def load(company_id: int):
+        db = SessionLocal()
+        try:
+            snapshot = db.query(CategoryModel).filter(CategoryModel.company_id == company_id).first()
+            return (snapshot.state, snapshot.last_transaction_id or 0) if snapshot else None
+        finally:
+            db.close()
+    
+    @staticmethod
+    def save(company_id: int, state: bytes, last_transaction_id: int, examples: int):
+        def apply(session: Session):
+            snapshot = session.query(CategoryModel).filter(CategoryModel.company_id == company_id).first()
+            if snapshot is None:
+                snapshot = CategoryModel(company_id=company_id)
+                session.add(snapshot)
+            snapshot.state = state
+            snapshot.last_transaction_id = last_transaction_id
+            snapshot.examples = examples
+        
+        run_write_sync(apply)
+    
+    @staticmethod
+    def changes(company_id: int, transaction_id: int, correction_id: int):
+        return _load_label_changes(company_id, transaction_id, correction_id)
+
+def _load_rule_history():
+    """Every categorized transaction, streamed for the rule miner"""
+    db = SessionLocal()
+    try:
+        query = db.query(
+            Transaction.company_id, Transaction.description, Transaction.category, Transaction.account_code
+        ).yield_per(5000)
+        for row in query:
+            yield tuple(row)
+    finally:
+        db.close()
+
+def _hold_lease(name: str, holder: str, seconds: float) -> bool:
+    """Take the lease when it is free or expired, or extend it for its holder; True when ``holder`` has it"""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=seconds)
+    
+    def apply(session: Session) -> bool:
+        # One conditional UPDATE, so two workers can never both take an expired lease
+        held = session.query(ProcessLease).filter(
+            ProcessLease.name == name,
+            or_(ProcessLease.holder == holder, ProcessLease.expires_at < now)
+        ).update({ProcessLease.holder: holder, ProcessLease.expires_at: expires_at}, synchronize_session=False)
+        if not held and session.query(ProcessLease.id).filter(ProcessLease.name == name).first() is None:
+            session.add(ProcessLease(name=name, holder=holder, expires_at=expires_at))
+            session.flush()
+            held = 1
+        return bool(held)
+    
+    try:
+        return run_write_sync(apply)
+    except IntegrityError:
+        # Another worker created the lease first
+        return False
+
+def _release_lease(name: str, holder: str):
+    run_write_sync(lambda session: session.query(ProcessLease).filter(
+        ProcessLease.name == name, ProcessLease.holder == holder
+    ).update({ProcessLease.expires_at: datetime.utcnow()}, synchronize_session=False))
+
+# The one worker that mines rules and runs re-categorization jobs
+background_leader = LeaderElection("background_jobs", _hold_lease, _release_lease)
+metrics.gauge(
+    "saimjr_background_leader", "1 in the worker that runs rule mining and re-categorization",
+    collect=lambda: {(): 1.0 if background_leader.is_leader else 0.0}
+)
+
+class RuleSnapshotStore:
+    """Mined rules published by the leading worker"""
+    
+    @staticmethod
+    def mined_at() -> Optional[float]:
+        db = SessionLocal()
+        try:
+            return db.query(func.max(RuleSnapshot.mined_at)).scalar()
+        finally:
+            db.close()
+    
+    @staticmethod
+    def load() -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            snapshot = db.query(RuleSnapshot).order_by(RuleSnapshot.mined_at.desc()).first()
+            return {"rules": snapshot.rules, "report": snapshot.report} if snapshot else None
+        finally:
+            db.close()
+    
+    @staticmethod
+    def save(mined_at: float, rules: Dict[str, Any], report: Dict[str, Any]):
+        def apply(session: Session):
+            snapshot = session.query(RuleSnapshot).first()
+            if snapshot is None:
+                snapshot = RuleSnapshot()
+                session.add(snapshot)
+            snapshot.mined_at, snapshot.rules, snapshot.report = mined_at, rules, report
+        
+        run_write_sync(apply)
+
+rule_book.loader = _load_rule_history
+rule_book.snapshots = RuleSnapshotStore()
+rule_book.leader = background_leader
+
+# Incremental Naive Bayes tier between the kNN and the AI
+category_classifier: Optional[CategoryClassifier] = CategoryClassifier(CategoryModelStore()) if NB_ENABLED else None
+metrics.gauge(
+    "saimjr_nb_model_examples", "Transactions learned by the loaded Naive Bayes category models",
+    collect=lambda: {(): float(category_classifier.stats()["examples"])} if category_classifier is not None else {}
+)
+
 # Business Logic Functions with AI Integration
 class SaimJrBusinessLogic:
     @staticmethod
@@ -473,24 +1021,109 @@ class SaimJrBusinessLogic:
         }
     
     @staticmethod
-    def categorize_transaction(description, amount, transaction_type="expense"):
-        """Enhanced transaction categorization"""
+    def categorize_transaction(description, amount, transaction_type="expense", company_id=None):
+        """Enhanced transaction categorization
+        
+        With a company, its past categorized transactions are tried first
+        (mined rules, nearest neighbours, then the Naive Bayes model) and only
+        narrations none of them is confident about reach the AI.
+        """
+        
+        result = SaimJrBusinessLogic.categorize_locally(description, amount, transaction_type, company_id)
+        if result is None:
+            result = SaimJrBusinessLogic.categorize_with_ai([(description, amount, transaction_type)])[0]
+        CATEGORIZATION_RESULTS.inc(method=result.get("method", "unknown"))
+        return result
+    
+    @staticmethod
+    def categorize_locally(description, amount, transaction_type="expense", company_id=None):
+        """Company rules, kNN or Naive Bayes result; None when the AI has to decide"""
+        
+        if company_id is None:
+            return None
+        rule = rule_book.match_company(company_id, description)
+        prediction = None
+        if rule is None and knn_categorizer is not None:
+            try:
+                prediction = knn_categorizer.predict(company_id, description)
+            except Exception as e:
+                logger.error(f"kNN categorization failed: {str(e)}")
+        model_prediction = None
+        if rule is None and prediction is None and category_classifier is not None:
+            try:
+                model_prediction = category_classifier.predict(company_id, (description, amount, transaction_type))
+            except Exception as e:
+                logger.error(f"Naive Bayes categorization failed: {str(e)}")
+        if rule is not None:
+            result = {
+                "status": "success",
+                "category": rule.label[0],
+                "account_code": rule.label[1],
+                "confidence": round(rule.precision, 4),
+                "reasoning": f"Mined rule '{rule.pattern}' ({rule.support} past transactions)",
+                "amount": amount,
+                "transaction_type": transaction_type,
+                "method": "rule_categorization"
+            }
+        elif prediction is not None:
+            result = {
+                "status": "success",
+                "category": prediction["category"],
+                "account_code": prediction["account_code"],
+                "confidence": prediction["confidence"],
+                "reasoning": f"Matches {prediction['neighbours']} similar past transactions "
+                             f"(similarity {prediction['similarity']:.2f})",
+                "amount": amount,
+                "transaction_type": transaction_type,
+                "method": "knn_categorization"
+            }
+        elif model_prediction is not None:
+            result = {
+                "status": "success",
+                "category": model_prediction["category"],
+                "account_code": model_prediction["account_code"],
+                "confidence": model_prediction["confidence"],
+                "reasoning": f"Category model trained on {model_prediction['examples']} past transactions",
+                "amount": amount,
+                "transaction_type": transaction_type,
+                "method": "nb_categorization"
+            }
+        else:
+            result = None
+        return result
+    
+    @staticmethod
+    def categorize_with_ai(transactions):
+        """AI categorization of (description, amount, transaction_type) rows, one completion per call"""
         
         if AI_AVAILABLE and ai_generator is not None:
             try:
                 # Use AI Chart Generator for pure AI-driven categorization
-                ai_result = ai_generator.categorize_transaction_ai(description, amount, transaction_type)  # type: ignore[union-attr]
-                return ai_result
+                return ai_generator.categorize_transactions_ai(transactions)  # type: ignore[union-attr]
             except Exception as e:
                 logger.error(f"AI categorization failed: {str(e)}")
-                return SaimJrBusinessLogic._fallback_categorization(description, amount, transaction_type)
-        else:
-            return SaimJrBusinessLogic._fallback_categorization(description, amount, transaction_type)
+        return [
+            SaimJrBusinessLogic._fallback_categorization(description, amount, transaction_type)
+            for description, amount, transaction_type in transactions
+        ]
     
     @staticmethod
     def _fallback_categorization(description: str, amount: float, transaction_type: str):
         """Fallback categorization using keyword matching"""
         
+        # Patterns mined from many companies' history come before the fixed keywords
+        rule = rule_book.match_global(description)
+        if rule is not None:
+            return {
+                "status": "success",
+                "category": rule.label[0],
+                "account_code": rule.label[1],
+                "confidence": round(rule.precision, 4),
+                "amount": amount,
+                "transaction_type": transaction_type,
+                "method": "global_rule_matching"
+            }
+        
         description_lower = description.lower()
         
         # Enhanced keyword categorization
@@ -528,6 +1161,12 @@ class SaimJrBusinessLogic:
 # Initialize business logic
 business_logic = SaimJrBusinessLogic()
 
+# Single-transaction AI categorizations arriving together go out as one completion
+categorize_batcher: Optional[MicroBatcher] = (
+    MicroBatcher("categorize", business_logic.categorize_with_ai)
+    if CATEGORIZE_BATCH_ENABLED and AI_AVAILABLE else None
+)
+
 # API Routes
 @app.get("/")
 async def root():
@@ -540,14 +1179,149 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    """Summary from the background health snapshot; use /health/ready for routing decisions"""
+    database = health_monitor.checks.get("database")
+    if database is None:
+        database_status = "unknown"
+    else:
+        database_status = "connected" if database["ok"] else f"error: {database['error']}"
     return {
-        "status": "healthy",
+        "status": health_monitor.status(),
         "timestamp": datetime.utcnow().isoformat(),
-        "database": "connected",
+        "database": database_status,
         "api_version": "2.0.0",
         "ai_status": "available" if AI_AVAILABLE else "fallback_mode"
     }
 
+@app.get("/health/live")
+async def liveness_probe():
+    """Liveness: the process and its background refresh loop are running"""
+    body = health_monitor.liveness()
+    return JSONResponse(status_code=200 if body["live"] else 503, content=body)
+
+@app.get("/health/ready")
+async def readiness_probe():
+    """Readiness: warm-up finished and the critical checks passed in the last snapshot"""
+    body = health_monitor.readiness()
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of the server metrics"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/admin/traces")
+async def get_recent_traces(
+    limit: int = 20,
+    min_duration_ms: float = 0.0,
+    current_admin: User = Depends(get_current_admin)
+):
+    """Most recent request traces from the in-memory span buffer"""
+    return {"traces": tracing.exporter.traces(min(limit, 200), min_duration_ms)}
+
+@app.get("/api/admin/traces/{trace_id}")
+async def get_trace(trace_id: str, current_admin: User = Depends(get_current_admin)):
+    """All buffered spans of one trace, in start order"""
+    spans = sorted(tracing.exporter.spans(trace_id), key=lambda span: span["started_at"])
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return {"trace_id": trace_id, "spans": spans}
+
+@app.get("/api/admin/loop-report")
+async def get_loop_report(limit: int = 50, current_admin: User = Depends(get_current_admin)):
+    """Event-loop lag and the routes/call sites that blocked the loop"""
+    return loop_monitor.report(min(limit, 200))
+
+@app.delete("/api/admin/loop-report")
+async def reset_loop_report(current_admin: User = Depends(get_current_admin)):
+    """Clear the blocking-site report, e.g. after deploying a fix"""
+    loop_monitor.reset()
+    return {"status": "reset"}
+
+@app.post("/api/admin/profile")
+async def profile_server(
+    seconds: float = 10.0,
+    interval_ms: float = 5.0,
+    idle: bool = False,
+    current_admin: User = Depends(get_current_admin)
+):
+    """Sample every thread's stack for N seconds; returns flamegraph collapsed stacks"""
+    try:
+        # Sampled from a worker thread so the event loop under observation keeps serving
+        result = await asyncio.to_thread(
+            sampling_profiler.profile, seconds, max(interval_ms, 1.0) / 1000, idle
+        )
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(result["collapsed"], headers={
+        "X-Profile-Samples": str(result["samples"]),
+        "X-Profile-Seconds": str(result["duration_seconds"]),
+    })
+
+MEMORY_GROUPINGS = ("lineno", "filename", "traceback")
+
+@app.post("/api/admin/memory/snapshots")
+async def take_memory_snapshot(
+    label: Optional[str] = None, current_admin: User = Depends(get_current_admin)
+):
+    """Take a tracemalloc snapshot, starting tracing on first use"""
+    return await asyncio.to_thread(memory_snapshots.take, label)
+
+@app.get("/api/admin/memory/snapshots")
+async def list_memory_snapshots(current_admin: User = Depends(get_current_admin)):
+    return {"tracing": memory_snapshots.started_here, "snapshots": memory_snapshots.list()}
+
+@app.get("/api/admin/memory/snapshots/{snapshot_id}")
+async def get_memory_snapshot(
+    snapshot_id: int,
+    group_by: str = "lineno",
+    limit: int = 30,
+    current_admin: User = Depends(get_current_admin)
+):
+    """Largest allocation sites in one snapshot"""
+    if group_by not in MEMORY_GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(MEMORY_GROUPINGS)}")
+    try:
+        top = await asyncio.to_thread(memory_snapshots.top, snapshot_id, group_by, min(limit, 500))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return {"id": snapshot_id, "top": top}
+
+@app.get("/api/admin/memory/diff")
+async def diff_memory_snapshots(
+    base: int,
+    target: int,
+    group_by: str = "lineno",
+    limit: int = 30,
+    current_admin: User = Depends(get_current_admin)
+):
+    """Allocation growth between two snapshots, largest first"""
+    if group_by not in MEMORY_GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(MEMORY_GROUPINGS)}")
+    try:
+        return await asyncio.to_thread(memory_snapshots.diff, base, target, group_by, min(limit, 500))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+@app.delete("/api/admin/memory/snapshots")
+async def clear_memory_snapshots(current_admin: User = Depends(get_current_admin)):
+    """Drop all snapshots and stop tracemalloc to remove its overhead"""
+    memory_snapshots.clear()
+    return {"status": "cleared"}
+
+@app.get("/api/admin/rules")
+async def get_rule_mining_report(current_admin: User = Depends(get_current_admin)):
+    """What the last rule-mining run learned, per company and globally"""
+    return rule_book.report
+
+@app.post("/api/admin/rules/mine")
+async def mine_rules(current_admin: User = Depends(get_current_admin)):
+    """Re-mine categorization rules now instead of waiting for the next scheduled run"""
+    report = await asyncio.to_thread(rule_book.mine)
+    return {key: value for key, value in report.items() if key != "companies"}
+
 # Fixed Authentication Routes
 @app.post("/auth/register", response_model=UserResponse)
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
@@ -571,9 +1345,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         email=user_data.email,
         hashed_password=hashed_password
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    user = await insert_row(db, user)
     
     logger.info(f"New user registered: {user.username}")
     return user
@@ -649,9 +1421,7 @@ async def create_company_profile(
         owner_id=current_user.id
     )
     
-    db.add(company_profile)
-    db.commit()
-    db.refresh(company_profile)
+    company_profile = await insert_row(db, company_profile)
     
     logger.info(f"Company profile created: {company_profile.company_name}")
     
@@ -679,10 +1449,14 @@ async def get_company_profile(
 @app.post("/api/coa/generate/{company_id}")
 async def generate_chart_of_accounts_for_company(
     company_id: int,
+    generation_mode: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Generate Chart of Accounts using 5-step AI workflow"""
+    """Generate Chart of Accounts using 5-step AI workflow
+    
+    generation_mode: five_step (default), collapsed or single_call
+    """
     
     # Get company profile
     company_profile = db.query(CompanyProfile).filter(
@@ -694,8 +1468,15 @@ async def generate_chart_of_accounts_for_company(
         raise HTTPException(status_code=404, detail="Company profile not found")
     
     if AI_AVAILABLE and ai_generator is not None:
+        if generation_mode is not None and generation_mode not in GENERATION_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"generation_mode must be one of: {', '.join(GENERATION_MODES)}"
+            )
+        # Accounts from a streamed final step are persisted batch by batch
+        coa_writer = ChartOfAccountsBatchWriter(company_id)
         try:
-            # Use 5-step AI workflow
+            # Use 5-step AI workflow (or a framework-rules collapsed mode)
             coa_result = ai_generator.generate_ai_chart_of_accounts(  # type: ignore[union-attr]
                 company_name=company_profile.company_name,
                 nature_of_business=company_profile.nature_of_business,
@@ -703,12 +1484,20 @@ async def generate_chart_of_accounts_for_company(
                 location=company_profile.location,
                 company_type=company_profile.company_type,
                 reporting_framework=company_profile.reporting_framework,
-                statutory_compliances=company_profile.statutory_compliances or []
+                statutory_compliances=company_profile.statutory_compliances or [],
+                generation_mode=generation_mode,
+                on_accounts=coa_writer
             )
             
-            # Store chart of accounts in database
-            if "chart_of_accounts" in coa_result:
-                await store_chart_of_accounts(coa_result["chart_of_accounts"], company_id, db)
+            # Store chart of accounts in database unless a completed stream already did;
+            # a stream that broke off leaves partial accounts, which the full store replaces
+            if coa_result.get("metadata", {}).get("chart_streamed") and not coa_writer.failed:
+                coa_writer.finish()
+            elif "chart_of_accounts" in coa_result:
+                await store_chart_of_accounts(
+                    coa_result["chart_of_accounts"], company_id, db,
+                    previous=coa_writer.previous if coa_writer.accounts_written else None
+                )
             
             return coa_result
             
@@ -727,35 +1516,154 @@ async def generate_chart_of_accounts_for_company(
             industry=company_profile.industry
         )
 
-async def store_chart_of_accounts(chart_data: Dict, company_id: int, db: Session):
-    """Store chart of accounts in database"""
+def _chart_account_row(company_id: int, statement_type: str, account: Dict) -> ChartOfAccount:
+    return ChartOfAccount(
+        company_id=company_id,
+        account_code=account.get("code", ""),
+        account_name=account.get("account", ""),
+        account_type=account.get("type", ""),
+        classification=account.get("classification", ""),
+        subclassification=account.get("subclassification", ""),
+        statement_type=statement_type,
+        description=account.get("description", "")
+    )
+
+def _chart_codes(db: Session, company_id: int) -> Dict[str, str]:
+    """account_code -> account name of the company's stored chart"""
+    return {
+        code: name for code, name in db.query(ChartOfAccount.account_code, ChartOfAccount.account_name).filter(
+            ChartOfAccount.company_id == company_id
+        ) if code
+    }
+
+def _apply_code_mapping(db: Session, company_id: int, mapping: Dict[str, str]) -> int:
+    """Move the company's bookings from old to new codes in one bulk UPDATE; returns bookings moved
+    
+    Each moved booking is logged as a correction, so the local categorizers
+    stop suggesting the old code.
+    """
+    if not mapping:
+        return 0
+    new_code = case(mapping, value=Transaction.account_code)
+    moved = (Transaction.company_id == company_id, Transaction.account_code.in_(mapping))
+    db.execute(insert(CategoryCorrection).from_select(
+        [
+            "company_id", "transaction_id", "description", "amount", "transaction_type",
+            "old_category", "old_account_code", "new_category", "new_account_code", "created_at"
+        ],
+        select(
+            Transaction.company_id, Transaction.id, Transaction.description, Transaction.amount,
+            Transaction.transaction_type, Transaction.category, Transaction.account_code, Transaction.category,
+            new_code, literal(datetime.utcnow(), DateTime)
+        ).where(*moved).order_by(Transaction.id)
+    ))
+    return db.query(Transaction).filter(*moved).update(
+        {Transaction.account_code: new_code}, synchronize_session=False
+    )
+
+def _unmapped_codes(db: Session, company_id: int) -> Dict[str, int]:
+    """Booked account codes missing from the company's current chart -> bookings on each"""
+    known = select(ChartOfAccount.account_code).where(ChartOfAccount.company_id == company_id)
+    return dict(db.query(Transaction.account_code, func.count(Transaction.id)).filter(
+        Transaction.company_id == company_id,
+        Transaction.account_code.is_not(None),
+        Transaction.account_code.not_in(known)
+    ).group_by(Transaction.account_code).all())
+
+def _remap_chart_codes(db: Session, company_id: int, previous: Dict[str, str]) -> Dict[str, Any]:
+    """Move bookings off codes the new chart renamed; report the ones left on removed codes
+    
+    Only a rename the charts confirm (the same account name under a new
+    code) is applied. Bookings on a removed code keep it until the owner
+    maps it through /api/coa/remap, and are reported under "needs_review".
+    """
+    current = _chart_codes(db, company_id)
+    renamed, removed = chart_changes(previous, current) if previous and current else ({}, set())
+    remapped = _apply_code_mapping(db, company_id, renamed)
+    needs_review = {code: bookings for code, bookings in _unmapped_codes(db, company_id).items() if code in removed}
+    if renamed or removed:
+        logger.info(
+            f"Chart of accounts for company {company_id}: {len(renamed)} codes renamed, {len(removed)} removed; "
+            f"{remapped} bookings remapped, {sum(needs_review.values())} left on removed codes for review"
+        )
+    return {"renamed": renamed, "removed": sorted(removed), "remapped": remapped, "needs_review": needs_review}
+
+def _queue_chart_recategorization(company_id: int, changes: Dict[str, Any]):
+    if recategorizer is not None and (changes["renamed"] or changes["removed"]):
+        recategorizer.submit(company_id, "chart_of_accounts", remap=changes["renamed"], removed=changes["removed"])
+
+class ChartOfAccountsBatchWriter:
+    """Persists streamed COA batches, replacing the company's accounts on the first batch"""
+    
+    def __init__(self, company_id: int):
+        self.company_id = company_id
+        self.accounts_written = 0
+        self.failed = False
+        # The chart being replaced, for remapping bookings once the stream is done
+        self.previous: Dict[str, str] = {}
+    
+    def __call__(self, statement_type: str, accounts: List[Dict]):
+        first = self.accounts_written == 0
+        rows = [_chart_account_row(self.company_id, statement_type, account) for account in accounts]
+        
+        def apply(session: Session) -> Dict[str, str]:
+            if not first:
+                session.add_all(rows)
+                return self.previous
+            previous = _chart_codes(session, self.company_id)
+            session.query(ChartOfAccount).filter(ChartOfAccount.company_id == self.company_id).delete()
+            session.add_all(rows)
+            return previous
+        
+        try:
+            self.previous = run_write_sync(apply)
+            self.accounts_written += len(accounts)
+        except Exception as e:
+            logger.error(f"Failed to store streamed accounts: {str(e)}")
+            self.failed = True
     
-    try:
+    def finish(self):
+        """Remap bookings and queue re-categorization once every streamed batch is stored"""
+        if self.accounts_written == 0:
+            return
+        try:
+            changes = run_write_sync(lambda session: _remap_chart_codes(session, self.company_id, self.previous))
+            _queue_chart_recategorization(self.company_id, changes)
+        except Exception as e:
+            logger.error(f"Failed to remap bookings to the new chart: {str(e)}")
+
+async def store_chart_of_accounts(
+    chart_data: Dict, company_id: int, db: Session, previous: Optional[Dict[str, str]] = None
+):
+    """Store chart of accounts in database
+    
+    Bookings on renamed or removed codes are remapped in the same commit and
+    only the statement rows suggested under those codes are re-categorized.
+    ``previous`` is the chart being replaced when it is no longer stored.
+    """
+    
+    rows = [
+        _chart_account_row(company_id, statement_type, account)
+        for statement_type, accounts in chart_data.items() if isinstance(accounts, list)
+        for account in accounts if isinstance(account, dict) and "account" in account
+    ]
+    
+    def apply(session: Session) -> Dict[str, Any]:
+        replaced = previous if previous is not None else _chart_codes(session, company_id)
         # Clear existing accounts
-        db.query(ChartOfAccount).filter(ChartOfAccount.company_id == company_id).delete()
+        session.query(ChartOfAccount).filter(ChartOfAccount.company_id == company_id).delete()
         
         # Store new accounts
-        for statement_type, accounts in chart_data.items():
-            if isinstance(accounts, list):
-                for account in accounts:
-                    if isinstance(account, dict) and "account" in account:
-                        chart_account = ChartOfAccount(
-                            company_id=company_id,
-                            account_code=account.get("code", ""),
-                            account_name=account.get("account", ""),
-                            account_type=account.get("type", ""),
-                            classification=account.get("classification", ""),
-                            subclassification=account.get("subclassification", ""),
-                            statement_type=statement_type,
-                            description=account.get("description", "")
-                        )
-                        db.add(chart_account)
-        
-        db.commit()
+        session.add_all(rows)
+        session.flush()
+        return _remap_chart_codes(session, company_id, replaced)
+    
+    try:
+        changes = await run_write(db, apply)
+        _queue_chart_recategorization(company_id, changes)
         
     except Exception as e:
         logger.error(f"Failed to store chart of accounts: {str(e)}")
-        db.rollback()
 
 @app.post("/api/coa/upload/{company_id}")
 async def upload_chart_of_accounts(
@@ -800,6 +1708,55 @@ async def upload_chart_of_accounts(
         logger.error(f"COA upload failed: {str(e)}")
         raise HTTPException(status_code=400, detail="Failed to process uploaded file")
 
+@app.get("/api/coa/unmapped/{company_id}")
+async def get_unmapped_codes(
+    company_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Booked account codes the current chart no longer has, with the bookings on each"""
+    
+    company_profile = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not company_profile:
+        raise HTTPException(status_code=404, detail="Company profile not found")
+    
+    return {"company_id": company_id, "unmapped": _unmapped_codes(db, company_id)}
+
+@app.post("/api/coa/remap/{company_id}")
+async def remap_chart_codes(
+    company_id: int,
+    request: ChartCodeMapping,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Move bookings from old account codes to codes of the current chart, as mapped by the owner"""
+    
+    company_profile = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not company_profile:
+        raise HTTPException(status_code=404, detail="Company profile not found")
+    
+    current = _chart_codes(db, company_id)
+    unknown = sorted(code for code in request.mapping.values() if code not in current)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Codes not in the current chart: {', '.join(unknown)}")
+    mapping = {old: new for old, new in request.mapping.items() if old != new}
+    
+    def apply(session: Session) -> int:
+        return _apply_code_mapping(session, company_id, mapping)
+    
+    remapped = await run_write(db, apply)
+    if recategorizer is not None and mapping:
+        recategorizer.submit(company_id, "chart_of_accounts", remap=mapping)
+    return {"status": "success", "remapped": remapped, "unmapped": _unmapped_codes(db, company_id)}
+
 # Business Logic Routes (Legacy - for backward compatibility)
 @app.post("/api/generate-chart-of-accounts")
 async def generate_chart_of_accounts(request: ChartOfAccountsRequest):
@@ -821,15 +1778,93 @@ async def validate_input(request: ValidateInputRequest):
     return result
 
 @app.post("/api/categorize-transaction")
-async def categorize_transaction(request: TransactionRequest):
+async def categorize_transaction(
+    request: TransactionRequest,
+    http_request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
     """Enhanced transaction categorization"""
-    result = business_logic.categorize_transaction(
-        description=request.description,
-        amount=request.amount,
-        transaction_type=request.transaction_type
+    if request.company_id is not None:
+        # A company's history is only consulted for its owner
+        if credentials is None:
+            raise HTTPException(status_code=401, detail="Authentication required for company_id")
+        db = SessionLocal()
+        try:
+            current_user = get_current_user(db, verify_token(credentials))
+            company = db.query(CompanyProfile).filter(
+                CompanyProfile.id == request.company_id,
+                CompanyProfile.owner_id == current_user.id
+            ).first()
+        finally:
+            db.close()
+        if not company:
+            raise HTTPException(status_code=404, detail="Company not found")
+    # Local tiers query the database (and may load a company's index), so keep them off the event loop
+    if categorize_batcher is None:
+        return await asyncio.to_thread(
+            business_logic.categorize_transaction,
+            description=request.description,
+            amount=request.amount,
+            transaction_type=request.transaction_type,
+            company_id=request.company_id
+        )
+    result = await asyncio.to_thread(
+        business_logic.categorize_locally,
+        request.description, request.amount, request.transaction_type, request.company_id
     )
+    if result is None:
+        # Concurrent requests that reach the AI share one batched completion, but only with the same
+        # company's (or, without one, the same client's) requests: a narration can try to steer the others
+        key = ("company", request.company_id) if request.company_id is not None else (
+            "client", http_request.client.host if http_request.client else None
+        )
+        result = await categorize_batcher.submit(
+            (request.description, request.amount, request.transaction_type), key=key
+        )
+    CATEGORIZATION_RESULTS.inc(method=result.get("method", "unknown"))
     return result
 
+@app.get("/api/rules/{company_id}")
+async def get_company_rules(
+    company_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Categorization rules mined from a company's own history"""
+    company = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not company:
+        raise HTTPException(status_code=404, detail="Company not found")
+    
+    return {"mined_at": rule_book.report.get("mined_at"), **rule_book.company_report(company_id)}
+
+@app.get("/api/recategorization/{company_id}")
+async def get_recategorization_jobs(
+    company_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Progress of the background re-categorizations queued by rule or chart-of-accounts changes"""
+    company = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not company:
+        raise HTTPException(status_code=404, detail="Company not found")
+    
+    return {"enabled": recategorizer is not None, "jobs": recategorizer.jobs(company_id) if recategorizer else []}
+
+@app.get("/api/ai/tier-stats")
+async def get_ai_tier_stats(current_user: User = Depends(get_current_user)):
+    """Latency and schema pass rate per AI model tier"""
+    if not AI_AVAILABLE or ai_generator is None:
+        return {"ai_available": False, "tiers": {}}
+    return {"ai_available": True, "tiers": ai_generator.get_tier_stats()}  # type: ignore[union-attr]
+
 # Stage 3: Contact Management
 @app.post("/api/contacts/{company_id}")
 async def create_contact(
@@ -854,9 +1889,7 @@ async def create_contact(
         company_id=company_id
     )
     
-    db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    contact = await insert_row(db, contact)
     
     return contact
 
@@ -906,9 +1939,7 @@ async def create_company(
         owner_id=current_user.id,
         chart_of_accounts=coa_result.get("chart_of_accounts", {})
     )
-    db.add(company)
-    db.commit()
-    db.refresh(company)
+    company = await insert_row(db, company)
     
     return company
 
@@ -921,6 +1952,766 @@ async def get_companies(
     companies = db.query(Company).filter(Company.owner_id == current_user.id).all()
     return companies
 
+# Bank Statements
+def _overlapping_statements(db: Session, company_id: int, start: datetime, end: datetime) -> List[BankStatement]:
+    """The company's statements whose date range meets [start, end]; unknown ranges count as overlapping"""
+    return db.query(BankStatement).filter(
+        BankStatement.company_id == company_id,
+        or_(BankStatement.date_range_start.is_(None), BankStatement.date_range_start <= end),
+        or_(BankStatement.date_range_end.is_(None), BankStatement.date_range_end >= start)
+    ).all()
+
+def _known_fingerprints(db: Session, company_id: int, fingerprints: List[str]) -> Dict[str, int]:
+    """Fingerprint -> raw transaction id for those already imported (one index probe per row)"""
+    known: Dict[str, int] = {}
+    for chunk in chunks(fingerprints):
+        known.update(db.query(StatementRowHash.fingerprint, StatementRowHash.raw_transaction_id).filter(
+            StatementRowHash.company_id == company_id,
+            StatementRowHash.fingerprint.in_(chunk)
+        ).all())
+    return known
+
+async def _categorize_statement_rows(company_id: int, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Local tiers first; the rest go to the AI in batches (through the micro-batcher when enabled)"""
+    items = [
+        (row["description"], row["amount"], "income" if row["transaction_type"] == "credit" else "expense")
+        for row in rows
+    ]
+    results = await asyncio.to_thread(
+        lambda: [business_logic.categorize_locally(*item, company_id=company_id) for item in items]
+    )
+    pending = [index for index, result in enumerate(results) if result is None]
+    if categorize_batcher is not None:
+        answers = await asyncio.gather(*(
+            categorize_batcher.submit(items[index], key=("company", company_id)) for index in pending
+        ))
+    else:
+        answers = []
+        for chunk in chunks(pending, CATEGORIZE_BATCH_MAX):
+            answers.extend(await asyncio.to_thread(business_logic.categorize_with_ai, [items[i] for i in chunk]))
+    for index, answer in zip(pending, answers):
+        results[index] = answer
+    for result in results:
+        CATEGORIZATION_RESULTS.inc(method=result.get("method", "unknown"))
+    return results
+
+# Incremental re-categorization of statement-row suggestions after rule or COA edits
+def _load_categorized_rows(company_id: int, after_id: int):
+    """(id, description, account_code, method) of the company's categorized statement rows after ``after_id``"""
+    db = SessionLocal()
+    try:
+        query = db.query(RawTransaction.id, RawTransaction.description, RawTransaction.raw_data).join(
+            BankStatement, BankStatement.id == RawTransaction.bank_statement_id
+        ).filter(
+            BankStatement.company_id == company_id, RawTransaction.id > after_id
+        ).order_by(RawTransaction.id).yield_per(5000)
+        for row in query:
+            suggestion = (row.raw_data or {}).get("categorization")
+            if suggestion:
+                yield row.id, row.description, suggestion.get("account_code"), suggestion.get("method")
+    finally:
+        db.close()
+
+def _statement_companies() -> List[int]:
+    db = SessionLocal()
+    try:
+        return [company_id for (company_id,) in db.query(BankStatement.company_id).distinct()]
+    finally:
+        db.close()
+
+async def _recategorize_batch(
+    company_id: int, row_ids: List[int], remap: Dict[str, Optional[str]], recompute: bool
+) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+    """Re-run (or only remap) the suggestions of some statement rows; writes and returns the changed ones"""
+    def load():
+        db = SessionLocal()
+        try:
+            return db.query(
+                RawTransaction.id, RawTransaction.description, RawTransaction.amount,
+                RawTransaction.transaction_type, RawTransaction.raw_data
+            ).filter(RawTransaction.id.in_(row_ids)).all()
+        finally:
+            db.close()
+
+    rows = [row for row in await asyncio.to_thread(load) if (row.raw_data or {}).get("categorization")]
+    if recompute:
+        results = await _categorize_statement_rows(company_id, [
+            {"description": row.description or "", "amount": row.amount or 0.0, "transaction_type": row.transaction_type}
+            for row in rows
+        ])
+    else:
+        results = [dict(row.raw_data["categorization"]) for row in rows]
+
+    updates = []
+    changed: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+    for row, result in zip(rows, results):
+        if result.get("account_code") in remap:
+            result = {**result, "account_code": remap[result["account_code"]]}
+        previous = row.raw_data["categorization"]
+        if (result.get("category"), result.get("account_code")) == (previous.get("category"), previous.get("account_code")):
+            continue
+        updates.append({"id": row.id, "raw_data": {**row.raw_data, "categorization": result}})
+        changed[row.id] = (result.get("account_code"), result.get("method"))
+    if updates:
+        db = SessionLocal()
+        try:
+            await run_write(db, lambda session: session.execute(update(RawTransaction), updates))
+        finally:
+            db.close()
+    return changed
+
+def _job_dict(job: RecategorizationJob) -> Dict[str, Any]:
+    return {
+        "id": job.id, "company_id": job.company_id, "reasons": job.reasons, "patterns": job.patterns,
+        "remap": job.remap, "removed": job.removed, "status": job.status, "total": job.total, "done": job.done,
+        "changed": job.changed, "submitted_at": job.submitted_at, "started_at": job.started_at,
+        "finished_at": job.finished_at, "error": job.error,
+    }
+
+class RecategorizationJobStore:
+    """Re-categorization jobs shared by every worker; only the leader claims them"""
+    
+    @staticmethod
+    def add(job: Dict[str, Any]):
+        run_write_sync(lambda session: session.add(RecategorizationJob(**job)))
+    
+    @staticmethod
+    def claim(holder: str) -> List[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            # Idle polls stay on the read pool
+            if db.query(RecategorizationJob.id).filter(RecategorizationJob.status == "queued").first() is None:
+                return []
+        finally:
+            db.close()
+        
+        def apply(session: Session) -> List[Dict[str, Any]]:
+            oldest = session.query(RecategorizationJob).filter(
+                RecategorizationJob.status == "queued"
+            ).order_by(RecategorizationJob.submitted_at).first()
+            if oldest is None:
+                return []
+            company = RecategorizationJob.company_id == oldest.company_id if oldest.company_id is not None else \
+                RecategorizationJob.company_id.is_(None)
+            session.query(RecategorizationJob).filter(company, RecategorizationJob.status == "queued").update(
+                {RecategorizationJob.status: "running", RecategorizationJob.holder: holder,
+                 RecategorizationJob.started_at: time.time()},
+                synchronize_session=False
+            )
+            claimed = session.query(RecategorizationJob).filter(
+                company, RecategorizationJob.status == "running", RecategorizationJob.holder == holder
+            ).order_by(RecategorizationJob.submitted_at).populate_existing().all()
+            return [_job_dict(job) for job in claimed]
+        
+        return run_write_sync(apply)
+    
+    @staticmethod
+    def update(job_ids: List[str], **fields: Any):
+        run_write_sync(lambda session: session.query(RecategorizationJob).filter(
+            RecategorizationJob.id.in_(job_ids)
+        ).update(fields, synchronize_session=False))
+    
+    @staticmethod
+    def requeue(holder: str) -> int:
+        return run_write_sync(lambda session: session.query(RecategorizationJob).filter(
+            RecategorizationJob.status == "running", RecategorizationJob.holder != holder
+        ).update(
+            {RecategorizationJob.status: "queued", RecategorizationJob.holder: None,
+             RecategorizationJob.done: 0, RecategorizationJob.changed: 0, RecategorizationJob.total: None},
+            synchronize_session=False
+        ))
+    
+    @staticmethod
+    def jobs(company_id: int) -> List[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            return [_job_dict(job) for job in db.query(RecategorizationJob).filter(
+                RecategorizationJob.company_id == company_id
+            ).order_by(RecategorizationJob.submitted_at.desc())]
+        finally:
+            db.close()
+    
+    @staticmethod
+    def pending() -> int:
+        db = SessionLocal()
+        try:
+            return db.query(RecategorizationJob).filter(RecategorizationJob.status.in_(("queued", "running"))).count()
+        finally:
+            db.close()
+    
+    @staticmethod
+    def prune(keep: int):
+        db = SessionLocal()
+        try:
+            stale = [job_id for job_id, in db.query(RecategorizationJob.id).filter(
+                RecategorizationJob.status.in_(("complete", "failed"))
+            ).order_by(RecategorizationJob.finished_at.desc()).offset(keep)]
+        finally:
+            db.close()
+        if stale:
+            run_write_sync(lambda session: session.query(RecategorizationJob).filter(
+                RecategorizationJob.id.in_(stale)
+            ).delete(synchronize_session=False))
+
+recategorizer: Optional[Recategorizer] = (
+    Recategorizer(
+        _load_categorized_rows, _statement_companies, _recategorize_batch, RecategorizationJobStore(), background_leader
+    ) if RECATEGORIZE_ENABLED else None
+)
+metrics.gauge(
+    "saimjr_recategorization_jobs_pending", "Re-categorization jobs queued or running",
+    collect=lambda: {(): float(recategorizer.pending())} if recategorizer is not None else {}
+)
+
+def _rules_changed(changes: Dict[Optional[int], Set[str]]):
+    """Rule-miner hook: re-check only the rows containing a pattern that was added, dropped or relabelled"""
+    for company_id, patterns in changes.items():
+        recategorizer.submit(company_id, "rules", patterns)  # type: ignore[union-attr]
+
+if recategorizer is not None:
+    rule_book.on_change = _rules_changed
+
+def _statement_status(balance_report: Dict[str, Any]) -> str:
+    return "needs_review" if balance_report["status"] == "breaks" else "imported"
+
+def _balance_summary(balance_report: Dict[str, Any]) -> Dict[str, Any]:
+    summary = {key: value for key, value in balance_report.items() if key != "inferred"}
+    summary["inferred_directions"] = len(balance_report["inferred"])
+    return summary
+
+def _validation_row(statement_id: int, balance_report: Dict[str, Any]) -> StatementValidation:
+    return StatementValidation(
+        bank_statement_id=statement_id,
+        status=balance_report["status"],
+        rows_checked=balance_report["checked"],
+        breaks=balance_report["breaks"],
+        inferred_directions=len(balance_report["inferred"]),
+        report=_balance_summary(balance_report)
+    )
+
+def verify_statement_balances(session: Session, statement: BankStatement) -> Dict[str, Any]:
+    """Re-check a stored statement's rows in import order and stamp the result
+    
+    A statement whose duplicates were skipped at import only has part of
+    its rows stored, so a re-check shows a break at every gap. Its
+    import-time check covered the whole file and stands; the re-check of
+    the stored rows is only reported, under "recheck".
+    """
+    rows = session.execute(
+        select(RawTransaction.id, RawTransaction.amount, RawTransaction.balance, RawTransaction.transaction_type)
+        .where(RawTransaction.bank_statement_id == statement.id)
+        .order_by(RawTransaction.id)
+    ).all()
+    ids, amounts, balances, types = (list(column) for column in zip(*rows)) if rows else ([], [], [], [])
+    balance_report = verify_running_balance(amounts, balances, types)
+    validation = session.query(StatementValidation).filter(
+        StatementValidation.bank_statement_id == statement.id
+    ).first()
+    file_rows = (validation.report or {}).get("rows", 0) if validation is not None else 0
+    if file_rows > len(rows):
+        recheck = _balance_summary(balance_report)
+        recheck["skipped_rows"] = file_rows - len(rows)
+        return dict(validation.report, recheck=recheck)  # type: ignore[union-attr]
+    if balance_report["inferred"]:
+        session.execute(update(RawTransaction), [
+            {"id": ids[index], "transaction_type": direction} for index, direction in balance_report["inferred"].items()
+        ])
+    if validation is not None:
+        session.delete(validation)
+        session.flush()
+    session.add(_validation_row(statement.id, balance_report))
+    statement.processing_status = _statement_status(balance_report)
+    return _balance_summary(balance_report)
+
+def reconcile_company(session: Session, company_id: int, statement_id: Optional[int] = None) -> Dict[str, Any]:
+    """Match the company's unreconciled bank rows (optionally one statement's) to unreconciled bookings
+    
+    Earlier matches are kept, so each run only works on what is still open
+    and a new statement costs no more than its own rows.
+    """
+    bank_query = session.query(
+        RawTransaction.id, RawTransaction.transaction_date, RawTransaction.amount,
+        RawTransaction.transaction_type, RawTransaction.description
+    ).join(BankStatement, BankStatement.id == RawTransaction.bank_statement_id).filter(
+        BankStatement.company_id == company_id,
+        RawTransaction.transaction_date.is_not(None),
+        ~exists().where(ReconciliationMatch.raw_transaction_id == RawTransaction.id)
+    )
+    if statement_id is not None:
+        bank_query = bank_query.filter(RawTransaction.bank_statement_id == statement_id)
+    bank = [
+        Entry(row.id, row.transaction_date, row.amount or 0.0, direction(row.transaction_type), row.description)
+        for row in bank_query
+    ]
+    if not bank:
+        return {"matches": 0, "matched_bank": 0, "matched_book": 0, "unmatched_bank": 0}
+    
+    book_query = session.query(
+        Transaction.id, Transaction.date, Transaction.amount, Transaction.transaction_type, Transaction.description
+    ).filter(
+        Transaction.company_id == company_id,
+        Transaction.date.is_not(None),
+        ~exists().where(ReconciliationMatch.transaction_id == Transaction.id)
+    )
+    if statement_id is not None:
+        window = timedelta(days=RECON_WINDOW_DAYS)
+        first_day = min(entry.day for entry in bank)
+        last_day = max(entry.day for entry in bank)
+        book_query = book_query.filter(
+            Transaction.date >= datetime.fromordinal(first_day) - window,
+            Transaction.date < datetime.fromordinal(last_day) + window + timedelta(days=1)
+        )
+    book = [
+        Entry(row.id, row.date, row.amount, direction(row.transaction_type, row.amount), row.description)
+        for row in book_query
+    ]
+    
+    result = reconcile(bank, book)
+    links = []
+    for match in result["matches"]:
+        group = uuid.uuid4().hex
+        links.extend(
+            {
+                "company_id": company_id, "match_group": group, "kind": match["kind"],
+                "raw_transaction_id": raw_id, "transaction_id": transaction_id, "score": match["score"]
+            }
+            for raw_id in match["bank"] for transaction_id in match["book"]
+        )
+    if links:
+        session.execute(insert(ReconciliationMatch), links)
+    summary = {
+        "matches": len(result["matches"]),
+        "matched_bank": len(bank) - len(result["unmatched_bank"]),
+        "matched_book": len(book) - len(result["unmatched_book"]),
+        "unmatched_bank": len(result["unmatched_bank"]),
+    }
+    logger.info(f"Reconciled company {company_id} (statement {statement_id}): {summary}")
+    return summary
+
+def link_counterparties(session: Session, company_id: int, statement_id: Optional[int] = None) -> Dict[str, Any]:
+    """Name the counterparty of every statement row and link bookings to the company's contacts
+    
+    Contacts are loaded once into a trigram index and each distinct name is
+    matched once. The result is kept in the row's raw_data; bookings
+    reconciled to a matched row take its contact. A company-wide run also
+    matches unlinked bookings on their own descriptions.
+    """
+    index = ContactIndex(session.query(Contact.id, Contact.name).filter(Contact.company_id == company_id))
+    raw_query = session.query(
+        RawTransaction.id, RawTransaction.description, RawTransaction.amount,
+        RawTransaction.transaction_type, RawTransaction.raw_data
+    ).join(BankStatement, BankStatement.id == RawTransaction.bank_statement_id).filter(
+        BankStatement.company_id == company_id
+    )
+    if statement_id is not None:
+        raw_query = raw_query.filter(RawTransaction.bank_statement_id == statement_id)
+    rows = raw_query.all()
+    names = {row.id: extract_counterparty(row.description) for row in rows}
+    matches = index.match_many([name for name in names.values() if name]) if len(index) else {}
+    
+    raw_updates = []
+    raw_contacts: Dict[int, int] = {}
+    unmatched = []
+    for row in rows:
+        name = names[row.id]
+        if name is None:
+            continue
+        match = matches.get(name_key(name))
+        raw_data = dict(row.raw_data or {})
+        raw_data["counterparty"] = {
+            "name": name,
+            "contact_id": match[0] if match else None,
+            "score": match[1] if match else None
+        }
+        raw_updates.append({"id": row.id, "raw_data": raw_data})
+        if match:
+            raw_contacts[row.id] = match[0]
+        else:
+            unmatched.append((name, row.amount, row.transaction_type))
+    if raw_updates:
+        session.execute(update(RawTransaction), raw_updates)
+    
+    booking_contacts: Dict[int, int] = {}
+    for chunk in chunks(list(raw_contacts)):
+        for raw_id, transaction_id in session.query(
+            ReconciliationMatch.raw_transaction_id, ReconciliationMatch.transaction_id
+        ).join(Transaction, Transaction.id == ReconciliationMatch.transaction_id).filter(
+            ReconciliationMatch.raw_transaction_id.in_(chunk),
+            Transaction.contact_id.is_(None)
+        ):
+            booking_contacts.setdefault(transaction_id, raw_contacts[raw_id])
+    if statement_id is None and len(index):
+        unlinked = session.query(Transaction.id, Transaction.description).filter(
+            Transaction.company_id == company_id,
+            Transaction.contact_id.is_(None)
+        ).all()
+        own_names = {row.id: extract_counterparty(row.description) for row in unlinked}
+        own_matches = index.match_many([name for name in own_names.values() if name])
+        for transaction_id, name in own_names.items():
+            match = own_matches.get(name_key(name)) if name else None
+            if match and transaction_id not in booking_contacts:
+                booking_contacts[transaction_id] = match[0]
+    if booking_contacts:
+        session.execute(update(Transaction), [
+            {"id": transaction_id, "contact_id": contact_id} for transaction_id, contact_id in booking_contacts.items()
+        ])
+    
+    return {
+        "rows": len(rows),
+        "named": len(raw_updates),
+        "matched": len(raw_contacts),
+        "bookings_linked": len(booking_contacts),
+        "suggested_contacts": suggest_contacts(unmatched)
+    }
+
+@app.post("/api/bank-statements/upload/{company_id}")
+async def upload_bank_statement(
+    company_id: int,
+    file: UploadFile = File(...),
+    categorize: bool = True,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Import a CSV bank statement, skipping rows an earlier upload already imported
+    
+    Rows are matched on (date, amount, normalized description, balance)
+    through the persisted fingerprint index; duplicates are neither stored
+    nor categorized again. Only rows inside the date range of an existing
+    statement can be duplicates, so only those are looked up.
+    """
+    
+    company = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not company:
+        raise HTTPException(status_code=404, detail="Company profile not found")
+    
+    content = await file.read()
+    try:
+        rows = await asyncio.to_thread(parse_statement_csv, content)
+    except StatementParseError as e:
+        raise HTTPException(status_code=400, detail=f"Could not read statement: {str(e)}")
+    if not rows:
+        raise HTTPException(status_code=400, detail="No transactions found in statement")
+    
+    # The file as a whole must be continuous, so it is checked before duplicates are dropped
+    balance_report = await asyncio.to_thread(
+        verify_running_balance,
+        [row["amount"] for row in rows],
+        [row["balance"] for row in rows],
+        [row["transaction_type"] for row in rows]
+    )
+    for index, direction in balance_report["inferred"].items():
+        rows[index]["transaction_type"] = direction
+    
+    fingerprints = row_fingerprints(company_id, rows)
+    start, end = date_range(rows)
+    overlapping = _overlapping_statements(db, company_id, start, end)  # type: ignore[arg-type]
+    candidates = [
+        fingerprint for row, fingerprint in zip(rows, fingerprints)
+        if any(
+            (statement.date_range_start is None or statement.date_range_start <= row["transaction_date"])
+            and (statement.date_range_end is None or row["transaction_date"] <= statement.date_range_end)
+            for statement in overlapping
+        )
+    ]
+    known = _known_fingerprints(db, company_id, candidates) if candidates else {}
+    new_rows = [index for index, fingerprint in enumerate(fingerprints) if fingerprint not in known]
+    
+    suggestions: Dict[int, Dict[str, Any]] = {}
+    if categorize and new_rows:
+        results = await _categorize_statement_rows(company_id, [rows[index] for index in new_rows])
+        suggestions = dict(zip(new_rows, results))
+    
+    def apply(session: Session) -> Dict[str, Any]:
+        # Checked again inside the write: a concurrent upload may have imported the same rows
+        taken = _known_fingerprints(session, company_id, [fingerprints[index] for index in new_rows])
+        inserting = [index for index in new_rows if fingerprints[index] not in taken]
+        statement = BankStatement(
+            company_id=company_id,
+            file_name=file.filename,
+            file_type=(file.filename or "").rsplit(".", 1)[-1].lower() or "csv",
+            processing_status=_statement_status(balance_report) if inserting else "duplicate",
+            transaction_count=len(inserting),
+            date_range_start=start,
+            date_range_end=end
+        )
+        session.add(statement)
+        session.flush()
+        session.add(_validation_row(statement.id, balance_report))
+        raw_ids: List[int] = []
+        if inserting:
+            raw_ids = list(session.scalars(
+                insert(RawTransaction).returning(RawTransaction.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "bank_statement_id": statement.id,
+                        "transaction_date": rows[index]["transaction_date"],
+                        "description": rows[index]["description"],
+                        "amount": rows[index]["amount"],
+                        "transaction_type": rows[index]["transaction_type"],
+                        "balance": rows[index]["balance"],
+                        "raw_data": {"columns": rows[index]["raw_data"], "categorization": suggestions.get(index)},
+                    }
+                    for index in inserting
+                ]
+            ))
+            session.execute(insert(StatementRowHash), [
+                {"company_id": company_id, "fingerprint": fingerprints[index], "raw_transaction_id": raw_id}
+                for index, raw_id in zip(inserting, raw_ids)
+            ])
+        return {"statement_id": statement.id, "imported": len(inserting), "late_duplicates": len(new_rows) - len(inserting)}
+    
+    try:
+        written = await run_write(db, apply)
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="A concurrent upload imported the same rows; retry")
+    
+    reconciliation = None
+    if RECONCILE_ON_IMPORT and written["imported"]:
+        statement_id = written["statement_id"]
+        reconciliation = await run_write(db, lambda session: reconcile_company(session, company_id, statement_id))
+    counterparties = None
+    if COUNTERPARTY_ON_IMPORT and written["imported"]:
+        statement_id = written["statement_id"]
+        counterparties = await run_write(db, lambda session: link_counterparties(session, company_id, statement_id))
+    
+    duplicates = len(rows) - written["imported"]
+    if duplicates:
+        logger.info(
+            f"Statement {written['statement_id']} for company {company_id}: {duplicates} of {len(rows)} rows "
+            f"already imported, overlapping statements {[statement.id for statement in overlapping]}"
+        )
+    return {
+        "status": "success",
+        "statement_id": written["statement_id"],
+        "rows": len(rows),
+        "imported": written["imported"],
+        "duplicates": duplicates,
+        "categorized": len(suggestions),
+        "date_range": {"start": start, "end": end},
+        "balance_check": _balance_summary(balance_report),
+        "reconciliation": reconciliation,
+        "counterparties": counterparties,
+        "overlapping_statements": [
+            {
+                "statement_id": statement.id,
+                "file_name": statement.file_name,
+                "date_range_start": statement.date_range_start,
+                "date_range_end": statement.date_range_end
+            }
+            for statement in overlapping
+        ]
+    }
+
+@app.post("/api/bank-statements/{company_id}/{statement_id}/verify")
+async def verify_bank_statement(
+    company_id: int,
+    statement_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Re-run the running-balance check on a stored statement"""
+    
+    statement = db.query(BankStatement).join(
+        CompanyProfile, CompanyProfile.id == BankStatement.company_id
+    ).filter(
+        BankStatement.id == statement_id,
+        BankStatement.company_id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not statement:
+        raise HTTPException(status_code=404, detail="Bank statement not found")
+    
+    def apply(session: Session) -> Dict[str, Any]:
+        return verify_statement_balances(session, session.get(BankStatement, statement_id))
+    
+    summary = await run_write(db, apply)
+    return {"statement_id": statement_id, "balance_check": summary}
+
+@app.get("/api/bank-statements/{company_id}")
+async def get_bank_statements(
+    company_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get uploaded bank statements"""
+    
+    company = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not company:
+        raise HTTPException(status_code=404, detail="Company profile not found")
+    
+    statements = db.query(BankStatement).filter(
+        BankStatement.company_id == company_id
+    ).order_by(BankStatement.date_range_start).all()
+    validations = {
+        validation.bank_statement_id: validation
+        for validation in db.query(StatementValidation).filter(
+            StatementValidation.bank_statement_id.in_([statement.id for statement in statements])
+        )
+    } if statements else {}
+    
+    return {
+        "statements": [
+            {
+                "id": statement.id,
+                "file_name": statement.file_name,
+                "file_type": statement.file_type,
+                "upload_date": statement.upload_date,
+                "processing_status": statement.processing_status,
+                "transaction_count": statement.transaction_count,
+                "date_range_start": statement.date_range_start,
+                "date_range_end": statement.date_range_end,
+                "balance_check": validations[statement.id].report if statement.id in validations else None
+            }
+            for statement in statements
+        ],
+        "total": len(statements)
+    }
+
+# Counterparties
+@app.post("/api/counterparties/{company_id}/link")
+async def link_company_counterparties(
+    company_id: int,
+    statement_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Re-match statement counterparties to contacts (e.g. after adding contacts) and link bookings"""
+    
+    company = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not company:
+        raise HTTPException(status_code=404, detail="Company profile not found")
+    
+    summary = await run_write(db, lambda session: link_counterparties(session, company_id, statement_id))
+    return {"status": "success", "company_id": company_id, **summary}
+
+# Reconciliation
+@app.post("/api/reconciliation/{company_id}/run")
+async def run_reconciliation(
+    company_id: int,
+    statement_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Match still-open bank rows to still-open bookings (e.g. after new transactions are booked)"""
+    
+    company = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not company:
+        raise HTTPException(status_code=404, detail="Company profile not found")
+    
+    summary = await run_write(db, lambda session: reconcile_company(session, company_id, statement_id))
+    return {"status": "success", "company_id": company_id, **summary}
+
+@app.get("/api/reconciliation/{company_id}")
+async def get_reconciliation(
+    company_id: int,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Match sets plus the bank rows and bookings still unmatched (up to ``limit`` of each)"""
+    
+    company = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not company:
+        raise HTTPException(status_code=404, detail="Company profile not found")
+    
+    groups: Dict[str, Dict[str, Any]] = {}
+    for link in db.query(ReconciliationMatch).filter(
+        ReconciliationMatch.company_id == company_id
+    ).order_by(ReconciliationMatch.id).limit(limit * RECON_SPLIT_MAX_PARTS):
+        group = groups.setdefault(link.match_group, {
+            "match_group": link.match_group, "kind": link.kind, "score": link.score,
+            "raw_transaction_ids": [], "transaction_ids": []
+        })
+        for key, value in (("raw_transaction_ids", link.raw_transaction_id), ("transaction_ids", link.transaction_id)):
+            if value not in group[key]:
+                group[key].append(value)
+    
+    unmatched_bank = db.query(RawTransaction).join(
+        BankStatement, BankStatement.id == RawTransaction.bank_statement_id
+    ).filter(
+        BankStatement.company_id == company_id,
+        ~exists().where(ReconciliationMatch.raw_transaction_id == RawTransaction.id)
+    )
+    unmatched_book = db.query(Transaction).filter(
+        Transaction.company_id == company_id,
+        ~exists().where(ReconciliationMatch.transaction_id == Transaction.id)
+    )
+    
+    return {
+        "matches": list(groups.values())[:limit],
+        "unmatched_bank": [
+            {"id": row.id, "date": row.transaction_date, "amount": row.amount,
+             "transaction_type": row.transaction_type, "description": row.description}
+            for row in unmatched_bank.order_by(RawTransaction.transaction_date).limit(limit)
+        ],
+        "unmatched_book": [
+            {"id": row.id, "date": row.date, "amount": row.amount,
+             "transaction_type": row.transaction_type, "description": row.description}
+            for row in unmatched_book.order_by(Transaction.date).limit(limit)
+        ],
+        "totals": {
+            "matches": db.query(ReconciliationMatch.match_group).filter(
+                ReconciliationMatch.company_id == company_id
+            ).distinct().count(),
+            "unmatched_bank": unmatched_bank.count(),
+            "unmatched_book": unmatched_book.count()
+        }
+    }
+
+@app.get("/api/search/{company_id}")
+async def search_company(
+    company_id: int,
+    q: str,
+    kind: str = "all",
+    limit: int = 20,
+    offset: int = 0,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Ranked full-text search over transactions, statement rows and contacts
+
+    ``kind`` is "all" or one of transactions, statement_rows, contacts.
+    Every word must match; the last is matched as a prefix, for search-as-you-type.
+    """
+
+    if kind != "all" and kind not in SEARCH_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be all or one of: {', '.join(SEARCH_KINDS)}")
+    if not 1 <= limit <= 100 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be 1-100 and offset non-negative")
+
+    company = db.query(CompanyProfile).filter(
+        CompanyProfile.id == company_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+
+    if not company:
+        raise HTTPException(status_code=404, detail="Company profile not found")
+
+    kinds = list(SEARCH_KINDS) if kind == "all" else [kind]
+    found = search_index.search(db, company_id, q, kinds, limit=limit, offset=offset)
+    return {"query": q, "limit": limit, "offset": offset, **found}
+
 # Transaction Management
 @app.post("/api/transactions")
 async def create_transaction(
@@ -939,13 +2730,52 @@ async def create_transaction(
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
     
-    transaction = Transaction(**transaction_data.dict())
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
+    transaction = Transaction(**transaction_data.dict(exclude_none=True))
+    transaction = await insert_row(db, transaction)
     
     return {"status": "success", "transaction_id": transaction.id}
 
+@app.patch("/api/transactions/{transaction_id}")
+async def correct_transaction(
+    transaction_id: int,
+    correction: TransactionCorrection,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Correct a transaction's category; the local categorizers learn from it"""
+    
+    transaction = db.query(Transaction).join(
+        CompanyProfile, CompanyProfile.id == Transaction.company_id
+    ).filter(
+        Transaction.id == transaction_id,
+        CompanyProfile.owner_id == current_user.id
+    ).first()
+    
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    
+    old = (transaction.category, transaction.account_code)
+    new = (correction.category, correction.account_code)
+    logged = None
+    if old != new:
+        # Every worker's kNN index and category model replays the log on its next lookup
+        logged = CategoryCorrection(
+            company_id=transaction.company_id, transaction_id=transaction.id, description=transaction.description,
+            amount=transaction.amount, transaction_type=transaction.transaction_type,
+            old_category=old[0], old_account_code=old[1], new_category=new[0], new_account_code=new[1]
+        )
+    
+    def apply(session: Session):
+        session.execute(
+            update(Transaction).where(Transaction.id == transaction_id).values(category=new[0], account_code=new[1])
+        )
+        if logged is not None:
+            session.add(logged)
+    
+    await run_write(db, apply)
+    
+    return {"status": "success", "transaction_id": transaction_id}
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -963,12 +2793,9 @@ async def general_exception_handler(request, exc):
         content={"error": "Internal server error", "status_code": 500}
     )
 
-# Create tables
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created successfully")
-except Exception as e:
-    logger.error(f"Failed to create database tables: {str(e)}")
+# Cold-start cost of importing this module (tables are created by migrate.py / the lifespan hook)
+IMPORT_SECONDS = time.perf_counter() - _import_started
+STARTUP_SECONDS.set(IMPORT_SECONDS, phase="import")
 
 # Production startup
 if __name__ == "__main__":
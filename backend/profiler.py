@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Profiler - On-demand sampling profiles and tracemalloc snapshots of a live worker
+Profiles are returned as collapsed stacks ("frame;frame;frame count") that
+flamegraph.pl, speedscope and inferno load directly.
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "25"))
+# Snapshots kept in memory; the oldest is dropped first
+MEMORY_MAX_SNAPSHOTS = 10
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ProfilerBusy(Exception):
+    """A profile or snapshot operation is already running"""
+
+
+def _frame_name(code: Any) -> str:
+    filename = code.co_filename
+    if filename.startswith(BACKEND_DIR):
+        filename = os.path.relpath(filename, BACKEND_DIR)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename})"
+
+
+class SamplingProfiler:
+    """Wall-clock sampler over every thread's stack via sys._current_frames"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float = 0.005, idle: bool = False) -> Dict[str, Any]:
+        """Sample for ``seconds`` and return collapsed stacks with their sample counts
+
+        Threads parked in the event loop's selector or a worker queue are
+        skipped unless ``idle`` is set, so the output shows time spent working.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+            own_thread = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks: Counter = Counter()
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    codes = []
+                    while frame is not None:
+                        codes.append(frame.f_code)
+                        frame = frame.f_back
+                    if not idle and codes and codes[0].co_name in ("select", "poll", "wait", "_wait_for_tstate_lock"):
+                        continue
+                    thread_name = names.get(thread_id) or str(thread_id)
+                    stack = ";".join([thread_name] + [_frame_name(code) for code in reversed(codes)])
+                    stacks[stack] += 1
+                samples += 1
+                time.sleep(interval)
+            return {
+                "duration_seconds": round(time.perf_counter() - started, 3),
+                "samples": samples,
+                "interval_seconds": interval,
+                "collapsed": "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n",
+            }
+        finally:
+            self._lock.release()
+
+
+class MemorySnapshots:
+    """tracemalloc snapshots of the live process, diffable by id"""
+
+    def __init__(self):
+        self._snapshots: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.started_here = False
+
+    def take(self, label: Optional[str] = None) -> Dict[str, Any]:
+        """Snapshot current allocations, starting tracemalloc on first use
+
+        Only allocations made after tracing started are visible, so take a
+        baseline snapshot first and diff later ones against it.
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(MEMORY_TRACE_FRAMES)
+                self.started_here = True
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            ])
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = {
+                "snapshot": snapshot,
+                "label": label,
+                "taken_at": time.time(),
+                "traced_bytes": current,
+                "peak_bytes": peak,
+            }
+            while len(self._snapshots) > MEMORY_MAX_SNAPSHOTS:
+                self._snapshots.pop(min(self._snapshots))
+            return self._describe(snapshot_id)
+
+    def _describe(self, snapshot_id: int) -> Dict[str, Any]:
+        entry = self._snapshots[snapshot_id]
+        return {
+            "id": snapshot_id,
+            "label": entry["label"],
+            "taken_at": entry["taken_at"],
+            "traced_bytes": entry["traced_bytes"],
+            "peak_bytes": entry["peak_bytes"],
+        }
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._describe(snapshot_id) for snapshot_id in sorted(self._snapshots)]
+
+    def top(self, snapshot_id: int, group_by: str = "lineno", limit: int = 30) -> List[Dict[str, Any]]:
+        with self._lock:
+            snapshot = self._get(snapshot_id)
+        return [
+            {"location": self._location(stat.traceback, group_by), "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics(group_by)[:limit]
+        ]
+
+    def diff(
+        self, base_id: int, target_id: int, group_by: str = "lineno", limit: int = 30
+    ) -> Dict[str, Any]:
+        """Allocation growth from ``base_id`` to ``target_id``, largest first"""
+        with self._lock:
+            base = self._get(base_id)
+            target = self._get(target_id)
+        stats = target.compare_to(base, group_by)
+        return {
+            "base": base_id,
+            "target": target_id,
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "top": [
+                {
+                    "location": self._location(stat.traceback, group_by),
+                    "size_diff_bytes": stat.size_diff,
+                    "size_bytes": stat.size,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+    def clear(self) -> None:
+        """Drop snapshots and stop tracing if it was started here"""
+        with self._lock:
+            self._snapshots.clear()
+            if self.started_here and tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.started_here = False
+
+    def _get(self, snapshot_id: int) -> tracemalloc.Snapshot:
+        entry = self._snapshots.get(snapshot_id)
+        if entry is None:
+            raise KeyError(snapshot_id)
+        return entry["snapshot"]
+
+    @staticmethod
+    def _location(trace: tracemalloc.Traceback, group_by: str) -> Any:
+        if group_by == "traceback":
+            return [f"{frame.filename}:{frame.lineno}" for frame in trace]
+        frame = trace[0]
+        return f"{frame.filename}:{frame.lineno}" if group_by == "lineno" else frame.filename
+
+
+sampling_profiler = SamplingProfiler()
+memory_snapshots = MemorySnapshots()
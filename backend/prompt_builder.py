@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Prompt Builder - Compact prompt serialization and token budgeting
+Keeps chained COA workflow prompts small and within the model context window
+"""
+
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# tiktoken is optional - fall back to a character-based estimate without it
+try:
+    import tiktoken  # type: ignore[import-untyped]
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Context window (tokens) per model family; unknown models use the smallest
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens held back for chat message framing and estimation error
+PROMPT_SAFETY_MARGIN = 64
+CHARS_PER_TOKEN = 4
+
+# Levels of the COA hierarchy, collapsed into nested keys when serialized
+HIERARCHY_KEYS = ("class", "classification", "subclassification")
+
+# Short aliases for the keys that survive compaction
+KEY_ALIASES = {
+    "account": "a",
+    "code": "k",
+    "description": "d",
+    "type": "t",
+    "company_name": "name",
+    "nature_of_business": "business",
+    "company_type": "type",
+    "reporting_framework": "framework",
+    "statutory_compliances": "compliances",
+}
+
+STRUCTURE_LEGEND = "statement > class > classification > [subclassifications]"
+
+
+class Prompt:
+    """A rendered prompt with its locally counted size"""
+
+    def __init__(self, text: str, tokens: int, trimmed: bool = False):
+        self.text = text
+        self.tokens = tokens
+        self.trimmed = trimmed
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str) -> Any:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Count prompt tokens locally, without a round trip to the API"""
+    if TIKTOKEN_AVAILABLE:
+        return len(_encoding(model).encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def context_window(model: str) -> int:
+    """Context window for a model, matching the longest known prefix"""
+    matches = [name for name in MODEL_CONTEXT_WINDOWS if model.startswith(name)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def compact_json(value: Any) -> str:
+    """Serialize without indentation or padding"""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def compact_profile(company_profile: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Keep only the profile fields a step needs, under short keys"""
+    # Lists are copied so trimming never reaches back into the caller's profile
+    return {
+        KEY_ALIASES.get(field, field): (
+            list(company_profile[field])
+            if isinstance(company_profile[field], list)
+            else company_profile[field]
+        )
+        for field in fields
+        if company_profile.get(field)
+    }
+
+
+def compact_structure(structure: Any) -> Any:
+    """Collapse statement -> [{class, classification, ...}] lists into nested keys
+
+    Repeated class and classification strings appear once as dictionary keys,
+    and leaf levels become plain lists of names.
+    """
+    if not isinstance(structure, dict):
+        return _shorten_keys(structure)
+    compacted: Dict[str, Any] = {}
+    for statement, entries in structure.items():
+        if isinstance(entries, list) and all(isinstance(entry, dict) for entry in entries):
+            compacted[statement] = _collapse_leaves(_group_entries(entries))
+        else:
+            compacted[statement] = _shorten_keys(entries)
+    return compacted
+
+
+def _group_entries(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    tree: Dict[str, Any] = {}
+    for entry in entries:
+        node = tree
+        for key in HIERARCHY_KEYS:
+            if entry.get(key):
+                node = node.setdefault(str(entry[key]), {})
+        extras: Dict[str, Any] = {}
+        for key, value in entry.items():
+            if key in HIERARCHY_KEYS:
+                continue
+            if isinstance(value, list) and all(isinstance(item, str) for item in value):
+                # e.g. {"classification": ..., "subclassifications": [...]}
+                for name in value:
+                    node.setdefault(name, {})
+            else:
+                extras[KEY_ALIASES.get(key, key)] = _shorten_keys(value)
+        if extras:
+            node.setdefault("_", {}).update(extras)
+    return tree
+
+
+def _collapse_leaves(node: Dict[str, Any]) -> Any:
+    if node and all(isinstance(child, dict) and not child for child in node.values()):
+        return list(node)
+    return {
+        key: child if key == "_" or not isinstance(child, dict) else _collapse_leaves(child)
+        for key, child in node.items()
+    }
+
+
+def _shorten_keys(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {KEY_ALIASES.get(key, key): _shorten_keys(child) for key, child in value.items()}
+    if isinstance(value, list):
+        return [_shorten_keys(item) for item in value]
+    return value
+
+
+def _trim_longest_list(value: Any) -> bool:
+    """Drop the tail quarter of the longest list in a nested structure"""
+    longest: Optional[List[Any]] = None
+    stack = [value]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            stack.extend(current.values())
+        elif isinstance(current, list):
+            if len(current) > 1 and (longest is None or len(current) > len(longest)):
+                longest = current
+            stack.extend(current)
+    if longest is None:
+        return False
+    del longest[len(longest) - max(1, len(longest) // 4):]
+    return True
+
+
+def _render(instructions: str, context: Dict[str, Any]) -> str:
+    lines = [f"{label}: {compact_json(value)}" for label, value in context.items()]
+    lines.extend(line.strip() for line in instructions.strip().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def build_prompt(
+    instructions: str,
+    context: Dict[str, Any],
+    max_tokens: int,
+    model: str = "gpt-4"
+) -> Prompt:
+    """Render a compact prompt, trimming context until prompt + completion fit
+
+    Context values are serialized compactly in insertion order ahead of the
+    instructions. When the prompt would not leave room for ``max_tokens`` of
+    completion, the longest lists in the context are shortened first.
+    """
+    budget = context_window(model) - max_tokens - PROMPT_SAFETY_MARGIN
+    text = _render(instructions, context)
+    tokens = count_tokens(text, model)
+    trimmed = False
+    while tokens > budget and _trim_longest_list(context):
+        trimmed = True
+        text = _render(instructions, context)
+        tokens = count_tokens(text, model)
+    if tokens > budget:
+        logger.warning(f"Prompt uses {tokens} tokens, over its {budget} token budget")
+    elif trimmed:
+        logger.info(f"Prompt context trimmed to {tokens} tokens to fit {budget}")
+    return Prompt(text, tokens, trimmed)
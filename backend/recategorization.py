@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Recategorization - Incremental re-categorization after rule or COA edits
+Every company's categorized statement rows are indexed by narration word
+and by suggested account code. A changed rule pattern or a renamed/removed
+account code is looked up in that index, and only the rows it names are
+recomputed, in background batches whose progress can be polled. Jobs live
+in a shared store: any worker can queue one or report progress, and only
+the elected leader claims and runs them.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Protocol, Set, Tuple
+
+from leader_election import LeaderElection
+from metrics import counter
+from rule_mining import narration_features
+
+logger = logging.getLogger(__name__)
+
+RECATEGORIZE_ENABLED = os.getenv("RECATEGORIZE_ENABLED", "true").lower() == "true"
+RECATEGORIZE_BATCH_SIZE = int(os.getenv("RECATEGORIZE_BATCH_SIZE", "200"))
+RECATEGORIZE_JOBS_KEPT = 100
+# How often the leader looks for jobs queued by the other workers
+RECATEGORIZE_POLL_SECONDS = float(os.getenv("RECATEGORIZE_POLL_SECONDS", "2"))
+# Companies whose term index is kept between jobs; a global-rule change walks every company through it
+RECATEGORIZE_MAX_INDEXES = int(os.getenv("RECATEGORIZE_MAX_INDEXES", "64"))
+
+# Suggestion methods that consult the global rules (company rules win over them everywhere else)
+GLOBAL_RULE_METHODS = {"global_rule_matching", "fallback_keyword_matching"}
+
+RECATEGORIZED_ROWS = counter(
+    "saimjr_recategorized_rows_total", "Statement rows re-categorized after rule or COA edits, by outcome",
+    ["outcome"]
+)
+
+# (row id, description, account_code, method) of a categorized statement row
+IndexedRow = Tuple[int, str, Optional[str], Optional[str]]
+
+
+def chart_changes(old: Dict[str, str], new: Dict[str, str]) -> Tuple[Dict[str, str], Set[str]]:
+    """Renamed and removed codes between two charts given as account_code -> account name
+
+    A code that disappeared while an account of the same name appeared
+    under another code was renamed; one with no such successor was removed.
+    """
+    added = {" ".join(new[code].lower().split()): code for code in new.keys() - old.keys()}
+    renamed: Dict[str, str] = {}
+    removed: Set[str] = set()
+    for code in old.keys() - new.keys():
+        successor = added.get(" ".join(old[code].lower().split()))
+        if successor is not None:
+            renamed[code] = successor
+        else:
+            removed.add(code)
+    return renamed, removed
+
+
+class TermIndex:
+    """Narration word -> row ids and account code -> row ids for one company's statement rows"""
+
+    def __init__(self):
+        self.last_id = 0
+        self._words: Dict[str, Set[int]] = defaultdict(set)
+        self._codes: Dict[Optional[str], Set[int]] = defaultdict(set)
+        self._code_of: Dict[int, Optional[str]] = {}
+        self._global_rows: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._code_of)
+
+    def add(self, rows: Iterable[IndexedRow]) -> None:
+        for row_id, description, account_code, method in rows:
+            for feature in narration_features(description or ""):
+                if " " not in feature:
+                    self._words[feature].add(row_id)
+            self._codes[account_code].add(row_id)
+            self._code_of[row_id] = account_code
+            if method in GLOBAL_RULE_METHODS:
+                self._global_rows.add(row_id)
+            self.last_id = max(self.last_id, row_id)
+
+    def recoded(self, row_id: int, account_code: Optional[str], method: Optional[str]) -> None:
+        """Keep the code postings current after a row's suggestion changed"""
+        self._codes[self._code_of.get(row_id)].discard(row_id)
+        self._codes[account_code].add(row_id)
+        self._code_of[row_id] = account_code
+        if method in GLOBAL_RULE_METHODS:
+            self._global_rows.add(row_id)
+        else:
+            self._global_rows.discard(row_id)
+
+    def rows_for_patterns(self, patterns: Iterable[str], global_only: bool = False) -> Set[int]:
+        """Rows whose narration contains a pattern's words (word pairs may over-select; they are recomputed)"""
+        rows: Set[int] = set()
+        for pattern in patterns:
+            words = pattern.split()
+            postings = [self._words.get(word, set()) for word in words]
+            rows |= set.intersection(*postings) if postings else set()
+        return rows & self._global_rows if global_only else rows
+
+    def rows_for_codes(self, codes: Iterable[str]) -> Set[int]:
+        rows: Set[int] = set()
+        for code in codes:
+            rows |= self._codes.get(code, set())
+        return rows
+
+
+class JobStore(Protocol):
+    """Shared job table; jobs are dicts with the keys Recategorizer.submit creates"""
+
+    def add(self, job: Dict[str, Any]) -> None: ...
+
+    def claim(self, holder: str) -> List[Dict[str, Any]]: ...
+
+    def update(self, job_ids: List[str], **fields: Any) -> None: ...
+
+    def requeue(self, holder: str) -> int: ...
+
+    def jobs(self, company_id: int) -> List[Dict[str, Any]]: ...
+
+    def pending(self) -> int: ...
+
+    def prune(self, keep: int) -> None: ...
+
+
+class Recategorizer:
+    """Shared queue of incremental re-categorization jobs, worked through by the leader's background task
+
+    ``loader(company_id, after_id)`` yields the IndexedRow of every
+    categorized statement row after ``after_id``; ``companies()`` lists the
+    companies with statement rows; ``process(company_id, row_ids, remap,
+    recompute)`` rewrites one batch (re-running the categorizers when
+    ``recompute``, else only remapping codes; ``remap`` maps renamed codes
+    to their new code and removed ones to None) and returns row id ->
+    (account_code, method) for the rows whose suggestion changed.
+
+    ``store.claim(holder)`` atomically marks every queued job of the oldest
+    queued job's company as running under ``holder`` and returns them; the
+    claimed jobs run as one, so repeated submissions cost one pass.
+
+    Term indexes are kept for the ``max_indexes`` most recently processed
+    companies and rebuilt from ``loader`` after eviction.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[int, int], Iterable[IndexedRow]],
+        companies: Callable[[], Iterable[int]],
+        process: Callable[
+            [int, List[int], Dict[str, Optional[str]], bool], Awaitable[Dict[int, Tuple[Optional[str], Optional[str]]]]
+        ],
+        store: JobStore,
+        leader: Optional[LeaderElection] = None,
+        batch_size: int = RECATEGORIZE_BATCH_SIZE,
+        max_indexes: int = RECATEGORIZE_MAX_INDEXES
+    ):
+        self.loader = loader
+        self.companies = companies
+        self.process = process
+        self.store = store
+        self.leader = leader
+        self.batch_size = batch_size
+        self.max_indexes = max_indexes
+        self._indexes: "OrderedDict[int, TermIndex]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader is None or self.leader.is_leader
+
+    @property
+    def holder(self) -> str:
+        return self.leader.holder if self.leader is not None else "local"
+
+    def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def submit(
+        self,
+        company_id: Optional[int],
+        reason: str,
+        patterns: Iterable[str] = (),
+        remap: Optional[Dict[str, str]] = None,
+        removed: Iterable[str] = ()
+    ) -> Dict[str, Any]:
+        """Queue a job (company None: the global rules changed); safe to call from any thread or worker"""
+        job = {
+            "id": uuid.uuid4().hex,
+            "company_id": company_id,
+            "reasons": [reason],
+            "patterns": sorted(set(patterns)),
+            "remap": dict(remap or {}),
+            "removed": sorted(set(removed)),
+            "status": "queued",
+            "total": None,
+            "done": 0,
+            "changed": 0,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+        self.store.add(job)
+        if self._loop is not None and self._wakeup is not None:
+            # A job queued in the leading process starts without waiting for the next poll
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job
+
+    def jobs(self, company_id: int) -> List[Dict[str, Any]]:
+        """The company's jobs, newest first"""
+        return [self.describe(job) for job in self.store.jobs(company_id)]
+
+    def describe(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        summary = {key: value for key, value in job.items() if key not in ("patterns", "removed")}
+        summary["patterns"] = len(job["patterns"])
+        summary["removed"] = sorted(job["removed"])
+        summary["progress"] = round(job["done"] / job["total"], 4) if job["total"] else (
+            1.0 if job["status"] == "complete" else 0.0
+        )
+        return summary
+
+    def pending(self) -> int:
+        return self.store.pending()
+
+    async def _index(self, company_id: int) -> TermIndex:
+        """The company's index, built on first use and topped up with rows imported since"""
+        index = self._indexes.pop(company_id, None)
+        if index is None:
+            index = TermIndex()
+        self._indexes[company_id] = index
+        while len(self._indexes) > self.max_indexes:
+            self._indexes.popitem(last=False)
+        rows = await asyncio.to_thread(lambda: list(self.loader(company_id, index.last_id)))
+        index.add(rows)
+        return index
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        leading = False
+        while True:
+            self._wakeup.clear()
+            claimed: List[Dict[str, Any]] = []
+            try:
+                if self.is_leader:
+                    if not leading:
+                        # Jobs a previous leader was running when it went away start over here
+                        requeued = await asyncio.to_thread(self.store.requeue, self.holder)
+                        if requeued:
+                            logger.info(f"Re-queued {requeued} re-categorization jobs left running by another process")
+                    claimed = await asyncio.to_thread(self.store.claim, self.holder)
+                leading = self.is_leader
+                if claimed:
+                    await self._run_jobs(claimed)
+                    continue
+            except Exception as e:
+                logger.error(f"Re-categorization queue failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), RECATEGORIZE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_jobs(self, jobs: List[Dict[str, Any]]) -> None:
+        """Run claimed jobs of one company together, keeping their shared progress in the store"""
+        job_ids = [job["id"] for job in jobs]
+        run = {
+            "company_id": jobs[0]["company_id"],
+            "patterns": set().union(*(job["patterns"] for job in jobs)),
+            "remap": {old: new for job in jobs for old, new in job["remap"].items()},
+            "removed": set().union(*(job["removed"] for job in jobs)),
+            "total": 0,
+            "done": 0,
+            "changed": 0,
+        }
+        started = time.time()
+        status, error = "complete", None
+        try:
+            companies = [run["company_id"]] if run["company_id"] is not None else \
+                await asyncio.to_thread(lambda: list(self.companies()))
+            for company_id in companies:
+                await self._run_company(run, job_ids, company_id)
+        except Exception as e:
+            logger.error(f"Re-categorization jobs {', '.join(job_ids)} failed: {str(e)}")
+            status, error = "failed", str(e)
+        finished = time.time()
+        await asyncio.to_thread(
+            self.store.update, job_ids, status=status, error=error, finished_at=finished,
+            total=run["total"], done=run["done"], changed=run["changed"]
+        )
+        await asyncio.to_thread(self.store.prune, RECATEGORIZE_JOBS_KEPT)
+        logger.info(
+            f"Re-categorization jobs {', '.join(job_ids)} for company {run['company_id']} {status}: "
+            f"{run['changed']} of {run['done']} rows changed in {finished - started:.3f}s"
+        )
+
+    async def _run_company(self, run: Dict[str, Any], job_ids: List[str], company_id: int) -> None:
+        index = await self._index(company_id)
+        global_only = run["company_id"] is None
+        recompute = index.rows_for_patterns(run["patterns"], global_only) | index.rows_for_codes(run["removed"])
+        # Rows whose code was only renamed keep their suggestion under the new code
+        remap_only = index.rows_for_codes(run["remap"]) - recompute
+        # A recomputed row can come back with a removed code the local models still remember
+        codes: Dict[str, Optional[str]] = {**run["remap"], **dict.fromkeys(run["removed"])}
+        run["total"] += len(recompute) + len(remap_only)
+        await asyncio.to_thread(self.store.update, job_ids, total=run["total"])
+        for rows, rerun in ((sorted(recompute), True), (sorted(remap_only), False)):
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                changed = await self.process(company_id, batch, codes, rerun)
+                for row_id, (account_code, method) in changed.items():
+                    index.recoded(row_id, account_code, method)
+                run["done"] += len(batch)
+                run["changed"] += len(changed)
+                RECATEGORIZED_ROWS.inc(len(changed), outcome="changed")
+                RECATEGORIZED_ROWS.inc(len(batch) - len(changed), outcome="unchanged")
+                await asyncio.to_thread(self.store.update, job_ids, done=run["done"], changed=run["changed"])
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Reconciliation - Matches imported bank rows to booked transactions
+Both sides are bucketed by amount (in cents) and sorted by date, so each
+bank row only looks at the booked rows within the amount tolerance and the
+date window: O(n log n) instead of comparing every pair. Description
+similarity breaks ties, and leftovers are tried as split payments (one row
+on one side settling several on the other).
+"""
+
+import bisect
+import os
+import re
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+RECONCILE_ON_IMPORT = os.getenv("RECONCILE_ON_IMPORT", "true").lower() == "true"
+RECON_AMOUNT_TOLERANCE = float(os.getenv("RECON_AMOUNT_TOLERANCE", "0.01"))
+RECON_WINDOW_DAYS = int(os.getenv("RECON_WINDOW_DAYS", "5"))
+# Nearest-dated candidates scored per bank row, and the split search bounds
+RECON_MAX_CANDIDATES = int(os.getenv("RECON_MAX_CANDIDATES", "10"))
+RECON_SPLIT_CANDIDATES = int(os.getenv("RECON_SPLIT_CANDIDATES", "12"))
+RECON_SPLIT_MAX_PARTS = int(os.getenv("RECON_SPLIT_MAX_PARTS", "4"))
+# Nearest-dated rows looked at per split candidate kept
+SPLIT_NEARBY_FACTOR = 4
+
+# Booked transaction types that bring money in; everything else pays out
+INFLOW_TYPES = {"credit", "income", "receipt", "revenue", "deposit", "sale"}
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Character trigrams of the letters-only, space-padded text (reference numbers carry no name)"""
+    return _word_trigrams(" ".join(re.sub(r"[^a-z]+", " ", text.lower()).split()))
+
+
+@lru_cache(maxsize=65536)
+def _word_trigrams(words: str) -> FrozenSet[str]:
+    # Narrations differ mostly in reference numbers, so the letters-only text repeats a lot
+    grams = set()
+    for word in words.split():
+        padded = f"  {word} "
+        grams.update(padded[start:start + 3] for start in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def trigram_similarity(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def direction(transaction_type: Optional[str], amount: float = 0.0) -> int:
+    """+1 money in, -1 money out, 0 unknown"""
+    if amount < 0:
+        return -1
+    if not transaction_type:
+        return 0
+    return 1 if transaction_type.strip().lower() in INFLOW_TYPES else -1
+
+
+class Entry:
+    """One side's row reduced to what matching needs"""
+
+    __slots__ = ("id", "day", "cents", "sign", "description", "_grams")
+
+    def __init__(self, id: int, date: datetime, amount: float, sign: int, description: str):
+        self.id = id
+        self.day = date.toordinal()
+        self.cents = int(round(abs(amount) * 100))
+        self.sign = sign
+        self.description = description or ""
+        self._grams: Optional[FrozenSet[str]] = None
+
+    @property
+    def grams(self) -> FrozenSet[str]:
+        # Only rows that end up with candidates are ever compared
+        if self._grams is None:
+            self._grams = trigrams(self.description)
+        return self._grams
+
+
+def _compatible(first: Entry, second: Entry) -> bool:
+    return first.sign == 0 or second.sign == 0 or first.sign == second.sign
+
+
+class _DateIndex:
+    """Entries per amount bucket, sorted by day for window lookups"""
+
+    def __init__(self, entries: Sequence[Entry]):
+        self.buckets: Dict[int, Tuple[List[int], List[Entry]]] = {}
+        grouped: Dict[int, List[Entry]] = defaultdict(list)
+        for entry in entries:
+            grouped[entry.cents].append(entry)
+        for cents, bucket in grouped.items():
+            bucket.sort(key=lambda entry: entry.day)
+            self.buckets[cents] = ([entry.day for entry in bucket], bucket)
+
+    def window(self, cents: int, tolerance_cents: int, day: int, window_days: int) -> List[Entry]:
+        found: List[Entry] = []
+        for bucket_cents in range(cents - tolerance_cents, cents + tolerance_cents + 1):
+            bucket = self.buckets.get(bucket_cents)
+            if bucket is None:
+                continue
+            days, entries = bucket
+            found.extend(entries[bisect.bisect_left(days, day - window_days):bisect.bisect_right(days, day + window_days)])
+        return found
+
+
+def _score(bank: Entry, book: Entry, tolerance_cents: int, window_days: int) -> float:
+    """Date proximity first, description similarity for ties, exact amounts slightly preferred"""
+    date_score = 1.0 - abs(bank.day - book.day) / (window_days + 1)
+    amount_score = 1.0 - abs(bank.cents - book.cents) / (tolerance_cents + 1)
+    return round(0.5 * date_score + 0.35 * trigram_similarity(bank.grams, book.grams) + 0.15 * amount_score, 4)
+
+
+def _split_score(single: Entry, parts: List[Entry], tolerance_cents: int, window_days: int) -> float:
+    """_score with the parts' dates and descriptions averaged and their total as the amount"""
+    date_score = sum(1.0 - abs(single.day - part.day) / (window_days + 1) for part in parts) / len(parts)
+    similarity = sum(trigram_similarity(single.grams, part.grams) for part in parts) / len(parts)
+    amount_score = 1.0 - abs(single.cents - sum(part.cents for part in parts)) / (tolerance_cents + 1)
+    return 0.5 * date_score + 0.35 * similarity + 0.15 * amount_score
+
+
+def match_one_to_one(
+    bank: Sequence[Entry],
+    book: Sequence[Entry],
+    tolerance: float = RECON_AMOUNT_TOLERANCE,
+    window_days: int = RECON_WINDOW_DAYS,
+    max_candidates: int = RECON_MAX_CANDIDATES
+) -> List[Tuple[Entry, Entry, float]]:
+    """Best-scoring disjoint (bank, book) pairs within the amount tolerance and date window"""
+    tolerance_cents = int(round(tolerance * 100))
+    index = _DateIndex(book)
+    pairs: List[Tuple[float, int, int, Entry, Entry]] = []
+    for bank_entry in bank:
+        candidates = [
+            book_entry for book_entry in index.window(bank_entry.cents, tolerance_cents, bank_entry.day, window_days)
+            if _compatible(bank_entry, book_entry)
+        ]
+        candidates.sort(key=lambda book_entry: abs(book_entry.day - bank_entry.day))
+        for book_entry in candidates[:max_candidates]:
+            score = _score(bank_entry, book_entry, tolerance_cents, window_days)
+            pairs.append((score, bank_entry.id, book_entry.id, bank_entry, book_entry))
+
+    # Greedy by score: each row joins its best pair that is still free
+    pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+    used_bank, used_book = set(), set()
+    matches = []
+    for score, bank_id, book_id, bank_entry, book_entry in pairs:
+        if bank_id in used_bank or book_id in used_book:
+            continue
+        used_bank.add(bank_id)
+        used_book.add(book_id)
+        matches.append((bank_entry, book_entry, score))
+    return matches
+
+
+def _subset_with_sum(amounts: List[int], target: int, tolerance_cents: int, max_parts: int) -> List[Tuple[int, ...]]:
+    """Index groups of 2..max_parts (at most 4) amounts summing to target, smallest groups only
+
+    Pair sums are hashed, so a candidate list of k costs O(k^2) rather than
+    trying every combination.
+    """
+    targets = range(target - tolerance_cents, target + tolerance_cents + 1)
+    pairs: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+    for first in range(len(amounts)):
+        for second in range(first + 1, len(amounts)):
+            pairs[amounts[first] + amounts[second]].append((first, second))
+    groups = [pair for total in targets for pair in pairs.get(total, ())]
+    if groups or max_parts < 3:
+        return groups  # type: ignore[return-value]
+    found = set()
+    for third, amount in enumerate(amounts):
+        for total in targets:
+            for pair in pairs.get(total - amount, ()):
+                if third not in pair:
+                    found.add(tuple(sorted(pair + (third,))))
+    if found or max_parts < 4:
+        return list(found)
+    for total, first_pairs in list(pairs.items()):
+        for other in targets:
+            for first_pair in first_pairs:
+                for second_pair in pairs.get(other - total, ()):
+                    if not set(first_pair) & set(second_pair):
+                        found.add(tuple(sorted(first_pair + second_pair)))
+    return list(found)
+
+
+def match_splits(
+    singles: Sequence[Entry],
+    parts: Sequence[Entry],
+    tolerance: float = RECON_AMOUNT_TOLERANCE,
+    window_days: int = RECON_WINDOW_DAYS,
+    max_candidates: int = RECON_SPLIT_CANDIDATES,
+    max_parts: int = RECON_SPLIT_MAX_PARTS
+) -> List[Tuple[Entry, List[Entry], float]]:
+    """Rows of ``singles`` whose amount is the sum of 2..max_parts rows of ``parts``
+
+    Candidate parts are free, the same direction and smaller than the
+    single; of the closest in date, the ``max_candidates`` with the most
+    similar descriptions are kept, which bounds the subset search per row. Among groups with the fewest parts the best
+    scoring one wins.
+    """
+    tolerance_cents = int(round(tolerance * 100))
+    by_day = sorted(parts, key=lambda entry: entry.day)
+    days = [entry.day for entry in by_day]
+    used: set = set()
+    matches = []
+    for single in sorted(singles, key=lambda entry: -entry.cents):
+        low = bisect.bisect_left(days, single.day - window_days)
+        high = bisect.bisect_right(days, single.day + window_days)
+        center = bisect.bisect_left(days, single.day, low, high)
+        # Walk outwards from the single's date, then keep the most similar descriptions
+        candidates: List[Entry] = []
+        before, after = center - 1, center
+        while len(candidates) < SPLIT_NEARBY_FACTOR * max_candidates and (before >= low or after < high):
+            if after < high and (before < low or days[after] - single.day <= single.day - days[before]):
+                part, after = by_day[after], after + 1
+            else:
+                part, before = by_day[before], before - 1
+            if part.id not in used and part.cents < single.cents and _compatible(single, part):
+                candidates.append(part)
+        candidates.sort(key=lambda part: -trigram_similarity(single.grams, part.grams))
+        candidates = candidates[:max_candidates]
+        groups = _subset_with_sum([part.cents for part in candidates], single.cents, tolerance_cents, max_parts)
+        if not groups:
+            continue
+        scored = [(_split_score(single, [candidates[index] for index in group], tolerance_cents, window_days), group)
+                  for group in groups]
+        score, group = max(scored, key=lambda item: item[0])
+        chosen = [candidates[index] for index in group]
+        used.update(part.id for part in chosen)
+        matches.append((single, chosen, round(score, 4)))
+    return matches
+
+
+def reconcile(
+    bank: Sequence[Entry],
+    book: Sequence[Entry],
+    tolerance: float = RECON_AMOUNT_TOLERANCE,
+    window_days: int = RECON_WINDOW_DAYS
+) -> Dict[str, Any]:
+    """Match sets (kind, bank ids, book ids, score) plus the ids left unmatched on each side"""
+    match_sets: List[Dict[str, Any]] = []
+    for bank_entry, book_entry, score in match_one_to_one(bank, book, tolerance, window_days):
+        match_sets.append({"kind": "one_to_one", "bank": [bank_entry.id], "book": [book_entry.id], "score": score})
+    matched_bank = {bank_id for match in match_sets for bank_id in match["bank"]}
+    matched_book = {book_id for match in match_sets for book_id in match["book"]}
+
+    # One bank payment settling several booked transactions, then one booking paid in instalments
+    for single, group, score in match_splits(
+        [entry for entry in bank if entry.id not in matched_bank],
+        [entry for entry in book if entry.id not in matched_book],
+        tolerance, window_days
+    ):
+        match_sets.append({"kind": "split_book", "bank": [single.id], "book": [part.id for part in group], "score": score})
+        matched_bank.add(single.id)
+        matched_book.update(part.id for part in group)
+    for single, group, score in match_splits(
+        [entry for entry in book if entry.id not in matched_book],
+        [entry for entry in bank if entry.id not in matched_bank],
+        tolerance, window_days
+    ):
+        match_sets.append({"kind": "split_bank", "bank": [part.id for part in group], "book": [single.id], "score": score})
+        matched_book.add(single.id)
+        matched_bank.update(part.id for part in group)
+
+    return {
+        "matches": match_sets,
+        "unmatched_bank": [entry.id for entry in bank if entry.id not in matched_bank],
+        "unmatched_book": [entry.id for entry in book if entry.id not in matched_book],
+    }
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Rule Mining - High-precision categorization rules learned from history
+Narration words and word pairs that (almost) always map to one category
+and account code are promoted to per-company rules, checked before any
+model or LLM call. Rules many companies agree on become global rules that
+extend the keyword fallbacks.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Protocol, Set, Tuple
+
+from knn_categorizer import is_confirmed
+from leader_election import LeaderElection
+from metrics import counter, gauge
+from nb_classifier import WORD_BREAKS
+
+logger = logging.getLogger(__name__)
+
+RULE_MINING_ENABLED = os.getenv("RULE_MINING_ENABLED", "true").lower() == "true"
+RULE_MINING_INTERVAL_SECONDS = float(os.getenv("RULE_MINING_INTERVAL_SECONDS", "3600"))
+# How often the other workers look for rules the mining process published
+RULE_SNAPSHOT_POLL_SECONDS = float(os.getenv("RULE_SNAPSHOT_POLL_SECONDS", "60"))
+RULE_MIN_SUPPORT = int(os.getenv("RULE_MIN_SUPPORT", "5"))
+RULE_MIN_PRECISION = float(os.getenv("RULE_MIN_PRECISION", "0.95"))
+# Words found in more than this share of a company's narrations (UPI, NEFT, ...) say nothing
+RULE_MAX_COVERAGE = float(os.getenv("RULE_MAX_COVERAGE", "0.5"))
+# Companies that must agree on a pattern before it becomes a global rule
+RULE_MIN_COMPANIES = int(os.getenv("RULE_MIN_COMPANIES", "3"))
+RULE_REPORT_TOP = 50
+
+RULE_MATCHES = counter(
+    "saimjr_rule_matches_total", "Mined rule lookups by scope (company/global) and outcome", ["scope", "outcome"]
+)
+
+Label = Tuple[str, Optional[str]]  # category, account_code
+Example = Tuple[int, str, str, Optional[str]]  # company_id, description, category, account_code
+
+
+def narration_features(description: str) -> List[str]:
+    """Distinct words and adjacent word pairs (counterparty names often span two words)"""
+    words = [word for word in description.lower().translate(WORD_BREAKS).split() if len(word) > 1]
+    pairs = [f"{first} {second}" for first, second in zip(words, words[1:])]
+    return list(dict.fromkeys(words + pairs))
+
+
+class Rule:
+    __slots__ = ("pattern", "label", "support", "precision")
+
+    def __init__(self, pattern: str, label: Label, support: int, precision: float):
+        self.pattern = pattern
+        self.label = label
+        self.support = support
+        self.precision = precision
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pattern": self.pattern,
+            "category": self.label[0],
+            "account_code": self.label[1],
+            "support": self.support,
+            "precision": round(self.precision, 4),
+        }
+
+
+class RuleSet:
+    """Rules compiled into a feature -> rule table, matched in O(narration features)"""
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = sorted(rules, key=lambda rule: (-rule.precision, -rule.support, rule.pattern))
+        self._table = {rule.pattern: rule for rule in self.rules}
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def labels(self) -> Dict[str, Label]:
+        return {rule.pattern: rule.label for rule in self.rules}
+
+    def match(self, description: str) -> Optional[Rule]:
+        """Best matching rule, or None when nothing matches or matching rules disagree"""
+        matched = [rule for rule in map(self._table.get, narration_features(description)) if rule is not None]
+        if not matched:
+            return None
+        best = max(matched, key=lambda rule: (rule.precision, rule.support))
+        if any(rule.label != best.label for rule in matched):
+            return None
+        return best
+
+
+def mine_company_rules(
+    examples: Iterable[Tuple[str, str, Optional[str]]],
+    min_support: int = RULE_MIN_SUPPORT,
+    min_precision: float = RULE_MIN_PRECISION,
+    max_coverage: float = RULE_MAX_COVERAGE
+) -> Tuple[List[Rule], int]:
+    """Rules from one company's (description, category, account_code) rows; also returns rows used"""
+    support: Counter = Counter()
+    labels: Dict[str, Counter] = defaultdict(Counter)
+    rows = 0
+    for description, category, account_code in examples:
+        if not is_confirmed(category):
+            continue
+        rows += 1
+        for feature in narration_features(description):
+            support[feature] += 1
+            labels[feature][(category, account_code)] += 1
+
+    max_support = max(min_support, int(rows * max_coverage))
+    rules: Dict[str, Rule] = {}
+    for feature, count in support.items():
+        if count < min_support or count > max_support:
+            continue
+        label, hits = labels[feature].most_common(1)[0]
+        precision = hits / count
+        if precision >= min_precision:
+            rules[feature] = Rule(feature, label, count, precision)
+    # A word pair adds nothing when one of its words already is a rule for the same label
+    for feature in [feature for feature in rules if " " in feature]:
+        rule = rules[feature]
+        if any(rules.get(word) is not None and rules[word].label == rule.label for word in feature.split()):
+            del rules[feature]
+    return list(rules.values()), rows
+
+
+def rule_changes(old: Dict[str, Label], new: Dict[str, Label]) -> Set[str]:
+    """Patterns added, dropped or relabelled between two runs"""
+    return {pattern for pattern in old.keys() | new.keys() if old.get(pattern) != new.get(pattern)}
+
+
+def merge_global_rules(company_rules: Dict[int, List[Rule]], min_companies: int = RULE_MIN_COMPANIES) -> List[Rule]:
+    """Patterns that at least ``min_companies`` companies map to the same label and none contradicts"""
+    by_pattern: Dict[str, List[Rule]] = defaultdict(list)
+    for rules in company_rules.values():
+        for rule in rules:
+            by_pattern[rule.pattern].append(rule)
+    merged = []
+    for pattern, rules in by_pattern.items():
+        if len(rules) < min_companies or len({rule.label for rule in rules}) != 1:
+            continue
+        support = sum(rule.support for rule in rules)
+        precision = sum(rule.precision * rule.support for rule in rules) / support
+        merged.append(Rule(pattern, rules[0].label, support, precision))
+    return merged
+
+
+class RuleSnapshots(Protocol):
+    """Where the mining process publishes its rules for the other workers"""
+
+    def mined_at(self) -> Optional[float]: ...
+
+    def load(self) -> Optional[Dict[str, Any]]: ...
+
+    def save(self, mined_at: float, rules: Dict[str, Any], report: Dict[str, Any]) -> None: ...
+
+
+def _rule_rows(rules: Iterable[Rule]) -> List[List[Any]]:
+    return [[rule.pattern, rule.label[0], rule.label[1], rule.support, rule.precision] for rule in rules]
+
+
+def _rules_from_rows(rows: Iterable[List[Any]]) -> List[Rule]:
+    return [Rule(pattern, (category, account_code), support, precision)
+            for pattern, category, account_code, support, precision in rows]
+
+
+class RuleBook:
+    """Mined rules for every company plus the global ones, swapped in atomically per run
+
+    ``loader()`` yields (company_id, description, category, account_code)
+    for the history to mine. After every run but the first, ``on_change``
+    gets company_id (None for the global rules) -> patterns that changed.
+
+    With ``snapshots`` and a ``leader``, only the leading process mines on
+    schedule; each run is published, and the other workers swap in the
+    published rules instead of mining the same history themselves.
+    """
+
+    def __init__(self, loader: Optional[Callable[[], Iterable[Example]]] = None):
+        self.loader = loader
+        self.on_change: Optional[Callable[[Dict[Optional[int], Set[str]]], None]] = None
+        self.snapshots: Optional[RuleSnapshots] = None
+        self.leader: Optional[LeaderElection] = None
+        self._company: Dict[int, RuleSet] = {}
+        self._global = RuleSet([])
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.report: Dict[str, Any] = {"status": "not_run"}
+
+    def match_company(self, company_id: int, description: str) -> Optional[Rule]:
+        rules = self._company.get(company_id)
+        rule = rules.match(description) if rules else None
+        RULE_MATCHES.inc(scope="company", outcome="hit" if rule else "miss")
+        return rule
+
+    def match_global(self, description: str) -> Optional[Rule]:
+        rule = self._global.match(description) if self._global else None
+        RULE_MATCHES.inc(scope="global", outcome="hit" if rule else "miss")
+        return rule
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader is None or self.leader.is_leader
+
+    def restore(self) -> bool:
+        """Swap in the published rules when they are newer than the ones held; returns whether they were"""
+        if self.snapshots is None:
+            return False
+        mined_at = self.snapshots.mined_at()
+        if mined_at is None or mined_at <= self.report.get("mined_at", 0.0):
+            return False
+        snapshot = self.snapshots.load()
+        if snapshot is None:
+            return False
+        with self._lock:
+            self._company = {
+                int(company_id): RuleSet(_rules_from_rows(rows))
+                for company_id, rows in snapshot["rules"]["company"].items()
+            }
+            self._global = RuleSet(_rules_from_rows(snapshot["rules"]["global"]))
+            self.report = snapshot["report"]
+        logger.info(f"Loaded the rules mined at {mined_at:.0f}: {self.report['company_rules']} company rules")
+        return True
+
+    def mine(self) -> Dict[str, Any]:
+        """Mine the loader's whole history and replace the current rules; returns the report
+
+        Changes are reported against the latest published rules, so a run
+        never repeats changes another process already announced.
+        """
+        if self.loader is None:
+            raise RuntimeError("RuleBook has no history loader")
+        self.restore()
+        with self._lock:
+            started = time.perf_counter()
+            history: Dict[int, List[Tuple[str, str, Optional[str]]]] = defaultdict(list)
+            for company_id, description, category, account_code in self.loader():
+                if is_confirmed(category):
+                    history[company_id].append((description, category, account_code))
+
+            company_rules: Dict[int, List[Rule]] = {}
+            companies: Dict[str, Any] = {}
+            for company_id, examples in history.items():
+                rules, rows = mine_company_rules(examples)
+                company_rules[company_id] = rules
+                rule_set = RuleSet(rules)
+                covered = sum(1 for description, _, _ in examples if rule_set.match(description) is not None)
+                companies[str(company_id)] = {
+                    "rows": rows,
+                    "rules": len(rules),
+                    "coverage": round(covered / len(examples), 4) if examples else 0.0,
+                    "top_rules": [rule.to_dict() for rule in rule_set.rules[:RULE_REPORT_TOP]],
+                }
+            global_rules = merge_global_rules(company_rules)
+            previous = {company_id: rules.labels() for company_id, rules in self._company.items()}
+            previous_global = self._global.labels()
+            first_run = self.report.get("status") != "complete"
+
+            self._company = {company_id: RuleSet(rules) for company_id, rules in company_rules.items() if rules}
+            self._global = RuleSet(global_rules)
+            self.report = {
+                "status": "complete",
+                "mined_at": time.time(),
+                "seconds": round(time.perf_counter() - started, 3),
+                "thresholds": {
+                    "min_support": RULE_MIN_SUPPORT,
+                    "min_precision": RULE_MIN_PRECISION,
+                    "max_coverage": RULE_MAX_COVERAGE,
+                    "min_companies": RULE_MIN_COMPANIES,
+                },
+                "company_rules": sum(len(rules) for rules in company_rules.values()),
+                "global_rules": [rule.to_dict() for rule in self._global.rules],
+                "companies": companies,
+            }
+            logger.info(
+                f"Mined {self.report['company_rules']} company rules and {len(global_rules)} global rules "
+                f"from {len(history)} companies in {self.report['seconds']:.3f}s"
+            )
+            report = self.report
+            if self.snapshots is not None:
+                try:
+                    self.snapshots.save(report["mined_at"], {
+                        "company": {
+                            str(company_id): _rule_rows(rules) for company_id, rules in company_rules.items() if rules
+                        },
+                        "global": _rule_rows(global_rules),
+                    }, report)
+                except Exception as e:
+                    logger.error(f"Failed to publish mined rules: {str(e)}")
+
+            # The first run only restores what the previous process had; later ones are real edits
+            changes: Dict[Optional[int], Set[str]] = {}
+            if not first_run:
+                for company_id in previous.keys() | self._company.keys():
+                    current = self._company.get(company_id)
+                    changed = rule_changes(previous.get(company_id, {}), current.labels() if current else {})
+                    if changed:
+                        changes[company_id] = changed
+                changed_global = rule_changes(previous_global, self._global.labels())
+                if changed_global:
+                    changes[None] = changed_global
+        if changes and self.on_change is not None:
+            self.on_change(changes)
+        return report
+
+    def start(self, interval: float = RULE_MINING_INTERVAL_SECONDS) -> None:
+        """Re-mine every ``interval`` seconds in the background, starting now when no rules are loaded yet"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, interval: float) -> None:
+        poll = min(interval, RULE_SNAPSHOT_POLL_SECONDS) if self.snapshots is not None else interval
+        while True:
+            try:
+                # Within one poll of being due counts as due, so a run is never put off by a whole interval
+                if self.is_leader and time.time() - self.report.get("mined_at", 0.0) >= interval - poll:
+                    await asyncio.to_thread(self.mine)
+                else:
+                    await asyncio.to_thread(self.restore)
+            except Exception as e:
+                logger.error(f"Rule mining failed: {str(e)}")
+            await asyncio.sleep(poll)
+
+    def company_report(self, company_id: int) -> Dict[str, Any]:
+        companies = self.report.get("companies", {})
+        return companies.get(str(company_id), {"rows": 0, "rules": 0, "coverage": 0.0, "top_rules": []})
+
+    def counts(self) -> Dict[str, int]:
+        return {"company": sum(len(rules) for rules in self._company.values()), "global": len(self._global)}
+
+
+# Shared by the servers and by the keyword fallbacks in both categorizers
+rule_book = RuleBook()
+
+gauge(
+    "saimjr_mined_rules", "Mined categorization rules currently loaded, by scope", ["scope"],
+    collect=lambda: {(scope,): float(count) for scope, count in rule_book.counts().items()}
+)
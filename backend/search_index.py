@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Search Index - Full-text search over transaction, statement and contact text
+SQLite gets contentless FTS5 tables kept in sync by triggers (so the bulk
+insert path is covered too), with the company as an indexed column so a
+search only walks that company's postings. PostgreSQL gets GIN indexes on
+to_tsvector expressions, which the database keeps current by itself. Other
+databases fall back to LIKE scans.
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import DateTime, text  # type: ignore[import-untyped]
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MAX_TERMS = 8
+
+# kind -> source table, text column, company expression, extra columns returned
+SOURCES: Dict[str, Dict[str, str]] = {
+    "transactions": {
+        "table": "transactions",
+        "text": "description",
+        "company": "new.company_id",
+        "company_old": "old.company_id",
+        "scope": "src.company_id = :company_id",
+        "join": "",
+        "columns": "src.description AS text, src.date AS date, src.amount AS amount, src.category AS category",
+    },
+    "statement_rows": {
+        "table": "raw_transactions",
+        "text": "description",
+        "company": "(SELECT company_id FROM bank_statements WHERE id = new.bank_statement_id)",
+        "company_old": "(SELECT company_id FROM bank_statements WHERE id = old.bank_statement_id)",
+        "scope": "bs.company_id = :company_id",
+        "join": "JOIN bank_statements bs ON bs.id = src.bank_statement_id",
+        "columns": "src.description AS text, src.transaction_date AS date, src.amount AS amount, "
+                   "src.bank_statement_id AS bank_statement_id",
+    },
+    "contacts": {
+        "table": "contacts",
+        "text": "name",
+        "company": "new.company_id",
+        "company_old": "old.company_id",
+        "scope": "src.company_id = :company_id",
+        "join": "",
+        "columns": "src.name AS text, src.contact_type AS contact_type, src.email AS email",
+    },
+}
+
+
+def search_terms(query: str) -> List[str]:
+    """Words of the user's query; punctuation is dropped so nothing is parsed as FTS syntax"""
+    return re.findall(r"\w+", query.lower())[:SEARCH_MAX_TERMS]
+
+
+def _fts_table(kind: str) -> str:
+    return f"{SOURCES[kind]['table']}_fts"
+
+
+def _sqlite_ddl(kind: str) -> List[str]:
+    source = SOURCES[kind]
+    table, column, fts = source["table"], source["text"], _fts_table(kind)
+    insert = (f"INSERT INTO {fts}(rowid, body, company) "
+              f"VALUES (new.id, coalesce(new.{column}, ''), 'c' || {source['company']});")
+    delete = (f"INSERT INTO {fts}({fts}, rowid, body, company) "
+              f"VALUES ('delete', old.id, coalesce(old.{column}, ''), 'c' || {source['company_old']});")
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN {delete} {insert} END",
+    ]
+
+
+class SearchIndex:
+    """Creates the dialect's index once and runs ranked, company-scoped searches"""
+
+    def __init__(self):
+        self.mode: Optional[str] = None
+
+    def install(self, engine: Any) -> str:
+        """Create missing indexes (and backfill new FTS tables); returns the mode in use"""
+        dialect = engine.dialect.name
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                for kind, source in SOURCES.items():
+                    fts = _fts_table(kind)
+                    exists = conn.execute(
+                        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}
+                    ).first()
+                    if not exists:
+                        # Contentless: only the postings are stored, the text stays in the source table
+                        conn.execute(text(
+                            f"CREATE VIRTUAL TABLE {fts} USING fts5(body, company, content='', "
+                            f"tokenize='unicode61 remove_diacritics 2')"
+                        ))
+                        company = source["company"].replace("new.", "src.")
+                        conn.execute(text(
+                            f"INSERT INTO {fts}(rowid, body, company) "
+                            f"SELECT src.id, coalesce(src.{source['text']}, ''), 'c' || {company} FROM {source['table']} src"
+                        ))
+                        logger.info(f"Created full-text index {fts}")
+                    for statement in _sqlite_ddl(kind):
+                        conn.execute(text(statement))
+                self.mode = "fts5"
+            elif dialect == "postgresql":
+                for kind, source in SOURCES.items():
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_{source['table']}_{source['text']}_tsv ON {source['table']} "
+                        f"USING GIN (to_tsvector('simple', coalesce({source['text']}, '')))"
+                    ))
+                self.mode = "tsvector"
+            else:
+                logger.warning(f"No full-text index for {dialect}; search falls back to LIKE scans")
+                self.mode = "like"
+        return self.mode
+
+    def _detect(self, engine: Any) -> None:
+        """Mode for a process that skipped install(): SQLite needs its FTS tables, the others only a query"""
+        dialect = engine.dialect.name
+        if dialect == "sqlite":
+            # Read-only: DDL from here would bypass the SQLite writer queue, so the tables come from migrate.py
+            with engine.connect() as conn:
+                found = {name for name, in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+            missing = [_fts_table(kind) for kind in SOURCES if _fts_table(kind) not in found]
+            if missing:
+                logger.warning(f"Full-text tables missing ({', '.join(missing)}); run migrate.py. Searching with LIKE")
+            self.mode = "like" if missing else "fts5"
+        else:
+            # Without the GIN index PostgreSQL still answers, by scanning; the index comes from migrate.py
+            self.mode = "tsvector" if dialect == "postgresql" else "like"
+
+    def search(
+        self,
+        session: Any,
+        company_id: int,
+        query: str,
+        kinds: Sequence[str] = tuple(SOURCES),
+        limit: int = 20,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """Best-ranked hits across ``kinds``; every term must match, the last one as a prefix"""
+        terms = search_terms(query)
+        if not terms:
+            return {"results": [], "has_more": False, "mode": self.mode}
+        if self.mode is None:
+            self._detect(session.get_bind())
+        # Each kind returns its own top (offset + limit + 1); merged by rank that covers the page
+        window = offset + limit + 1
+        hits: List[Dict[str, Any]] = []
+        for kind in kinds:
+            sql, params = getattr(self, f"_{self.mode}_query")(kind, terms, company_id)
+            params.update(company_id=company_id, window=window)
+            statement = text(sql)
+            if "AS date" in sql:
+                # SQLite hands raw SQL dates back as strings; type them like the ORM would
+                statement = statement.columns(date=DateTime)
+            for row in session.execute(statement, params).mappings():
+                hits.append(dict(row, kind=kind))
+        hits.sort(key=lambda hit: hit["rank"])
+        page = hits[offset:offset + limit]
+        return {"results": page, "has_more": len(hits) > offset + limit, "mode": self.mode}
+
+    def _fts5_query(self, kind: str, terms: List[str], company_id: int):
+        source, fts = SOURCES[kind], _fts_table(kind)
+        # Terms are quoted so FTS5 reads them as strings, never as operators
+        words = [f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*']
+        match = f'company : "c{company_id}" AND body : (' + " AND ".join(words) + ")"
+        sql = (
+            f"SELECT src.id AS id, {source['columns']}, bm25({fts}, 1.0, 0.0) AS rank "
+            f"FROM {fts} JOIN {source['table']} src ON src.id = {fts}.rowid "
+            f"WHERE {fts} MATCH :match ORDER BY rank LIMIT :window"
+        )
+        return sql, {"match": match}
+
+    def _tsvector_query(self, kind: str, terms: List[str], company_id: int):
+        source = SOURCES[kind]
+        vector = f"to_tsvector('simple', coalesce(src.{source['text']}, ''))"
+        sql = (
+            f"SELECT src.id AS id, {source['columns']}, -ts_rank({vector}, q.query) AS rank "
+            f"FROM {source['table']} src {source['join']}, to_tsquery('simple', :tsquery) AS q(query) "
+            f"WHERE {source['scope']} AND {vector} @@ q.query ORDER BY rank LIMIT :window"
+        )
+        return sql, {"tsquery": " & ".join(terms[:-1] + [f"{terms[-1]}:*"])}
+
+    def _like_query(self, kind: str, terms: List[str], company_id: int):
+        source = SOURCES[kind]
+        conditions = " AND ".join(f"lower(src.{source['text']}) LIKE :term{index}" for index in range(len(terms)))
+        sql = (
+            f"SELECT src.id AS id, {source['columns']}, 0 AS rank FROM {source['table']} src {source['join']} "
+            f"WHERE {source['scope']} AND {conditions} ORDER BY src.id DESC LIMIT :window"
+        )
+        return sql, {f"term{index}": f"%{term}%" for index, term in enumerate(terms)}
+
+
+search_index = SearchIndex()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+SQLite Mode - WAL journaling, a pool of read connections and a serialized writer
+Single-node deployments keep reads parallel across threads, while small
+inserts go through one writer thread that groups them into shared commits.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy import create_engine, event  # type: ignore[import-untyped]
+from sqlalchemy.orm import Session, sessionmaker  # type: ignore[import-untyped]
+from sqlalchemy.pool import StaticPool  # type: ignore[import-untyped]
+
+from metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "65536"))
+SQLITE_WRITE_QUEUE = os.getenv("SQLITE_WRITE_QUEUE", "true").lower() == "true"
+SQLITE_WRITE_BATCH = int(os.getenv("SQLITE_WRITE_BATCH", "64"))
+# How long the writer waits for more jobs to join a commit that has one already
+SQLITE_WRITE_WINDOW_SECONDS = float(os.getenv("SQLITE_WRITE_WINDOW_MS", "2")) / 1000
+
+WRITE_BATCH_SIZE = histogram(
+    "saimjr_sqlite_write_batch_size", "Jobs grouped into one SQLite writer commit",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+WRITE_QUEUE_SECONDS = histogram(
+    "saimjr_sqlite_write_queue_seconds", "Time from submitting a write until its commit",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+
+def is_memory_url(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+
+def _apply_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def create_sqlite_engine(url: str, writer: bool = False) -> Any:
+    """Engine for a SQLite URL: tuned WAL pool for files, one shared connection in memory
+
+    SQLITE_READ_POOL_SIZE connections are kept open for reuse; bursts above
+    that open short-lived extra connections, which WAL readers can afford.
+
+    The writer engine holds a single connection and starts every transaction
+    with BEGIN IMMEDIATE, so it takes the write lock up front instead of
+    failing a read-to-write upgrade with "database is locked".
+    """
+    connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    if is_memory_url(url):
+        # Each connection to :memory: is a separate database, so all threads share one
+        return create_engine(url, connect_args=connect_args, poolclass=StaticPool, echo=False)
+
+    engine = create_engine(
+        url,
+        connect_args=connect_args,
+        pool_size=1 if writer else SQLITE_READ_POOL_SIZE,
+        # Readers never wait for a connection: async routes hold theirs across awaits, so
+        # a bounded pool can block a checkout on the event loop that those awaits need
+        max_overflow=0 if writer else -1,
+        pool_timeout=30,
+        echo=False
+    )
+    event.listen(engine, "connect", _apply_pragmas)
+    if writer:
+        @event.listens_for(engine, "connect")
+        def _manual_transactions(dbapi_connection, connection_record):
+            # Let SQLAlchemy emit BEGIN (pysqlite's implicit BEGIN breaks SAVEPOINTs)
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def _begin_immediate(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+    return engine
+
+
+class _WriteJob:
+    __slots__ = ("apply", "future", "submitted")
+
+    def __init__(self, apply: Callable[[Session], Any]):
+        self.apply = apply
+        self.future: Future = Future()
+        self.submitted = time.perf_counter()
+
+
+class SQLiteWriteQueue:
+    """Single writer thread that commits queued jobs in groups
+
+    Each job runs in its own SAVEPOINT, so a failing job (e.g. a unique
+    constraint) is rolled back and reported to its caller alone while the
+    rest of the group still commits. Objects come back detached with their
+    column attributes loaded.
+    """
+
+    def __init__(self, engine: Any, batch_size: int = SQLITE_WRITE_BATCH,
+                 window_seconds: float = SQLITE_WRITE_WINDOW_SECONDS):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.window_seconds = window_seconds
+        self._sessions = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+        self._queue: "queue.Queue[Optional[_WriteJob]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.commits = 0
+        self.jobs = 0
+
+    def submit(self, apply: Callable[[Session], Any]) -> Future:
+        """Queue ``apply(session)``; the future resolves with its result after the commit"""
+        if self._thread is None:
+            # Started on first use so no thread exists before a pre-forking server forks
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                    self._thread.start()
+        job = _WriteJob(apply)
+        self._queue.put(job)
+        return job.future
+
+    def add(self, obj: Any) -> Future:
+        """Insert a new ORM object; resolves with the object, primary key populated"""
+        def apply(session: Session) -> Any:
+            session.add(obj)
+            session.flush()
+            return obj
+        return self.submit(apply)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Commit what is queued, then stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _next_batch(self) -> Tuple[List[_WriteJob], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.perf_counter() + self.window_seconds
+        while len(batch) < self.batch_size:
+            try:
+                job = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if job is None:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch: List[_WriteJob]) -> None:
+        results: List[Tuple[_WriteJob, Any, Optional[BaseException]]] = []
+        session = self._sessions()
+        try:
+            for job in batch:
+                try:
+                    with session.begin_nested():
+                        results.append((job, job.apply(session), None))
+                except Exception as e:
+                    results.append((job, None, e))
+            session.commit()
+        except Exception as e:
+            logger.error(f"SQLite writer commit of {len(batch)} jobs failed: {str(e)}")
+            session.rollback()
+            results = [(job, None, e) for job in batch]
+        finally:
+            session.close()
+
+        self.commits += 1
+        self.jobs += len(batch)
+        WRITE_BATCH_SIZE.observe(len(batch))
+        now = time.perf_counter()
+        for job, result, error in results:
+            WRITE_QUEUE_SECONDS.observe(now - job.submitted)
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
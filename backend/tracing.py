@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Tracing - Lightweight spans for requests, SQL statements and AI workflow steps
+Finished spans go to an in-memory ring buffer and optionally a JSON lines file
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "5000"))
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")
+# Longest SQL text kept on a span; statements are recorded without parameters
+TRACE_SQL_CHARS = 300
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [trace=%(trace_id)s] %(message)s"
+
+# Incoming X-Request-ID values are reused as the trace ID when they look safe
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{8,64}$")
+
+
+class Span:
+    """One timed operation; the parent links spans of the same trace into a tree"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes",
+                 "started_at", "_started", "duration_ms", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self, error: Optional[BaseException] = None, status: Optional[str] = None) -> None:
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        if status is not None:
+            self.status = status
+        if error is not None:
+            self.status = "error"
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        exporter.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter:
+    """Ring buffer of finished spans, mirrored to a JSON lines file when configured"""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE, path: Optional[str] = TRACE_EXPORT_FILE):
+        self._spans: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self._path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        record = span.to_dict()
+        with self._lock:
+            self._spans.append(record)
+            if self._path:
+                try:
+                    with open(self._path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, default=str) + "\n")
+                except OSError:
+                    self._path = None
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = list(self._spans)
+        if trace_id is not None:
+            spans = [span for span in spans if span["trace_id"] == trace_id]
+        return spans
+
+    def traces(self, limit: int = 20, min_duration_ms: float = 0.0) -> List[Dict[str, Any]]:
+        """Most recent traces whose root span is at least ``min_duration_ms`` long"""
+        spans = self.spans()
+        by_trace: Dict[str, List[Dict[str, Any]]] = {}
+        for span in spans:
+            by_trace.setdefault(span["trace_id"], []).append(span)
+        roots = [
+            span for span in reversed(spans)
+            if span["parent_id"] is None and (span["duration_ms"] or 0) >= min_duration_ms
+        ]
+        return [
+            {"trace_id": root["trace_id"], "root": root["name"], "duration_ms": root["duration_ms"],
+             "status": root["status"], "spans": sorted(by_trace[root["trace_id"]], key=lambda s: s["started_at"])}
+            for root in roots[:limit]
+        ]
+
+
+exporter = SpanExporter()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+def start_span(name: str, trace_id: Optional[str] = None, **attributes: Any) -> Optional[Span]:
+    """Open a child of the current span (or a new root); pair with end_span"""
+    if not TRACING_ENABLED:
+        return None
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+    return Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+
+
+def end_span(
+    span: Optional[Span], error: Optional[BaseException] = None, status: Optional[str] = None
+) -> None:
+    if span is not None:
+        span.finish(error, status)
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time the enclosed block as a span and make it current for nested spans"""
+    current = start_span(name, trace_id, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(e)
+        raise
+    else:
+        current.finish()
+    finally:
+        _current_span.reset(token)
+
+
+def request_trace_id(request_id: Optional[str]) -> str:
+    """Trace ID for a request: the caller's X-Request-ID when usable, else a new one"""
+    if request_id and _REQUEST_ID_PATTERN.match(request_id):
+        return request_id
+    return uuid.uuid4().hex
+
+
+class TraceContextFilter(logging.Filter):
+    """Stamps each log record with the current trace ID for LOG_FORMAT"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+def install_log_filter() -> None:
+    """Attach the trace filter to every root handler so all loggers carry trace IDs"""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, TraceContextFilter) for f in handler.filters):
+            handler.addFilter(TraceContextFilter())
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Trace-stamped logging that keeps handlers the server (uvicorn, gunicorn, --log-config) installed
+
+    With no root handler yet, one is set up with LOG_FORMAT. Existing
+    handlers keep their formatter unless it is missing or logging's default
+    (a bare basicConfig() from an imported module), and all of them get the
+    trace filter.
+    """
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(level=level, format=LOG_FORMAT)
+    else:
+        for handler in root.handlers:
+            if handler.formatter is None or handler.formatter._fmt == logging.BASIC_FORMAT:
+                handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        if root.level == logging.WARNING:
+            # Still the library default, so nobody chose a level
+            root.setLevel(level)
+    install_log_filter()
+
+
+def instrument_engine(engine: Any) -> None:
+    """Emit a span per SQL statement via SQLAlchemy cursor events"""
+    from sqlalchemy import event  # type: ignore[import-untyped]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Only statements issued inside a traced operation; startup DDL stays out of the buffer
+        if context is not None and _current_span.get() is not None:
+            context._trace_span = start_span(
+                "db.query", statement=statement[:TRACE_SQL_CHARS], executemany=executemany
+            )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            rowcount = getattr(cursor, "rowcount", -1)
+            if rowcount is not None and rowcount >= 0:
+                span.set(rowcount=rowcount)
+            end_span(span)
+            context._trace_span = None
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            end_span(span, exception_context.original_exception)
+            context._trace_span = None